@@ -2,19 +2,66 @@
 
 This is where the pod autoscaler module run
 """
+import argparse
+import signal
 import sys
 
 from .autoscaler import AutoScaler
+from .autoscaler_enum import PROFILE
+from .metrics import MetricsServer
+from .scheduler import Scheduler
 
 if __name__ == "__main__":
+  parser = argparse.ArgumentParser(prog="autoscaler")
+  parser.add_argument(
+    "--daemon",
+    action="store_true",
+    help="keep running and scale at every TIME_SCALE_UP/TIME_SCALE_DOWN",
+  )
+  parser.add_argument(
+    "--dry-run",
+    action="store_true",
+    help="print the planned autosync, pods and database changes as json"
+    " without applying them",
+  )
+  parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="write a trace of every phase and api call of each run to"
+    " PROFILE_DIR",
+  )
+  args = parser.parse_args()
+
   autoscaler = AutoScaler()
+  autoscaler.dry_run = args.dry_run
+  if args.profile:
+    autoscaler.profiler.enable(PROFILE.TRACE.value)
+  if args.daemon:
+    # Serve the metrics on /metrics while running as a daemon
+    if autoscaler.metrics_port:
+      MetricsServer(autoscaler.metrics, autoscaler.metrics_port).start()
+    scheduler = Scheduler(
+      autoscaler,
+      interval=autoscaler.reconcile_interval,
+      watch_interval=autoscaler.config_watch_interval,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop.set())
+    try:
+      scheduler.run_forever()
+    except KeyboardInterrupt:
+      scheduler.stop.set()
+    sys.exit(0)
+
   try:
-    status: bool = autoscaler.evaluate_auto_sync()
-    if status:
-      autoscaler.priority_checking()
-    else:
-      raise Exception("Failed to enable/disable autosync")
+    plan = autoscaler.run()
+    if args.dry_run:
+      print(plan.to_json(indent=2))
   # pylint: disable=broad-except
   except Exception as exc:
     autoscaler.logger.error("Oops something went wrong: %s", repr(exc))
     sys.exit(1)  # Retry Job Task by exiting the process
+  finally:
+    # Post every buffered slack notification as one digest
+    autoscaler.slack.flush()
+    # Written again so that the textfile count the slack posts as well
+    autoscaler.write_metrics()
@@ -0,0 +1,215 @@
+"""This module contains ArgoCDClient class
+
+A single pooled keep-alive HTTP session shared by every ArgoCD api call
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .resilience import FAILED, CircuitOpenError
+from .token_cache import decode_expiry
+
+# Status codes worth retrying, the api is overloaded or restarting
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+
+class ArgoCDCircuitOpenError(
+  CircuitOpenError, requests.exceptions.ConnectionError
+):
+  """Raised instead of calling argocd while its circuit is open"""
+
+
+def classify_response(response, error):
+  """Return (retryable, retry_after) of an argocd api call"""
+  if error is not None:
+    ## Connect errors and connect timeouts never reached argocd. A read
+    ## timeout is not retried, a slow server would otherwise hold the
+    ## call for attempts times the read timeout
+    if isinstance(error, requests.exceptions.ReadTimeout):
+      return FAILED, None
+    return isinstance(error, requests.exceptions.ConnectionError), None
+  if response.status_code not in RETRYABLE_STATUS:
+    return False, None
+  try:
+    return True, float(response.headers["Retry-After"])
+  except (KeyError, ValueError):
+    return True, None
+
+
+class ArgoCDClient:
+  """
+  This class is used to send request to the ArgoCD api
+
+  Connections are kept alive in a sized pool so that each api call reuse
+  an existing TCP/TLS connection instead of opening a new one.
+  When authenticate is given, the token is renewed shortly before it
+  expires and whenever the api answer 401. authenticate(rejected) return
+  False when it only reused a cached token, which is not throttled as a
+  login attempt. When resilience is given, every call go through its
+  retries and circuit breaker
+  """
+
+  # Minimum seconds between two authentication attempts
+  min_auth_interval = 30
+
+  # (connect, read) timeout in seconds for each endpoint
+  default_timeouts = {
+    "session": (10, 30),
+    "list_applications": (10, 120),
+    "get_application": (10, 60),
+    "update_application": (10, 60),
+    "get_resource": (10, 60),
+    "managed_resources": (10, 60),
+    "patch_resource": (10, 60),
+  }
+
+  def __init__(
+    self,
+    url,
+    pool_size=10,
+    timeouts=None,
+    authenticate=None,
+    refresh_before=300,
+    resilience=None,
+  ):
+    self.url = url
+    self.resilience = resilience
+    self.authenticate = authenticate
+    self.refresh_before = refresh_before
+    self.token = None
+    self.token_expiry = None
+    self._auth_lock = threading.Lock()
+    self._last_auth_attempt = None
+    self.timeouts = dict(self.default_timeouts)
+    if timeouts is not None:
+      self.timeouts.update(timeouts)
+    self.session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
+    self.session.headers.update(
+      {
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+      }
+    )
+
+  def set_token(self, token):
+    self.token = token
+    self.token_expiry = decode_expiry(token)
+    self.session.cookies.set("argocd.token", token)
+
+  def clear_token(self):
+    ## Next api call login again, e.g. after the credentials changed
+    with self._auth_lock:
+      self.token = None
+      self.token_expiry = None
+      self._last_auth_attempt = None
+      self.session.cookies.set("argocd.token", None)
+
+  def _token_expiring(self):
+    return (
+      self.token_expiry is not None
+      and self.token_expiry - self.refresh_before <= time.time()
+    )
+
+  def _refresh_token(self, stale_token, rejected=False):
+    with self._auth_lock:
+      ## Another thread may already have renewed the token
+      if self.token != stale_token:
+        return
+      now = time.monotonic()
+      if (
+        self._last_auth_attempt is not None
+        and now - self._last_auth_attempt < self.min_auth_interval
+      ):
+        return
+      if self.authenticate(rejected) is not False:
+        self._last_auth_attempt = now
+
+  def close(self):
+    self.session.close()
+
+  def _send(self, method, endpoint, path, **kwargs):
+    def send():
+      return self.session.request(
+        method,
+        f"{self.url}{path}",
+        timeout=self.timeouts[endpoint],
+        **kwargs,
+      )
+
+    if self.resilience is None:
+      return send()
+    return self.resilience.call(endpoint, send, classify_response)
+
+  def _request(self, method, endpoint, path, **kwargs):
+    if endpoint == "session" or self.authenticate is None:
+      return self._send(method, endpoint, path, **kwargs)
+    ## Login lazily on the first call, and again before the token expire
+    if self.token is None or self._token_expiring():
+      self._refresh_token(self.token)
+    token = self.token
+    response = self._send(method, endpoint, path, **kwargs)
+    if response.status_code == 401:
+      self._refresh_token(token, rejected=True)
+      if self.token != token:
+        response = self._send(method, endpoint, path, **kwargs)
+    return response
+
+  def create_session(self, username, password):
+    return self._request(
+      "POST",
+      "session",
+      "/session",
+      json={"username": username, "password": password},
+    )
+
+  def list_applications(self, projects=None, selector=None, fields=None):
+    params = {}
+    if projects:
+      params["projects"] = projects
+    if selector:
+      params["selector"] = selector
+    if fields:
+      params["fields"] = ",".join(fields)
+    return self._request(
+      "GET", "list_applications", "/applications", params=params
+    )
+
+  def get_application(self, name):
+    return self._request("GET", "get_application", f"/applications/{name}")
+
+  def update_application(self, name, body):
+    return self._request(
+      "PUT", "update_application", f"/applications/{name}", json=body
+    )
+
+  def get_resource(self, name, params):
+    return self._request(
+      "GET", "get_resource", f"/applications/{name}/resource", params=params
+    )
+
+  def get_managed_resources(self, name, params=None, fields=None):
+    params = dict(params or {})
+    if fields:
+      params["fields"] = ",".join(fields)
+    return self._request(
+      "GET",
+      "managed_resources",
+      f"/applications/{name}/managed-resources",
+      params=params,
+    )
+
+  def patch_resource(self, name, params, payload):
+    return self._request(
+      "POST",
+      "patch_resource",
+      f"/applications/{name}/resource",
+      params=params,
+      data=payload,
+      headers={"Content-Type": "application/json"},
+    )
@@ -4,31 +4,65 @@ This class component consist of all the component required for the
 Autoscaler to run
 """
 import datetime
+import functools
 import json
 import logging
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
 import pytz
 import requests
 import yaml
-from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
+from . import aws, schema
+from .argocd_client import ArgoCDCircuitOpenError, ArgoCDClient
 from .autoscaler_enum import (
   DAY,
+  DBACTION,
   DBSCALINGCHECK,
   DBSTATUS,
   DEBUGGER,
+  DISCOVERY,
   LOGTYPE,
-  OPERATE,
+  PIPELINE,
+  PROFILE,
   STATUS,
   SYNC,
 )
+from .config_watcher import ConfigWatcher, diff_entries
+from .db_index import DBInstanceIndex
+from .db_operations import DatabaseWaiter
+from .deadline import PHASES, Deadline, parse_budgets
+from .decision import decide, decide_batch, log_type
+from .dependency import build_tiers, check_dependencies
 from .empty import Empty
+from .metrics import AutoscalerMetrics
+from .pipeline import Pipeline
+from .plan import Plan
+from .profiling import Profiler
+from .rds_inventory import RDSInventory, instance_cost
+from .resilience import (
+  CircuitBreaker,
+  CircuitOpenError,
+  Resilience,
+  ResilienceMetrics,
+  RetryPolicy,
+)
+from .sharding import Shard
 from .slack_bot import SlackBot
 from .slackbot_enum import SCALINGTYPE
-from .validator import AutoscalerValidator
+from .state_store import (
+  APPLICATION,
+  DATABASE,
+  DB_INSTANCE,
+  DEPLOYMENT,
+  StateStore,
+)
+from .token_cache import TokenCache
 
 logging.basicConfig(format="%(asctime)s - %(levelname)s: %(message)s")
 
@@ -47,27 +81,105 @@ class AutoScaler:
     "switching back to default value: %s"
   )
 
-  def __init__(self, config_name="config.yml", secret_name="secret.yml"):
+  _criteria = " because operation day is set to {d} and today is {t}"
+  _sync_details = "No manual sync needed for {s}"
+  _scale_details = "No scaling needed for {s}"
+  _db_scale_details = "No scaling needed for {n}"
+  logging_status = {
+    "sync": {
+      STATUS.MORNING.value: {
+        LOGTYPE.DEFAULT.value: _sync_details,
+        LOGTYPE.DETAILS.value: _sync_details + _criteria,
+      },
+      STATUS.NIGHT.value: {
+        LOGTYPE.DEFAULT.value: _sync_details,
+        LOGTYPE.DETAILS.value: _sync_details + _criteria,
+      },
+      STATUS.WORKING.value: "Manual sync for %s "
+      "will not run during working hour",
+    },
+    "scale": {
+      STATUS.MORNING.value: {
+        LOGTYPE.DEFAULT.value: "No scaling up "
+        "needed as replica = {r} for {n}",
+        LOGTYPE.DETAILS.value: _scale_details + _criteria,
+      },
+      STATUS.NIGHT.value: {
+        LOGTYPE.DEFAULT.value: "No scaling down "
+        "needed as replica = 0 for {n}",
+        LOGTYPE.DETAILS.value: _scale_details + _criteria,
+      },
+      STATUS.WORKING.value: "Scaling for %s "
+      "will not run during working hour",
+    },
+    "database": {
+      STATUS.MORNING.value: {
+        LOGTYPE.DEFAULT.value: "No scaling up "
+        "needed for {n} as db status = {db_st}",
+        LOGTYPE.DETAILS.value: _db_scale_details + _criteria,
+      },
+      STATUS.NIGHT.value: {
+        LOGTYPE.DEFAULT.value: "No scaling up "
+        "needed for {n} as db status = {db_st}",
+        LOGTYPE.DETAILS.value: _db_scale_details + _criteria,
+      },
+      STATUS.WORKING.value: "Database scaling for %s "
+      "will not run during working hour",
+    },
+  }
+
+  def __init__(
+    self,
+    config_name="config.yml",
+    secret_name="secret.yml",
+    rds_client_factory=None,
+  ):
     self.logger = logging.getLogger("pod-autoscaler")
     # Set name of config to config_name
     self.config_name = config_name
     # Set name of secret to secret_name
     self.secret_name = secret_name
+    # Watch config and secret for edits made while running as a daemon
+    self.config_watcher = ConfigWatcher([config_name, secret_name])
     # Load secret.yml to secret variable
     self.secret = self._open_secret()
+    # Retries, backoff and circuit breaker counters of argocd and rds
+    self.resilience_metrics = ResilienceMetrics()
+    # Prometheus metrics of the runs and api calls
+    self.metrics = AutoscalerMetrics(self.resilience_metrics)
     # Load secret to slack
 
     if "slack" in self.secret:
-      self.slack = SlackBot(self.secret)
+      self.slack = SlackBot(
+        self.secret, on_post=self.metrics.observe_slack_post
+      )
     else:
       self.slack = Empty()
     # Load config.yml to config variable
     self.config = self._open_config()
+    # Keep the loaded config, self.config only keep the reachable servers
+    self.loaded_config = self.config
     # Check for logger env existance
     logs = self._check_logger()
     # Set logger level base on env
     self.logger.setLevel(self._evaluate_logger(logs))
     self.logger.info("AutoScaler Initialize")
+    # Only keep the servers and databases of this replica shard
+    self.shard = self._get_shard()
+    self.config = self.loaded_config = self._shard_config(self.config)
+    # Write the metrics to METRICS_TEXTFILE after every run when set
+    self.metrics_textfile = self._get_metrics_textfile()
+    # Serve the metrics on METRICS_PORT in daemon mode (0 to disable)
+    self.metrics_port = self._get_number_env("METRICS_PORT", 0)
+    # Seconds between daemon runs besides the scale times (0 to disable),
+    # and between checks of config and secret for edits
+    self.reconcile_interval = self._get_number_env("RECONCILE_INTERVAL", 0)
+    self.config_watch_interval = self._get_number_env(
+      "CONFIG_WATCH_INTERVAL", 30
+    )
+    # Opt-in timing spans, cProfile and tracemalloc of every run
+    self.profiler = Profiler(self._get_profile_dir(), self._get_profile_env())
+    self.tracer = self.profiler.tracer
     # Get the timezone for day parameter (i.e. Monday, Tuesday and etc.)
     self.timezone = self._get_timezone()
     # Get the time to evaluate the scale up period (UTC only)
@@ -78,68 +190,95 @@ class AutoScaler:
     self.db_identifier = self._get_db_identifier()
     # Get argocd api
     self.url = self._get_url_env()
+    # Get number of concurrent workers used for argocd api calls
+    self.workers = self._get_workers_env()
+    # Seconds before expiry the argocd token is renewed
+    self.token_refresh_before = self._get_number_env(
+      "TOKEN_REFRESH_BEFORE", 300
+    )
+    # Shared pooled http client for every argocd api call
+    self.argocd = ArgoCDClient(
+      self.url,
+      pool_size=self.workers,
+      authenticate=self._authenticate,
+      refresh_before=self.token_refresh_before,
+      resilience=self._create_resilience("argocd", ArgoCDCircuitOpenError),
+    )
+    # File cache of the argocd token, reused across runs
+    self.token_cache = TokenCache(
+      self._get_token_cache_path(),
+      self.url,
+      self.secret["argocd"]["username"],
+      refresh_before=self.token_refresh_before,
+    )
+    # Get how application status is discovered (single or bulk)
+    self.discovery = self._get_discovery_env()
+    # Get how the plan is applied, app by app (stream) or phase by phase
+    self.pipeline = self._get_pipeline_env()
     # Get what day is today (i.e. Monday, Tuesday and etc.)
     self.today = self._get_day_env()
     # Get current time of the day (e.g. morning, night or work_hours)
     self.status = self._get_status_env()
-    # Get user session token from argocd api
-    self._get_user_session()
-    # Get aws session from Boto3
-    self._aws_session()
+    # User session token from argocd api, retrieved on the first api call.
+    # A failed login leave the cookies empty and the next 401 login again
+    self.cookies = {}
+    # Database scaling only run with an aws secret, the aws session from
+    # Boto3 is created on first use
+    self.database_enabled = "aws" in self.secret
+    self._aws_initialised = False
+    # Build the rds client from the aws secret, e.g. a fake rds client in
+    # the benchmarks
+    self.rds_client_factory = rds_client_factory or aws.create_rds_client
+    # Only build and log the plan when set, nothing is changed
+    self.dry_run = False
+    # Seconds a run may take to apply its plan (0 for no deadline), and
+    # the budget of each phase within it
+    self.run_deadline = self._get_number_env("RUN_DEADLINE", 0, cast=float)
+    self.phase_budgets = self._get_phase_budgets()
+    # Seconds before every target and app status is read live again
+    self.full_reconcile_interval = self._get_number_env(
+      "FULL_RECONCILE_INTERVAL", 86400, cast=float
+    )
+    # Last applied state of every target, targets recorded in their
+    # desired state within STATE_TTL are not read live
+    self.state_store = StateStore(
+      self._get_state_store_path(),
+      self._get_number_env("STATE_TTL", 0, cast=float),
+      self.full_reconcile_interval,
+    )
+    self._use_state_store = False
+    self._full_reconcile = True
     # Set autoscale scale as empty dict, needed for database scaling
     self.pod_autoscale_status = {}
-    # Check if all the server provided exist, and added result to config
-    self._evaluate_application_permission()
-
-    self.slack.post_fail_message_to_slack(
-      SCALINGTYPE.INIT.value, "Environment:TIMEZONE", "test"
-    )
+    self._pod_status_lock = threading.Lock()
+    # Check if all the server provided exist on first use, and added
+    # result to config
+    self._application_status_loaded = False
+    self._application_status_loaded_at = None
 
-  def _get_time_scale_down(self):
-    default_value = {"hours": 13, "minutes": 0}
-    try:
-      time_scale_down = json.loads(os.environ["TIME_SCALE_DOWN"])
-      self.logger.info("Environment variable TIME_SCALE_DOWN was found")
-      with open("time.json", "r", encoding="utf-8") as validation_rules:
-        schema = json.load(validation_rules)
-        v = AutoscalerValidator(schema)
-        if v.validate(time_scale_down, schema):
-          self.logger.debug(
-            "Validated TIME_SCALE_DOWN and no issue has been found"
-          )
-          return time_scale_down
-        else:
-          raise ValueError(v.errors)
+  def _get_time_scale(self, name, default_value):
+    try:
+      content = os.environ[name]
+      time_scale = json.loads(content)
+      self.logger.info("Environment variable %s was found", name)
+      errors = schema.validate("time", time_scale, content)
+      if errors:
+        raise ValueError(errors)
+      self.logger.debug("Validated %s and no issue has been found", name)
+      return time_scale
     except KeyError:
-      self.logger.warning(self.env_string, "TIME_SCALE_DOWN", default_value)
+      self.logger.warning(self.env_string, name, default_value)
       return default_value
     except ValueError as er:
-      self.logger.warning("Environment variable TIME_SCALE_DOWN error: %s", er)
-      self.logger.warning(self.env_string, "TIME_SCALE_DOWN", default_value)
+      self.logger.warning("Environment variable %s error: %s", name, er)
+      self.logger.warning(self.env_string, name, default_value)
       return default_value
 
+  def _get_time_scale_down(self):
+    return self._get_time_scale("TIME_SCALE_DOWN", {"hours": 13, "minutes": 0})
+
   def _get_time_scale_up(self):
-    default_value = {"hours": 1, "minutes": 0}
-    try:
-      time_scale_up = json.loads(os.environ["TIME_SCALE_UP"])
-      self.logger.info("Environment variable TIME_SCALE_UP was found")
-      with open("time.json", "r", encoding="utf-8") as validation_rules:
-        schema = json.load(validation_rules)
-        v = AutoscalerValidator(schema)
-        if v.validate(time_scale_up, schema):
-          self.logger.debug(
-            "Validated TIME_SCALE_UP and no issue has been found"
-          )
-          return time_scale_up
-        else:
-          raise ValueError(v.errors)
-    except KeyError:
-      self.logger.warning(self.env_string, "TIME_SCALE_UP", default_value)
-      return default_value
-    except ValueError as er:
-      self.logger.warning("Environment variable TIME_SCALE_UP error: %s", er)
-      self.logger.warning(self.env_string, "TIME_SCALE_UP", default_value)
-      return default_value
+    return self._get_time_scale("TIME_SCALE_UP", {"hours": 1, "minutes": 0})
 
   def _get_timezone(self) -> str:
     try:
@@ -192,24 +331,154 @@ class AutoScaler:
       self.logger.warning(self.env_string, "DAY", default_value)
       return default_value
 
+  def _get_number_env(self, name, default_value, minimum=0, cast=int):
+    try:
+      value = cast(os.environ[name])
+      self.logger.info("Environment variable %s was found", name)
+      if value < minimum:
+        raise ValueError(f"{name} should be at least {minimum}, got {value}")
+      return value
+    except KeyError:
+      self.logger.warning(self.env_string, name, default_value)
+      return default_value
+    except ValueError as er:
+      self.logger.warning("Environment variable %s error: %s", name, er)
+      self.logger.warning(self.env_string, name, default_value)
+      return default_value
+
+  def _get_phase_budgets(self):
+    try:
+      budgets = parse_budgets(os.environ["PHASE_BUDGETS"])
+      self.logger.info("Environment variable PHASE_BUDGETS was found")
+      return budgets
+    except KeyError:
+      self.logger.warning(self.env_string, "PHASE_BUDGETS", {})
+      return {}
+    except ValueError as er:
+      self.logger.warning("Environment variable PHASE_BUDGETS error: %s", er)
+      self.logger.warning(self.env_string, "PHASE_BUDGETS", {})
+      return {}
+
+  def _get_workers_env(self) -> int:
+    return self._get_number_env("WORKERS", 10, minimum=1)
+
+  def _get_discovery_env(self) -> str:
+    try:
+      discovery = DISCOVERY(os.environ["DISCOVERY"])
+      self.logger.info("Environment variable DISCOVERY was found")
+
+      return discovery.value
+    except ValueError as e:
+      self.logger.error(e)
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.INIT.value, "Environment:DISCOVERY", e
+      )
+      raise e
+    except KeyError:
+      default_value = DISCOVERY.SINGLE.value
+      self.logger.warning(self.env_string, "DISCOVERY", default_value)
+      return default_value
+
+  def _get_pipeline_env(self) -> str:
+    try:
+      pipeline = PIPELINE(os.environ["PIPELINE"])
+      self.logger.info("Environment variable PIPELINE was found")
+
+      return pipeline.value
+    except ValueError as e:
+      self.logger.error(e)
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.INIT.value, "Environment:PIPELINE", e
+      )
+      raise e
+    except KeyError:
+      default_value = PIPELINE.STREAM.value
+      self.logger.warning(self.env_string, "PIPELINE", default_value)
+      return default_value
+
+  def _get_discovery_filter(self):
+    projects = [
+      x.strip()
+      for x in os.environ.get("DISCOVERY_PROJECTS", "").split(",")
+      if x.strip()
+    ]
+    selector = os.environ.get("DISCOVERY_SELECTOR") or None
+    return projects, selector
+
+  def _get_rds_snapshot_ttl(self):
+    return self._get_number_env("RDS_SNAPSHOT_TTL", 300)
+
+  @property
+  def rds(self):
+    if not self._aws_initialised:
+      self._aws_session()
+    return self._rds
+
+  @property
+  def rds_inventory(self):
+    if not self._aws_initialised:
+      self._aws_session()
+    return self._rds_inventory
+
   def _aws_session(self):
     try:
       self.logger.info("Creating an AWS session...")
-      if "aws" in self.secret:
-        session = boto3.Session(
-          aws_access_key_id=self.secret["aws"]["aws_access_key_id"],
-          aws_secret_access_key=self.secret["aws"]["aws_secret_access_key"],
-          region_name=self.secret["aws"]["region_name"],
+      self._aws_initialised = True
+      if self.database_enabled:
+        self._rds = aws.ResilientClient(
+          self.rds_client_factory(self.secret["aws"]),
+          self._create_resilience("rds"),
+        )
+        self._rds_inventory = RDSInventory(
+          self._rds, ttl=self._get_rds_snapshot_ttl()
+        )
+        self.db_wait_timeout = self._get_number_env(
+          "DB_WAIT_TIMEOUT", 0, cast=float
+        )
+        self.db_poll_interval = self._get_number_env(
+          "DB_POLL_INTERVAL", 30, minimum=1, cast=float
         )
-        self.rds = session.client("rds")
       else:
         self.logger.info("No AWS secret found, disabling database scaling")
-        self.rds = None
-    except ClientError as error:
+        self._rds = None
+        self._rds_inventory = None
+    except aws.client_error() as error:
       message = f"Failed to create session: {error}"
       self.logger.error(json.dumps({"message": message, "severity": "ERROR"}))
       raise error
 
+  def _create_resilience(self, name, open_error=CircuitOpenError):
+    retry = RetryPolicy(
+      attempts=self._get_number_env("RETRY_ATTEMPTS", 3, minimum=1),
+      base_delay=self._get_number_env("RETRY_BACKOFF", 0.5, cast=float),
+      max_delay=self._get_number_env("RETRY_MAX_DELAY", 10, cast=float),
+    )
+    breaker = CircuitBreaker(
+      failure_threshold=self._get_number_env(
+        "BREAKER_THRESHOLD", 5, minimum=1
+      ),
+      reset_timeout=self._get_number_env(
+        "BREAKER_RESET_TIMEOUT", 30, cast=float
+      ),
+    )
+    return Resilience(
+      name,
+      retry=retry,
+      breaker=breaker,
+      metrics=self.resilience_metrics,
+      open_error=open_error,
+      observe=self._observe_api_call,
+    )
+
+  def _report_resilience(self):
+    summary = self.resilience_metrics.summary()
+    if summary:
+      self.logger.info(
+        "Retries and circuit breaker: %s, circuit state: %s",
+        json.dumps(summary, sort_keys=True),
+        json.dumps(self.resilience_metrics.states(), sort_keys=True),
+      )
+
   def _check_logger(self) -> str:
     try:
       logger = DEBUGGER(os.environ["LOGLEVEL"])
@@ -249,25 +518,130 @@ class AutoScaler:
       )
       raise ValueError(url_error)
 
+  def _get_token_cache_path(self):
+    default_value = os.path.join(
+      tempfile.gettempdir(), "argocd-autoscaler", "token.json"
+    )
+    try:
+      path = os.environ["TOKEN_CACHE"]
+      self.logger.info("Environment variable TOKEN_CACHE was found")
+      return path
+    except KeyError:
+      self.logger.warning(self.env_string, "TOKEN_CACHE", default_value)
+      return default_value
+
+  def _get_state_store_path(self):
+    default_value = os.path.join(
+      tempfile.gettempdir(), "argocd-autoscaler", "state.db"
+    )
+    try:
+      path = os.environ["STATE_STORE"]
+      self.logger.info("Environment variable STATE_STORE was found")
+      return path
+    except KeyError:
+      self.logger.warning(self.env_string, "STATE_STORE", default_value)
+      return default_value
+
+  def _get_metrics_textfile(self):
+    ## No textfile is written unless METRICS_TEXTFILE is set
+    try:
+      path = os.environ["METRICS_TEXTFILE"]
+      self.logger.info("Environment variable METRICS_TEXTFILE was found")
+      return path
+    except KeyError:
+      self.logger.warning(self.env_string, "METRICS_TEXTFILE", None)
+      return None
+
+  def _get_profile_env(self):
+    ## Comma separated PROFILE modes, 1/true only record the trace
+    try:
+      value = os.environ["PROFILE"]
+      self.logger.info("Environment variable PROFILE was found")
+      if value.strip().lower() in ("1", "true"):
+        return [PROFILE.TRACE.value]
+      return [PROFILE(x.strip()).value for x in value.split(",") if x.strip()]
+    except KeyError:
+      self.logger.warning(self.env_string, "PROFILE", None)
+      return []
+    except ValueError as er:
+      self.logger.warning("Environment variable PROFILE error: %s", er)
+      self.logger.warning(self.env_string, "PROFILE", None)
+      return []
+
+  def _get_profile_dir(self):
+    default_value = os.path.join(
+      tempfile.gettempdir(), "argocd-autoscaler", "profiles"
+    )
+    try:
+      path = os.environ["PROFILE_DIR"]
+      self.logger.info("Environment variable PROFILE_DIR was found")
+      return path
+    except KeyError:
+      self.logger.warning(self.env_string, "PROFILE_DIR", default_value)
+      return default_value
+
+  def _observe_api_call(self, api, endpoint, status, seconds):
+    self.metrics.observe_api_call(api, endpoint, status, seconds)
+    self.tracer.record(
+      endpoint, api, self.tracer.clock() - seconds, seconds, status=status
+    )
+
+  def write_metrics(self):
+    """Write the metrics to METRICS_TEXTFILE when set"""
+    if not self.metrics_textfile:
+      return
+    try:
+      self.metrics.write_textfile(self.metrics_textfile)
+    except OSError as err:
+      self.logger.warning("Failed to write metrics: %s", err)
+
+  def _get_state(self, kind, target):
+    ## Records are only trusted outside of a full reconcile
+    if not self._use_state_store:
+      return None
+    return self.state_store.get(kind, target)
+
+  def _set_token(self, token):
+    self.cookies = {"argocd.token": token}
+    self.argocd.set_token(token)
+    self.logger.info("Set argocd.token to cookies")
+
+  def _authenticate(self, rejected=False):
+    ## First api call may reuse the cached token, later ones login again.
+    ## A token rejected by argocd is dropped from the cache. Return False
+    ## when no login was attempted
+    if rejected:
+      self.token_cache.clear()
+    elif not self.cookies:
+      return self._get_user_session()
+    self._login()
+    return True
+
   def _get_user_session(self):
+    token = self.token_cache.load()
+    if token is not None:
+      self.logger.info("Reusing cached argocd token")
+      self._set_token(token)
+      return False
+    self._login()
+    return True
+
+  def _login(self):
     try:
-      data = {
-        "username": self.secret["argocd"]["username"],
-        "password": self.secret["argocd"]["password"],
-      }
       self.logger.debug("Creating data for argocd session")
-      result = requests.post(
-        f"{self.url}/session",
-        json=data,
-        headers={"Content-Type": "application/json"},
-        timeout=60,
+      result = self.argocd.create_session(
+        self.secret["argocd"]["username"],
+        self.secret["argocd"]["password"],
       )
       self.logger.debug("Getting session for argocd ....")
       if result.status_code == 200:
         self.logger.info("Successfully retrieve argocd token")
         response = result.json()
-        self.cookies = {"argocd.token": response["token"]}
-        self.logger.info("Set argocd.token to cookies")
+        self._set_token(response["token"])
+        try:
+          self.token_cache.store(response["token"])
+        except OSError as oserr:
+          self.logger.warning("Failed to cache argocd token: %s", oserr)
       else:
         self.slack.post_fail_message_to_slack(
           SCALINGTYPE.TOKEN.value, "Session Token", result.text
@@ -308,70 +682,115 @@ class AutoScaler:
 
   def _open_config(self):
     with open(self.config_name, "r", encoding="utf-8") as stream:
-      try:
-        data = yaml.safe_load(stream)
-        with open("config.json", "r", encoding="utf-8") as validation_rules:
-          schema = json.load(validation_rules)
-          v = AutoscalerValidator(schema)
-          if v.validate(data, schema):
-            self.logger.debug(
-              "Validated config.yml and no issue has been found"
-            )
-            return data
-          else:
-            raise ValueError(v.errors)
-      except ValueError as e:
+      content = stream.read()
+    try:
+      data = schema.load_yaml(content)
+      errors = schema.validate("config", data, content)
+      if errors:
+        raise ValueError(errors)
+      for server in data.get("server") or []:
+        check_dependencies(server.get("dependencies", {}))
+      self.logger.debug("Validated config.yml and no issue has been found")
+      return data
+    except ValueError as e:
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.INIT.value, "config.yaml", e
+      )
+      raise e
+    except yaml.YAMLError as yamlerr:
+      if hasattr(yamlerr, "problem_mark"):
+        pm = yamlerr.problem_mark
+        message = "Your file {} has an issue on line {} at position {}"
+        format_message = message.format(
+          self.config_name, pm.line, pm.column
+        )
         self.slack.post_fail_message_to_slack(
-          SCALINGTYPE.INIT.value, "config.yaml", e
+          SCALINGTYPE.INIT.value, "config.yaml", format_message
         )
-        raise e
-      except yaml.YAMLError as yamlerr:
-        if hasattr(yamlerr, "problem_mark"):
-          pm = yamlerr.problem_mark
-          message = "Your file {} has an issue on line {} at position {}"
-          format_message = message.format(pm.name, pm.line, pm.column)
-          self.slack.post_fail_message_to_slack(
-            SCALINGTYPE.INIT.value, "config.yaml", format_message
-          )
-          raise ValueError(format_message) from yamlerr
-        else:
-          message = "Something went wrong while parsing config.yaml file"
-          self.slack.post_fail_message_to_slack(
-            SCALINGTYPE.INIT.value, "config.yaml", message
-          )
-          raise ValueError(message) from yamlerr
+        raise ValueError(format_message) from yamlerr
+      else:
+        message = "Something went wrong while parsing config.yaml file"
+        self.slack.post_fail_message_to_slack(
+          SCALINGTYPE.INIT.value, "config.yaml", message
+        )
+        raise ValueError(message) from yamlerr
+
+  def _get_shard_env(self, name, default_value):
+    ## A wrong shard would process the whole fleet or an other shard, an
+    ## invalid value is an error rather than a fallback to the default
+    try:
+      value = int(os.environ[name])
+      self.logger.info("Environment variable %s was found", name)
+      return value
+    except ValueError as e:
+      self.logger.error(e)
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.INIT.value, f"Environment:{name}", e
+      )
+      raise e
+    except KeyError:
+      if default_value is not None:
+        self.logger.warning(self.env_string, name, default_value)
+      return default_value
+
+  def _get_shard(self):
+    count = self._get_shard_env("SHARD_COUNT", 1)
+    ## An indexed kubernetes Job give each pod its JOB_COMPLETION_INDEX
+    index = self._get_shard_env("SHARD_INDEX", None)
+    if index is None:
+      index = self._get_shard_env("JOB_COMPLETION_INDEX", 0)
+    try:
+      return Shard(index, count)
+    except ValueError as e:
+      name = "SHARD_COUNT" if count < 1 else "SHARD_INDEX"
+      self.logger.error(e)
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.INIT.value, f"Environment:{name}", e
+      )
+      raise e
+
+  def _shard_config(self, config):
+    sharded = self.shard.filter_config(config)
+    if self.shard.count > 1:
+      self.logger.info(
+        "Shard %s/%s: %s of %s server(s), %s of %s database(s)",
+        self.shard.index,
+        self.shard.count,
+        len(sharded.get("server") or []),
+        len(config.get("server") or []),
+        len(sharded.get("database") or []),
+        len(config.get("database") or []),
+      )
+    return sharded
+
+  def _load_config(self):
+    return self._shard_config(self._open_config())
 
   def _open_secret(self):
     with open(self.secret_name, "r", encoding="utf-8") as stream:
-      try:
-        data = yaml.safe_load(stream)
-        with open("secret.json", "r", encoding="utf-8") as validation_rules:
-          schema = json.load(validation_rules)
-          v = AutoscalerValidator(schema)
-          if v.validate(data, schema):
-            self.logger.debug(
-              "Validated secrets.yml and no issue has been found"
-            )
-            return data
-          else:
-            raise ValueError(v.errors)
-      except yaml.YAMLError as yamlerr:
-        if hasattr(yamlerr, "problem_mark"):
-          pm = yamlerr.problem_mark
-          message = "Your file {} has an issue on line {} at position {}"
-          raise ValueError(
-            message.format(pm.name, pm.line, pm.column)
-          ) from yamlerr
-        else:
-          raise ValueError(
-            "Something went wrong while parsing secret.yaml file"
-          ) from yamlerr
+      content = stream.read()
+    try:
+      data = schema.load_yaml(content)
+      errors = schema.validate("secret", data, content)
+      if errors:
+        raise ValueError(errors)
+      self.logger.debug("Validated secrets.yml and no issue has been found")
+      return data
+    except yaml.YAMLError as yamlerr:
+      if hasattr(yamlerr, "problem_mark"):
+        pm = yamlerr.problem_mark
+        message = "Your file {} has an issue on line {} at position {}"
+        raise ValueError(
+          message.format(self.secret_name, pm.line, pm.column)
+        ) from yamlerr
+      else:
+        raise ValueError(
+          "Something went wrong while parsing secret.yaml file"
+        ) from yamlerr
 
   def _get_application_status(self, name):
     try:
-      result = requests.get(
-        f"{self.url}/applications/{name}", cookies=self.cookies, timeout=60
-      )
+      result = self.argocd.get_application(name)
       if result.status_code == 200:
         response = result.json()
         return response
@@ -384,16 +803,38 @@ class AutoScaler:
       self.logger.error("Error occurs when getting app status: %s", reqerr)
       return False
 
+  def _list_application_status(self):
+    ## Only keep the fields needed for autosync update and pod scaling
+    fields = ["items.metadata", "items.spec", "items.status.resources"]
+    projects, selector = self._get_discovery_filter()
+    try:
+      result = self.argocd.list_applications(projects, selector, fields)
+      if result.status_code == 200:
+        response = result.json()
+        return {
+          item["metadata"]["name"]: item for item in response.get("items") or []
+        }
+      else:
+        self.slack.post_fail_message_to_slack(
+          SCALINGTYPE.SERVER.value, "applications", result.text
+        )
+        result.raise_for_status()
+    except requests.exceptions.RequestException as reqerr:
+      self.logger.error("Error occurs when listing applications: %s", reqerr)
+    return False
+
   def _update_application_status(self, name, response):
     try:
-      result = requests.put(
-        f"{self.url}/applications/{name}",
-        cookies=self.cookies,
-        json=response,
-        timeout=60,
-      )
+      result = self.argocd.update_application(name, response)
       if result.status_code == 200:
-        self.logger.debug("%s autosync for %s", self.syncing, name)
+        self._record_application(name, response)
+        syncing = (
+          SYNC.ENABLED.value
+          if "automated" in response["spec"]["syncPolicy"]
+          else SYNC.DISABLED.value
+        )
+        self.logger.debug("%s autosync for %s", syncing, name)
+        return True
       else:
         self.slack.post_fail_message_to_slack(
           SCALINGTYPE.SYNC.value, name, result.text
@@ -422,75 +863,14 @@ class AutoScaler:
   def _evaluate_sync_scale_period(
     self, server, criteria_scale_up, criteria_scale_down
   ):
-    if server["autoscaledown"] is False and criteria_scale_up:
-      return True
-    elif (
-      server["autoscaledown"]
-      and self.status == STATUS.MORNING.value
-      and (
-        self.today == DAY.SUNDAY.value
-        or (
-          server["operate_day"] == OPERATE.WEEKDAYS.value
-          and self.today == DAY.SATURDAY.value
-        )
-      )
-      and criteria_scale_down
-    ):
-      return False
-    elif (
-      server["autoscaledown"]
-      and self.status == STATUS.MORNING.value
-      and self.today != DAY.SATURDAY.value
-      and self.today != DAY.SUNDAY.value
-      and criteria_scale_up
-    ):
-      return True
-    elif (
-      server["autoscaledown"]
-      and self.status == STATUS.MORNING.value
-      and self.today != DAY.SUNDAY.value
-      and (
-        (
-          server["operate_day"] == OPERATE.WEEKEND.value
-          and self.today == DAY.SATURDAY.value
-        )
-        or (
-          server["operate_day"] == OPERATE.WEEKDAYS.value
-          and self.today != DAY.SATURDAY.value
-        )
-      )
-      and criteria_scale_up
-    ):
-      return True
-    elif (
-      server["autoscaledown"]
-      and self.status == STATUS.NIGHT.value
-      and self.today != DAY.SUNDAY.value
-      and server["operate_day"] == OPERATE.WEEKEND.value
-      and self.today != DAY.SATURDAY.value
-      and criteria_scale_up
-    ):
-      return True
-    elif (
-      server["autoscaledown"]
-      and self.status == STATUS.NIGHT.value
-      and (
-        self.today == DAY.SUNDAY.value
-        or (
-          server["operate_day"] == OPERATE.WEEKEND.value
-          and self.today == DAY.SATURDAY.value
-        )
-        or (
-          server["operate_day"] == OPERATE.WEEKDAYS.value
-          and self.today != DAY.SATURDAY.value
-          and self.today != DAY.SUNDAY.value
-        )
-      )
-      and criteria_scale_down
-    ):
-      return False
-    else:
-      return None
+    return decide(
+      self.status,
+      self.today,
+      server.get("operate_day"),
+      server["autoscaledown"],
+      criteria_scale_up,
+      criteria_scale_down,
+    )
 
   def _create_application_logging(
     self, server, runner, deployment=None, replicas=0
@@ -501,73 +881,10 @@ class AutoScaler:
       val = deployment
       if "db_status" not in val:
         val["db_status"] = ""
-    criteria = " because operation day is set to {d} and today is {t}"
-    sync_details: str = "No manual sync needed for {s}"
-    scale_details: str = "No scaling needed for {s}"
-    db_scale_details: str = "No scaling needed for {n}"
-    logging_status = {
-      "sync": {
-        STATUS.MORNING.value: {
-          LOGTYPE.DEFAULT.value: sync_details,
-          LOGTYPE.DETAILS.value: sync_details + criteria,
-        },
-        STATUS.NIGHT.value: {
-          LOGTYPE.DEFAULT.value: sync_details,
-          LOGTYPE.DETAILS.value: sync_details + criteria,
-        },
-        STATUS.WORKING.value: "Manual sync for %s "
-        "will not run during working hour",
-      },
-      "scale": {
-        STATUS.MORNING.value: {
-          LOGTYPE.DEFAULT.value: "No scaling up "
-          "needed as replica = {r} for {n}",
-          LOGTYPE.DETAILS.value: scale_details + criteria,
-        },
-        STATUS.NIGHT.value: {
-          LOGTYPE.DEFAULT.value: "No scaling down "
-          "needed as replica = 0 for {n}",
-          LOGTYPE.DETAILS.value: scale_details + criteria,
-        },
-        STATUS.WORKING.value: "Scaling for %s "
-        "will not run during working hour",
-      },
-      "database": {
-        STATUS.MORNING.value: {
-          LOGTYPE.DEFAULT.value: "No scaling up "
-          "needed for {n} as db status = {db_st}",
-          LOGTYPE.DETAILS.value: db_scale_details + criteria,
-        },
-        STATUS.NIGHT.value: {
-          LOGTYPE.DEFAULT.value: "No scaling up "
-          "needed for {n} as db status = {db_st}",
-          LOGTYPE.DETAILS.value: db_scale_details + criteria,
-        },
-        STATUS.WORKING.value: "Database scaling for %s "
-        "will not run during working hour",
-      },
-    }
 
     current_time = self.status
-    type_of_logs = LOGTYPE.DEFAULT.value
-    if self.status == STATUS.MORNING.value:
-      if (
-        server["operate_day"] == OPERATE.WEEKDAYS.value
-        and (self.today in (DAY.SATURDAY.value, DAY.SUNDAY.value))
-      ) or (
-        server["operate_day"] == OPERATE.WEEKEND.value
-        and self.today == DAY.SUNDAY.value
-      ):
-        type_of_logs = LOGTYPE.DETAILS.value
-    elif self.status == STATUS.NIGHT.value:
-      if (
-        server["operate_day"] == OPERATE.WEEKEND.value
-        and self.today != DAY.SATURDAY.value
-      ) or (
-        server["operate_day"] == OPERATE.WEEKDAYS.value
-        and self.today == DAY.SUNDAY.value
-      ):
-        type_of_logs = LOGTYPE.DETAILS.value
+    type_of_logs = log_type(self.status, self.today, server.get("operate_day"))
+    logging_status = self.logging_status
 
     if current_time == STATUS.WORKING.value:
       messages: str = f"{logging_status[runner][current_time]}"
@@ -577,7 +894,7 @@ class AutoScaler:
       self.logger.debug(
         messages.format(
           s=server["name"],
-          d=server["operate_day"],
+          d=server.get("operate_day"),
           r=replicas,
           t=self.today,
           n=val["name"],
@@ -585,64 +902,359 @@ class AutoScaler:
         )
       )
 
-  def _evaluate_application_permission(self):
-    new_config_file = {"server": []}
-    for server in self.config["server"]:
-      response = self._get_application_status(server["name"])
-      if response is False:
+  def _map_concurrently(self, fn, items, thread_name_prefix):
+    ## Run fn over items on the worker pool, results keep the items order
+    items = list(items)
+    if not items:
+      return []
+    with ThreadPoolExecutor(
+      max_workers=min(self.workers, len(items)),
+      thread_name_prefix=thread_name_prefix,
+    ) as executor:
+      return list(executor.map(fn, items))
+
+  def _map_within_deadline(self, fn, items, thread_name_prefix, deadline):
+    ## Like _map_concurrently, items not started before the deadline are
+    ## left untouched and returned as deferred, in the items order
+    if deadline is None:
+      return self._map_concurrently(fn, items, thread_name_prefix), []
+    deferred = object()
+
+    def run(item):
+      if deadline.expired():
+        return deferred
+      return fn(item)
+
+    items = list(items)
+    results = self._map_concurrently(run, items, thread_name_prefix)
+    return (
+      [result for result in results if result is not deferred],
+      [item for item, result in zip(items, results) if result is deferred],
+    )
+
+  def _prefetch_application_status(self, servers):
+    ## Fetch every application status concurrently, map keeps config order
+    names = [server["name"] for server in servers]
+    return self._map_concurrently(
+      self._get_application_status, names, "argocd-prefetch"
+    )
+
+  def _discover_application_status(self, servers):
+    applications = self._list_application_status()
+    if applications is False:
+      self.logger.warning("Bulk discovery failed, fetching apps one by one")
+      return self._prefetch_application_status(servers)
+    responses = [applications.get(server["name"]) for server in servers]
+    ## Apps missing from the listing go through the per app lookup so that
+    ## the failure is reported the same way as in single discovery
+    missing = [
+      server for server, response in zip(servers, responses) if response is None
+    ]
+    if missing:
+      self.logger.debug(
+        "%s application(s) not found in bulk listing", len(missing)
+      )
+      fetched = iter(self._prefetch_application_status(missing))
+      responses = [
+        next(fetched) if response is None else response
+        for response in responses
+      ]
+    return responses
+
+  def _record_application(self, name, response):
+    ## Keep what is needed to decide the app without reading it live
+    try:
+      resources = response.get("status", {}).get("resources") or []
+      self.state_store.put(
+        APPLICATION,
+        name,
+        {
+          "automated": "automated" in response["spec"]["syncPolicy"],
+          "deployments": [x for x in resources if x["kind"] == "Deployment"],
+        },
+      )
+    except (AttributeError, KeyError, TypeError):
+      pass
+
+  def _deployment_target(self, name, deployment):
+    return f"{name}/{deployment.get('namespace')}/{deployment['name']}"
+
+  def _get_recorded_replicas(self, name, deployment_list):
+    ## Live replicas from the store, None unless every deployment is known
+    replicas = {}
+    for deployment in deployment_list:
+      value = self._get_state(
+        DEPLOYMENT, self._deployment_target(name, deployment)
+      )
+      if value is None:
+        return None
+      replicas[(deployment.get("namespace"), deployment["name"])] = value
+    return replicas
+
+  def _get_settled_application_status(self, server):
+    ## Application status rebuilt from the store, only when neither the
+    ## autosync nor any deployment of the app need to change. It only has
+    ## what the plan read and is never sent back to argocd
+    record = self._get_state(APPLICATION, server["name"])
+    if record is None:
+      return None
+    automated = record["automated"]
+    if (
+      self._evaluate_sync_scale_period(server, not automated, automated)
+      is not None
+    ):
+      return None
+    replicas = self._get_recorded_replicas(
+      server["name"], record["deployments"]
+    )
+    if replicas is None:
+      return None
+    for value in replicas.values():
+      if (
+        self._evaluate_sync_scale_period(server, value == 0, value > 0)
+        is not None
+      ):
+        return None
+    return {
+      "spec": {
+        "syncPolicy": {"automated": {"prune": False, "selfHeal": False}}
+        if automated
+        else {}
+      },
+      "status": {"resources": record["deployments"]},
+    }
+
+  def _fetch_application_status(self, servers, discovery=None):
+    ## Attach the application status, unreachable servers are left out
+    settled = {}
+    for server in servers:
+      response = self._get_settled_application_status(server)
+      if response is not None:
+        settled[server["name"]] = response
+    live = [server for server in servers if server["name"] not in settled]
+    if not live:
+      responses = []
+    elif (discovery or self.discovery) == DISCOVERY.BULK.value:
+      responses = self._discover_application_status(live)
+    else:
+      responses = self._prefetch_application_status(live)
+    for server, response in zip(live, responses):
+      if response is not False and response is not None:
+        self._record_application(server["name"], response)
+        settled[server["name"]] = response
+    reachable = []
+    for server in servers:
+      if server["name"] not in settled:
         continue
       else:
-        server["application_status"] = response
-        new_config_file["server"].append(server)
-    if "database" in self.config:
-      new_config_file["database"] = self.config["database"]
+        server["application_status"] = settled[server["name"]]
+        reachable.append(server)
+    return reachable
+
+  def _evaluate_application_permission(self):
+    new_config_file = {
+      "server": self._fetch_application_status(
+        self.loaded_config.get("server", [])
+      )
+    }
+    if "database" in self.loaded_config:
+      new_config_file["database"] = self.loaded_config["database"]
     self.config = new_config_file
+    self._application_status_loaded = True
+    self._application_status_loaded_at = time.monotonic()
+
+  def _fetch_unreachable_applications(self):
+    ## Apps that could not be fetched are tried again on every pass
+    reachable = {server["name"]: server for server in self.config["server"]}
+    servers = self.loaded_config.get("server") or []
+    missing = [x for x in servers if x["name"] not in reachable]
+    if not missing:
+      return
+    for server in self._fetch_application_status(
+      missing, DISCOVERY.SINGLE.value
+    ):
+      reachable[server["name"]] = server
+    self.config = dict(
+      self.config,
+      server=[reachable[x["name"]] for x in servers if x["name"] in reachable],
+    )
 
-  def evaluate_auto_sync(self):
+  def _apply_config_changes(self, config):
+    ## Only added or changed servers are evaluated, removed ones dropped
+    servers = config.get("server") or []
+    changed, removed = diff_entries(
+      self.loaded_config.get("server") or [], servers
+    )
+    self.logger.info(
+      "Config reloaded: %s server(s) added or changed, %s removed",
+      len(changed),
+      len(removed),
+    )
+    self.loaded_config = config
+    if not self._application_status_loaded:
+      self.config = config
+      return
+    reachable = {
+      server["name"]: server
+      for server in self.config["server"]
+      if server["name"] not in removed
+    }
+    for server in changed:
+      reachable.pop(server["name"], None)
+    for server in self._fetch_application_status(
+      changed, DISCOVERY.SINGLE.value
+    ):
+      reachable[server["name"]] = server
+    new_config_file = {
+      "server": [
+        reachable[server["name"]]
+        for server in servers
+        if server["name"] in reachable
+      ]
+    }
+    if "database" in config:
+      new_config_file["database"] = config["database"]
+    self.config = new_config_file
+    with self._pod_status_lock:
+      for name in removed:
+        self.pod_autoscale_status.pop(name, None)
+
+  def _apply_secret_changes(self, secret):
+    old_secret, self.secret = self.secret, secret
+    if old_secret.get("slack") != secret.get("slack"):
+      ## Post what the old bot buffered and stop its sender
+      self.slack.close()
+      self.slack = (
+        SlackBot(secret, on_post=self.metrics.observe_slack_post)
+        if "slack" in secret
+        else Empty()
+      )
+    if old_secret["argocd"] != secret["argocd"]:
+      self.logger.info("Argocd credentials changed, login again")
+      self.token_cache = TokenCache(
+        self._get_token_cache_path(),
+        self.url,
+        secret["argocd"]["username"],
+        refresh_before=self.token_refresh_before,
+      )
+      self.cookies = {}
+      self.argocd.clear_token()
+    if old_secret.get("aws") != secret.get("aws"):
+      ## The aws session is created again on next use
+      self.database_enabled = "aws" in secret
+      self._aws_initialised = False
+
+  def reload_config(self):
+    """Apply the edits of config and secret, return True when reloaded"""
+    reloaded = False
+    for name, load, apply in (
+      (self.secret_name, self._open_secret, self._apply_secret_changes),
+      (self.config_name, self._load_config, self._apply_config_changes),
+    ):
+      if name not in self.config_watcher.changed(name):
+        continue
+      self.logger.info("%s changed, reloading", name)
+      try:
+        apply(load())
+        reloaded = True
+      except (OSError, ValueError) as err:
+        ## Keep running with the last valid file until the next edit
+        self.logger.error("Failed to reload %s: %s", name, err)
+    return reloaded
+
+  def _ensure_application_status(self):
+    if not self._application_status_loaded:
+      with self.tracer.span("application_status"):
+        self._evaluate_application_permission()
+
+  def _plan_auto_sync(self, plan):
     try:
-      for server in self.config["server"]:
-        response = server["application_status"]
-        if response is False:
-          continue
-
-        criteria_scale_up = "automated" not in response["spec"]["syncPolicy"]
-        criteria_scale_down = "automated" in response["spec"]["syncPolicy"]
-
-        check_list = self._evaluate_sync_scale_period(
-          server, criteria_scale_up, criteria_scale_down
-        )
+      servers = [
+        server
+        for server in self.config["server"]
+        if server["application_status"] is not False
+      ]
+      criteria = [
+        "automated" not in server["application_status"]["spec"]["syncPolicy"]
+        for server in servers
+      ]
+      ## Every app share the same status and day, so the decision table
+      ## of that status and day is only looked up once
+      decisions = decide_batch(
+        self.status,
+        self.today,
+        [
+          (server.get("operate_day"), server["autoscaledown"], up, not up)
+          for server, up in zip(servers, criteria)
+        ],
+      )
+      for server, criteria_scale_up, check_list in zip(
+        servers, criteria, decisions
+      ):
+        criteria_scale_down = not criteria_scale_up
 
         if check_list:
-          response = self._enable_auto_sync(response)
+          plan.add_autosync(server["name"], SYNC.ENABLED.value)
         elif check_list is False:
-          response = self._disable_auto_sync(response)
+          plan.add_autosync(server["name"], SYNC.DISABLED.value)
         else:
           if server["autoscaledown"] is False and criteria_scale_down:
             self.logger.debug("No manual sync needed for %s", server["name"])
           else:
             self._create_application_logging(server, "sync")
-          continue
-        self._update_application_status(server["name"], response)
       return True
     except TypeError as typeerr:
       self.logger.error("TypeError: %s", typeerr)
 
+  def _apply_auto_sync_entry(self, servers, entry):
+    server = servers.get(entry["app"])
+    if server is None or server["application_status"] is False:
+      self.logger.warning("No application status for %s", entry["app"])
+      return
+    ## The cached status may be rebuilt from the state store or hours old,
+    ## the PUT replace the whole Application so it is read live first
+    response = self._get_application_status(entry["app"])
+    if response is False or response is None:
+      self.logger.warning("No live application for %s", entry["app"])
+      return
+    if entry["action"] == SYNC.ENABLED.value:
+      response = self._enable_auto_sync(response)
+    else:
+      response = self._disable_auto_sync(response)
+    if self._update_application_status(entry["app"], response):
+      server["application_status"] = response
+
+  def _apply_auto_sync(self, plan, deadline=None):
+    ## Return the entries deferred by the deadline
+    servers = {server["name"]: server for server in self.config["server"]}
+    _, deferred = self._map_within_deadline(
+      functools.partial(self._apply_auto_sync_entry, servers),
+      plan.autosync,
+      "argocd-autosync",
+      deadline,
+    )
+    return deferred
+
+  def evaluate_auto_sync(self):
+    self._ensure_application_status()
+    plan = Plan(self.status, self.today)
+    if self._plan_auto_sync(plan):
+      self._apply_auto_sync(plan)
+      return True
+
   def _scale_deployment_pod(self, name, params, payload):
     try:
-      update_replica = requests.post(
-        f"{self.url}/applications/{name}/resource",
-        cookies=self.cookies,
-        params=params,
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        timeout=60,
-      )
+      update_replica = self.argocd.patch_resource(name, params, payload)
       if update_replica.status_code == 200:
-        self.pod_autoscale_status[name] = DBSCALINGCHECK.SUCCESS.value
+        ## A failed deployment keeps the app marked as failed
+        with self._pod_status_lock:
+          if self.pod_autoscale_status.get(name) != DBSCALINGCHECK.FAIL.value:
+            self.pod_autoscale_status[name] = DBSCALINGCHECK.SUCCESS.value
         self.logger.info("Scaling is successful for %s", name)
-        pass
+        return True
       else:
-        self.pod_autoscale_status[name] = DBSCALINGCHECK.FAIL.value
+        with self._pod_status_lock:
+          self.pod_autoscale_status[name] = DBSCALINGCHECK.FAIL.value
         self.slack.post_fail_message_to_slack(
           SCALINGTYPE.SERVER.value, name, update_replica.text
         )
@@ -664,12 +1276,7 @@ class AutoScaler:
 
   def _get_application_resources(self, name, params, deployment):
     try:
-      result = requests.get(
-        f"{self.url}/applications/{name}/resource",
-        cookies=self.cookies,
-        params=params,
-        timeout=60,
-      )
+      result = self.argocd.get_resource(name, params)
       if result.status_code == 200:
         response = result.json()
         return response
@@ -682,14 +1289,50 @@ class AutoScaler:
       self.logger.error("Error occurs when getting app resources: %s", reqerr)
       return False
 
-  def _prepare_params_for_scaling(self, response, params, deployment):
-    jsonify = json.loads(response["manifest"])
-    self.replicas = jsonify["spec"]["replicas"]
+  def _get_deployment_replicas(self, name):
+    ## Read live replicas of every deployment of an app in a single call
+    fields = ["items.kind", "items.namespace", "items.name", "items.liveState"]
+    try:
+      result = self.argocd.get_managed_resources(
+        name, {"kind": "Deployment", "group": "apps"}, fields
+      )
+      if result.status_code == 200:
+        replicas = {}
+        for item in result.json().get("items") or []:
+          if item.get("kind") != "Deployment" or not item.get("liveState"):
+            continue
+          live_state = json.loads(item["liveState"])
+          if not live_state:
+            continue
+          key = (item.get("namespace"), item["name"])
+          replicas[key] = live_state.get("spec", {}).get("replicas", 1)
+        return replicas
+      else:
+        self.logger.debug(
+          "Managed resources not available for %s: %s",
+          name,
+          result.status_code,
+        )
+    except (requests.exceptions.RequestException, ValueError) as reqerr:
+      message = "Error occurs when getting managed resources: %s"
+      self.logger.error(message, reqerr)
+    return False
+
+  def _set_patch_params(self, params, deployment):
     params["version"] = deployment["version"]
     params["patchType"] = "application/merge-patch+json"
 
     return params
 
+  def _read_manifest_replicas(self, response):
+    jsonify = json.loads(response["manifest"])
+    return jsonify["spec"]["replicas"]
+
+  def _prepare_params_for_scaling(self, response, params, deployment):
+    self.replicas = self._read_manifest_replicas(response)
+
+    return self._set_patch_params(params, deployment)
+
   def _sort_scaling_down(self, server):
     if "sidekiq" in server["name"]:
       return 0
@@ -708,12 +1351,8 @@ class AutoScaler:
 
   def _check_db_status(self, db_instance):
     try:
-      response = self.rds.describe_db_instances(
-        DBInstanceIdentifier=db_instance
-      )
-      db_status = response["DBInstances"][0]["DBInstanceStatus"]
-      return db_status
-    except ClientError as e:
+      return self.rds_inventory.get_status(db_instance)
+    except (aws.client_error(), CircuitOpenError) as e:
       self.logger.error(e)
 
   def _stop_database(self, db_instance, staging_name):
@@ -721,10 +1360,13 @@ class AutoScaler:
     if db_status == DBSTATUS.AVAILABLE.value:
       try:
         self.rds.stop_db_instance(DBInstanceIdentifier=db_instance)
+        self.rds_inventory.mark_changed(db_instance)
+        self.state_store.put(DB_INSTANCE, db_instance, DBSTATUS.STOPPED.value)
         self.logger.info(
           "%s: Success in stopping" " database instance", db_instance
         )
-      except ClientError as e:
+        return True
+      except (aws.client_error(), CircuitOpenError) as e:
         self.logger.error(e)
     elif db_status == DBSTATUS.STOPPED.value:
       message = (
@@ -747,10 +1389,15 @@ class AutoScaler:
     if db_status == DBSTATUS.STOPPED.value:
       try:
         self.rds.start_db_instance(DBInstanceIdentifier=db_instance)
+        self.rds_inventory.mark_changed(db_instance)
+        self.state_store.put(
+          DB_INSTANCE, db_instance, DBSTATUS.AVAILABLE.value
+        )
         self.logger.info(
           "%s: Success in starting" " database instance", db_instance
         )
-      except ClientError as e:
+        return True
+      except (aws.client_error(), CircuitOpenError) as e:
         self.logger.error(e)
     elif db_status == DBSTATUS.AVAILABLE.value:
       message = (
@@ -769,41 +1416,25 @@ class AutoScaler:
       )
 
   def _get_db_name_list(self):
-    response = self.rds.describe_db_instances()
-    return response
+    return self.rds_inventory.snapshot()
+
+  def _get_db_index(self, db_list):
+    ## Build the index once for every inventory snapshot
+    if getattr(self, "_db_index_source", None) is not db_list:
+      self._db_index = DBInstanceIndex.from_db_list(db_list, self.db_identifier)
+      self._db_index_source = db_list
+    return self._db_index
 
   def _get_db_instance_name(self, staging_server_name, db_list, custom=False):
     key = staging_server_name
     if custom is False:
       key = staging_server_name.replace(".", "-")
-    db_identifier = [
-      x["DBInstanceIdentifier"]
-      for x in db_list["DBInstances"]
-      if key in x["DBInstanceIdentifier"]
-    ]
-    if len(db_identifier) == 1:
+    db_identifier = self._get_db_index(db_list).resolve(key)
+    if db_identifier is not None:
       self.logger.info(
-        "Database exists," " database identifier: %s", db_identifier[0]
+        "Database exists," " database identifier: %s", db_identifier
       )
-      return db_identifier[0]
-    elif len(db_identifier) > 1:
-      exact_identifier = [x for x in db_identifier if x == key]
-      if len(exact_identifier) == 1:
-        self.logger.info(
-          "Database exists," " database identifier: %s", exact_identifier[0]
-        )
-        return exact_identifier[0]
-      else:
-        v1_identifier = [
-          x for x in db_identifier if x == f"{key}{self.db_identifier}"
-        ]
-        if len(v1_identifier) == 1:
-          self.logger.info(
-            "Database exists," " database identifier: %s", v1_identifier[0]
-          )
-          return v1_identifier[0]
-      self.logger.debug("Database instance not found in AWS")
-      return None
+      return db_identifier
     else:
       self.logger.debug("Database instance not found in AWS")
       return None
@@ -813,15 +1444,101 @@ class AutoScaler:
     payload = json.dumps('{"spec":{"replicas":1}}')
     return payload
 
-  def _scale_down_pods(self, params):
+  def _scale_down_pods(self, params, replicas):
     self.logger.debug(
-      "Scaling down replicas from %s to 0 for %s", self.replicas, params["name"]
+      "Scaling down replicas from %s to 0 for %s", replicas, params["name"]
     )
     payload = json.dumps('{"spec":{"replicas":0}}')
     return payload
 
-  def _evaluate_pods_scaling(self):
+  def _default_scaling_tier(self, deployment, scale_up):
+    ## sidekiq and staging heuristics, everything else scale together
+    if scale_up:
+      return min(self._sort_scaling_up(deployment), 2)
+    return min(self._sort_scaling_down(deployment), 2)
+
+  def _get_scaling_tiers(self, server, deployment_list):
+    if (
+      server["autoscaledown"] and self.status == STATUS.MORNING.value
+    ) or (server["autoscaledown"] is False):
+      scale_up = True
+    elif server["autoscaledown"] and self.status == STATUS.NIGHT.value:
+      scale_up = False
+    else:
+      return [deployment_list]
+
+    if "dependencies" in server:
+      ## Dependencies are by name, deployments sharing a name in several
+      ## namespaces go in the same tier
+      by_name = {}
+      for deployment in deployment_list:
+        by_name.setdefault(deployment["name"], []).append(deployment)
+      tiers = [
+        [x for name in tier for x in by_name[name]]
+        for tier in build_tiers(by_name, server["dependencies"])
+      ]
+      ## Dependents are scaled down before what they depend on
+      return tiers if scale_up else tiers[::-1]
+
+    grouped = {}
+    for deployment in deployment_list:
+      tier = self._default_scaling_tier(deployment, scale_up)
+      grouped.setdefault(tier, []).append(deployment)
+    return [grouped[tier] for tier in sorted(grouped)]
+
+  def _plan_deployment(self, server, deployment, live_replicas):
+    ## Return (params, replicas, target replicas), None when not scaled
+    self.logger.debug("Scaling resource for %s", deployment["name"])
+    params = self._create_deployment_params(deployment)
+    key = (deployment.get("namespace"), deployment["name"])
+    if key in live_replicas:
+      replicas = live_replicas[key]
+    else:
+      ## Fallback to reading the deployment manifest one by one
+      application_resources = self._get_application_resources(
+        server["name"], params, deployment["name"]
+      )
+      if application_resources is False:
+        return None
+      replicas = self._read_manifest_replicas(application_resources)
+      self.state_store.put(
+        DEPLOYMENT,
+        self._deployment_target(server["name"], deployment),
+        replicas,
+      )
+    params = self._set_patch_params(params, deployment)
+
+    criteria_scale_up = replicas == 0
+
+    criteria_scale_down = replicas > 0
+
+    check_list = self._evaluate_sync_scale_period(
+      server, criteria_scale_up, criteria_scale_down
+    )
+
+    if check_list:
+      return params, replicas, 1
+    elif check_list is False:
+      return params, replicas, 0
+    else:
+      if server["autoscaledown"] is False and criteria_scale_down:
+        self.logger.debug(
+          "No scaling up needed as replica = %s for %s",
+          replicas,
+          deployment["name"],
+        )
+      else:
+        self._create_application_logging(
+          server,
+          "scale",
+          deployment,
+          replicas,
+        )
+      return None
+
+  def _plan_pods_scaling(self, plan):
     try:
+      servers = []
       for server in self.config["server"]:
         self.logger.debug("Running scaling for %s", server["name"])
 
@@ -839,62 +1556,95 @@ class AutoScaler:
             response["status"]["resources"],
           )
         )
+        if get_server_deployment_list:
+          servers.append((server, get_server_deployment_list))
 
-        ## Sort deployment order
-        if (
-          server["autoscaledown"] and self.status == STATUS.MORNING.value
-        ) or (server["autoscaledown"] is False):
-          get_server_deployment_list.sort(key=self._sort_scaling_up)
-        elif server["autoscaledown"] and self.status == STATUS.NIGHT.value:
-          get_server_deployment_list.sort(key=self._sort_scaling_down)
-
-        for deployment in get_server_deployment_list:
-          self.logger.debug("Scaling resource for %s", deployment["name"])
-          params = self._create_deployment_params(deployment)
-          application_resources = self._get_application_resources(
-            server["name"], params, deployment["name"]
-          )
-          if application_resources is False:
-            continue
-          params = self._prepare_params_for_scaling(
-            application_resources, params, deployment
-          )
-
-          criteria_scale_up = self.replicas == 0
-
-          criteria_scale_down = self.replicas > 0
+      ## Live replicas for every deployment, empty when not available
+      live_replicas = self._map_concurrently(
+        lambda x: self._read_replicas(*x), servers, "argocd-planning"
+      )
 
-          check_list = self._evaluate_sync_scale_period(
-            server, criteria_scale_up, criteria_scale_down
-          )
+      targets = []
+      for (server, deployment_list), live in zip(servers, live_replicas):
+        ## Deployments in a tier are scaled together, tier by tier
+        for tier, deployments in enumerate(
+          self._get_scaling_tiers(server, deployment_list)
+        ):
+          for deployment in deployments:
+            targets.append((server, tier, deployment, live))
 
-          if check_list:
-            payload = self._scale_up_pods(params)
-          elif check_list is False:
-            payload = self._scale_down_pods(params)
-          else:
-            if server["autoscaledown"] is False and criteria_scale_down:
-              self.logger.debug(
-                "No scaling up needed as replica = %s for %s",
-                self.replicas,
-                deployment["name"],
-              )
-            else:
-              self._create_application_logging(
-                server,
-                "scale",
-                deployment,
-                self.replicas,
-              )
-            continue
-          self._scale_deployment_pod(server["name"], params, payload)
+      planned = self._map_concurrently(
+        lambda x: self._plan_deployment(x[0], x[2], x[3]),
+        targets,
+        "argocd-planning",
+      )
+      for (server, tier, _, _), result in zip(targets, planned):
+        if result is not None:
+          params, replicas, target = result
+          plan.add_deployment(server["name"], tier, params, replicas, target)
       return True
     except TypeError as typeerr:
       self.logger.error("TypeError: %s", typeerr)
 
-  def _scale_database_instance(self):
+  def _read_replicas(self, server, deployment_list):
+    replicas = self._get_recorded_replicas(server["name"], deployment_list)
+    if replicas is not None:
+      return replicas
+    replicas = self._get_deployment_replicas(server["name"]) or {}
+    for deployment in deployment_list:
+      key = (deployment.get("namespace"), deployment["name"])
+      if key in replicas:
+        self.state_store.put(
+          DEPLOYMENT,
+          self._deployment_target(server["name"], deployment),
+          replicas[key],
+        )
+    return replicas
+
+  def _apply_deployment(self, entry):
+    params = entry["params"]
+    if entry["target"]:
+      payload = self._scale_up_pods(params)
+    else:
+      payload = self._scale_down_pods(params, entry["replicas"])
+    if self._scale_deployment_pod(entry["app"], params, payload):
+      self.metrics.deployments_scaled.inc(
+        direction="up" if entry["target"] else "down"
+      )
+      self.state_store.put(
+        DEPLOYMENT,
+        self._deployment_target(entry["app"], params),
+        entry["target"],
+      )
+
+  def _apply_pods_scaling(self, plan, deadline=None, deferred_apps=()):
+    ## Same tier of every app is patched at once, dependencies within an
+    ## app are kept by patching tier after tier. Once an app has a
+    ## deferred entry, its next tiers are deferred too
+    deferred_apps = set(deferred_apps)
+    deferred = []
+    for tier in plan.deployment_tiers():
+      deferred.extend(x for x in tier if x["app"] in deferred_apps)
+      tier = [x for x in tier if x["app"] not in deferred_apps]
+      if plan.status == STATUS.NIGHT.value:
+        ## Largest deployments first, they save the most once scaled down
+        tier.sort(key=lambda x: x["replicas"], reverse=True)
+      _, late = self._map_within_deadline(
+        self._apply_deployment, tier, "argocd-scaling", deadline
+      )
+      deferred_apps.update(x["app"] for x in late)
+      deferred.extend(late)
+    return deferred
+
+  def _evaluate_pods_scaling(self):
+    self._ensure_application_status()
+    plan = Plan(self.status, self.today)
+    if self._plan_pods_scaling(plan):
+      self._apply_pods_scaling(plan)
+      return True
+
+  def _plan_database_scaling(self, plan):
     try:
-      db_instance_list = self._get_db_name_list()
       new_config = {"server": {}}
       if "database" in self.config:
         new_config["server"] = self.config["server"] + self.config["database"]
@@ -904,29 +1654,14 @@ class AutoScaler:
         argo_app_name = server["name"]
         self.logger.info("Beginning database scaling for %s", argo_app_name)
 
-        if (
-          argo_app_name in self.pod_autoscale_status
-          and self.pod_autoscale_status[argo_app_name]
-          == DBSCALINGCHECK.FAIL.value
-        ):
-          self.logger.debug(
-            "Skipping database scaling for %s as pod"
-            " autoscaling failed for this server",
-            argo_app_name,
-          )
-          continue
-
         custom = False
         if "database" in server:
           argo_app_name = server["database"]
           custom = True
 
-        db_instance = self._get_db_instance_name(
-          argo_app_name, db_instance_list, custom
-        )
+        db_instance, db_status = self._resolve_database(argo_app_name, custom)
 
         if db_instance is not None:
-          db_status = self._check_db_status(db_instance)
           criteria_scale_up = db_status == DBSTATUS.STOPPED.value
           criteria_scale_down = db_status == DBSTATUS.AVAILABLE.value
 
@@ -936,12 +1671,24 @@ class AutoScaler:
 
           if check_list:
             self.logger.info("%s: Starting database instance", db_instance)
-            self._start_database(db_instance, argo_app_name)
+            plan.add_database(
+              server["name"],
+              db_instance,
+              argo_app_name,
+              DBACTION.START.value,
+              DBSTATUS.AVAILABLE.value,
+            )
           elif check_list is False:
             self.logger.info(
               "%s: Proceeding with database shutdown", db_instance
             )
-            self._stop_database(db_instance, argo_app_name)
+            plan.add_database(
+              server["name"],
+              db_instance,
+              argo_app_name,
+              DBACTION.STOP.value,
+              DBSTATUS.STOPPED.value,
+            )
           else:
             if server["autoscaledown"] is False and criteria_scale_down:
               self.logger.debug(
@@ -971,12 +1718,464 @@ class AutoScaler:
         SCALINGTYPE.DATABASE.value, argo_app_name, typeerr
       )
 
+  def _resolve_database(self, argo_app_name, custom):
+    ## Return (db_instance, db_status), the inventory is only read when
+    ## the instance or its status is not in the store
+    record = self._get_state(DATABASE, argo_app_name)
+    if record is not None and record["custom"] == custom:
+      db_status = self._get_state(DB_INSTANCE, record["instance"])
+      if db_status is not None:
+        return record["instance"], db_status
+    db_instance = self._get_db_instance_name(
+      argo_app_name, self._get_db_name_list(), custom
+    )
+    if db_instance is None:
+      return None, None
+    db_status = self._check_db_status(db_instance)
+    self.state_store.put(
+      DATABASE, argo_app_name, {"custom": custom, "instance": db_instance}
+    )
+    if db_status is not None:
+      self.state_store.put(DB_INSTANCE, db_instance, db_status)
+    return db_instance, db_status
+
+  def _database_cost(self, db_instance):
+    try:
+      return instance_cost(self.rds_inventory.get_instance(db_instance))
+    except (aws.client_error(), CircuitOpenError, IndexError, KeyError):
+      return 0
+
+  def _pods_failed(self, app):
+    if self.pod_autoscale_status.get(app) == DBSCALINGCHECK.FAIL.value:
+      self.logger.debug(
+        "Skipping database scaling for %s as pod"
+        " autoscaling failed for this server",
+        app,
+      )
+      return True
+    return False
+
+  def _apply_database_scaling(self, plan, deadline=None, deferred_apps=()):
+    ## Return the entries deferred by the deadline, apps whose pods were
+    ## deferred keep their database as it is
+    actions = {
+      DBACTION.START.value: self._start_database,
+      DBACTION.STOP.value: self._stop_database,
+    }
+    entries = plan.databases
+    if deadline is not None and plan.status == STATUS.NIGHT.value:
+      ## Most expensive instances are stopped first
+      costs = {
+        x["instance"]: self._database_cost(x["instance"]) for x in entries
+      }
+      entries = sorted(
+        entries, key=lambda x: costs[x["instance"]], reverse=True
+      )
+    deferred = [x for x in entries if x["app"] in deferred_apps]
+    operations = {}
+    for entry in entries:
+      if entry["app"] in deferred_apps or self._pods_failed(entry["app"]):
+        continue
+      operations.setdefault(
+        entry["instance"],
+        (
+          actions[entry["action"]],
+          entry["staging_name"],
+          entry["target_status"],
+        ),
+      )
+    _, late = self._run_database_operations(operations, deadline)
+    deferred.extend(
+      x
+      for x in entries
+      if x["instance"] in late and x["app"] not in deferred_apps
+    )
+    return deferred
+
+  def _scale_database_instance(self):
+    self._ensure_application_status()
+    plan = Plan(self.status, self.today)
+    if self._plan_database_scaling(plan):
+      self._apply_database_scaling(plan)
+      return True
+
+  def _run_database_operations(self, operations, deadline=None):
+    ## Issue every start/stop at once, then wait for them in one wave.
+    ## Return (completed, instances not issued before the deadline)
+    if not operations:
+      return {}, []
+
+    def issue(db_instance):
+      action, staging_name, _ = operations[db_instance]
+      return db_instance, action(db_instance, staging_name)
+
+    results, deferred = self._map_within_deadline(
+      issue, operations, "rds-scaling", deadline
+    )
+    issued = dict(results)
+
+    waiter = DatabaseWaiter(self.rds_inventory)
+    for db_instance, started in issued.items():
+      if started:
+        waiter.track(db_instance, operations[db_instance][2])
+    timeout = self.db_wait_timeout
+    if deadline is not None:
+      timeout = min(timeout, deadline.remaining())
+    if timeout <= 0 or not waiter.pending:
+      return {}, deferred
+
+    with self.tracer.span("database_wait", instances=len(waiter.pending)):
+      completed = waiter.wait(timeout, self.db_poll_interval)
+    for db_instance, latency in completed.items():
+      self.logger.info(
+        "%s: Database instance reached target status in %.1fs",
+        db_instance,
+        latency,
+      )
+    for db_instance in waiter.pending:
+      self.logger.warning(
+        "%s: Database instance did not reach target status within %ss",
+        db_instance,
+        timeout,
+      )
+    return completed, deferred
+
+  def build_plan(self):
+    """Decide every write of this run without changing anything"""
+    ## A full reconcile read every target live and refresh the store
+    self._full_reconcile = (
+      not self.state_store.enabled or self.state_store.needs_full_reconcile()
+    )
+    self._use_state_store = not self._full_reconcile
+    self._ensure_application_status()
+    plan = Plan(self.status, self.today)
+    with self.tracer.span("plan_autosync"):
+      if not self._plan_auto_sync(plan):
+        raise Exception("Failed to enable/disable autosync")
+    if self.status not in (STATUS.MORNING.value, STATUS.NIGHT.value):
+      self.logger.warning("Scaling will not run during working hour")
+      return plan
+    with self.tracer.span("plan_deployments"):
+      if not self._plan_pods_scaling(plan):
+        raise Exception("Server pods scaling failed")
+    if self.database_enabled:
+      with self.tracer.span("plan_databases"):
+        if not self._plan_database_scaling(plan):
+          raise Exception("Database scaling failed")
+    return plan
+
+  def apply_plan(self, plan, deadline=None):
+    """
+    Apply the plan within the deadline, each phase also within its
+    PHASE_BUDGETS budget. Return the deferred entries by phase
+    """
+    deadline = deadline or Deadline()
+    if self.pipeline == PIPELINE.STREAM.value:
+      with self.metrics.phase_duration.time(
+        phase="pipeline"
+      ), self.tracer.span("pipeline", changes=len(plan)):
+        deferred = self._stream_plan(plan, deadline)
+    else:
+      deferred = self._apply_phases(plan, deadline)
+    messages = {
+      "deployments": "Server pods scaling completed",
+      "databases": "Database scaling completed",
+    }
+    for phase in self._plan_phases(plan):
+      if (
+        phase in messages
+        and phase not in deferred
+        and plan.status != STATUS.WORKING.value
+      ):
+        self.logger.info(messages[phase])
+    self._report_deferred(deferred)
+    return deferred
+
+  def _plan_phases(self, plan):
+    return [
+      phase
+      for phase in plan.phases()
+      if phase != "databases" or self.database_enabled
+    ]
+
+  def _apply_phases(self, plan, deadline):
+    ## Every app wait for the slowest one between phases
+    appliers = {
+      "deployments": self._apply_pods_scaling,
+      "databases": self._apply_database_scaling,
+    }
+    deferred = {}
+    deferred_apps = set()
+    for phase in self._plan_phases(plan):
+      budget = deadline.child(self.phase_budgets.get(phase, 0))
+      with self.metrics.phase_duration.time(phase=phase), self.tracer.span(
+        phase, changes=len(getattr(plan, phase))
+      ):
+        if phase == "autosync":
+          late = self._apply_auto_sync(plan, budget)
+        else:
+          ## Pods and database of an app are not scaled once the other
+          ## one was deferred
+          late = appliers[phase](plan, budget, deferred_apps)
+      if late:
+        deferred[phase] = late
+        deferred_apps.update(x["app"] for x in late)
+    return deferred
+
+  def _stream_plan(self, plan, deadline):
+    ## Every app go through its autosync, deployment tiers and database
+    ## in the plan phases order as soon as its previous stage is done, a
+    ## slow app only hold back its own next stage. A phase budget count
+    ## from the start of the pipeline, once an entry of an app is
+    ## deferred the rest of the app is deferred too. At night the
+    ## standalone database entries run once every app is done
+    budgets = {
+      phase: deadline.child(self.phase_budgets.get(phase, 0))
+      for phase in PHASES
+    }
+    servers = {server["name"]: server for server in self.config["server"]}
+    deferred = {}
+    deferred_apps = set()
+    lock = threading.Lock()
+
+    def apply_entries(phase, apply, entries):
+      for i, entry in enumerate(entries):
+        if entry["app"] in deferred_apps or budgets[phase].expired():
+          with lock:
+            deferred.setdefault(phase, []).extend(entries[i:])
+            deferred_apps.add(entry["app"])
+          return
+        apply(entry)
+
+    databases = poll = None
+    if self.database_enabled and plan.databases:
+      databases, poll = self._stream_databases(
+        plan, budgets["databases"], apply_entries
+      )
+    appliers = {
+      "autosync": functools.partial(self._apply_auto_sync_entry, servers),
+      "deployments": self._apply_deployment,
+    }
+    stages = {}
+    for phase in self._plan_phases(plan):
+      if phase == "deployments":
+        groups = plan.deployment_tiers()
+      else:
+        groups = [getattr(plan, phase)]
+      for group in groups:
+        entries = {}
+        for entry in group:
+          entries.setdefault(entry["app"], []).append(entry)
+        for app, app_entries in entries.items():
+          if phase == "deployments" and plan.status == STATUS.NIGHT.value:
+            ## Largest deployments first
+            app_entries.sort(key=lambda x: x["replicas"], reverse=True)
+          if phase == "databases":
+            stage = functools.partial(databases, app_entries)
+          else:
+            stage = functools.partial(
+              apply_entries, phase, appliers[phase], app_entries
+            )
+          stages.setdefault(app, []).append(
+            functools.partial(self._run_stage, phase, app, stage)
+          )
+
+    apps = list(stages)
+    if plan.status == STATUS.NIGHT.value:
+      ## Apps with the most expensive database and the most pods first
+      costs = {}
+      if self.database_enabled:
+        costs = {
+          x["app"]: self._database_cost(x["instance"]) for x in plan.databases
+        }
+      replicas = {}
+      for entry in plan.deployments:
+        app = entry["app"]
+        replicas[app] = replicas.get(app, 0) + entry["replicas"]
+      apps.sort(
+        key=lambda x: (costs.get(x, 0), replicas.get(x, 0)), reverse=True
+      )
+    standalone = []
+    if plan.status == STATUS.NIGHT.value:
+      standalone = [app for app in apps if app not in servers]
+    for group in ([x for x in apps if x not in standalone], standalone):
+      Pipeline(self.workers, "argocd-pipeline", poll).run(
+        [(app, stages[app]) for app in group]
+      )
+
+    ## Deferred entries keep the plan order
+    order = {
+      id(entry): i
+      for phase in PHASES
+      for i, entry in enumerate(getattr(plan, phase))
+    }
+    return {
+      phase: sorted(deferred[phase], key=lambda x: order[id(x)])
+      for phase in PHASES
+      if phase in deferred
+    }
+
+  def _run_stage(self, phase, app, stage):
+    with self.tracer.span(phase, category="pipeline", app=app):
+      return stage()
+
+  def _stream_databases(self, plan, budget, apply_entries):
+    ## Return (apply, poll) of the pipeline database stage. apply issue
+    ## the start/stop of an app database and park the app while its
+    ## instance is tracked, poll reload the inventory once for every
+    ## tracked instance and release the apps that no instance block.
+    ## At night an instance shared by several apps is only stopped by the
+    ## last of them to reach its database stage, once all their pods are
+    ## down, and never while an app using it failed to scale its pods
+    actions = {
+      DBACTION.START.value: self._start_database,
+      DBACTION.STOP.value: self._stop_database,
+    }
+    waiter = DatabaseWaiter(self.rds_inventory)
+    # Apps waiting on each instance, None once the instance is settled
+    waiting = {}
+    # Number of instances each app is waiting on
+    blocking = {}
+    # Apps using each instance that did not reach their database stage
+    users = {}
+    if plan.status == STATUS.NIGHT.value:
+      for entry in plan.databases:
+        users.setdefault(entry["instance"], set()).add(entry["app"])
+    lock = threading.Lock()
+
+    def settle(db_instance):
+      for app in waiting[db_instance]:
+        blocking[app] -= 1
+      waiting[db_instance] = None
+
+    def issue(entry):
+      app, db_instance = entry["app"], entry["instance"]
+      if self._pods_failed(app):
+        return
+      with lock:
+        users.get(db_instance, set()).discard(app)
+        if users.get(db_instance):
+          self.logger.debug(
+            "%s: Database instance still used by %s",
+            db_instance,
+            ", ".join(sorted(users[db_instance])),
+          )
+          return
+        if db_instance in waiting:
+          ## Instance shared with an app that already issued it
+          if waiting[db_instance] is not None:
+            waiting[db_instance].append(app)
+            blocking[app] = blocking.get(app, 0) + 1
+          return
+        waiting[db_instance] = [app]
+        blocking[app] = blocking.get(app, 0) + 1
+      started = actions[entry["action"]](db_instance, entry["staging_name"])
+      with lock:
+        if started and self.db_wait_timeout > 0:
+          waiter.track(db_instance, entry["target_status"])
+        else:
+          settle(db_instance)
+
+    def apply(entries):
+      apply_entries("databases", issue, entries)
+      with lock:
+        return blocking.get(entries[0]["app"], 0) > 0
+
+    def poll(parked):
+      completed = waiter.poll()
+      for db_instance, latency in completed.items():
+        self.logger.info(
+          "%s: Database instance reached target status in %.1fs",
+          db_instance,
+          latency,
+        )
+      timeout = 0 if budget.expired() else self.db_wait_timeout
+      late = waiter.expire(timeout)
+      for db_instance in late:
+        self.logger.warning(
+          "%s: Database instance did not reach target status within %ss",
+          db_instance,
+          timeout,
+        )
+      with lock:
+        for db_instance in list(completed) + late:
+          settle(db_instance)
+        released = [app for app in parked if blocking.get(app, 0) <= 0]
+      delay = min(self.db_poll_interval, self.db_wait_timeout)
+      return released, max(0, min(delay, budget.remaining()))
+
+    return apply, poll
+
+  def _report_deferred(self, deferred):
+    for phase, entries in deferred.items():
+      keys = ("app", "name", "instance")
+      targets = ["/".join(x[key] for key in keys if key in x) for x in entries]
+      message = (
+        f"{len(entries)} {phase} change(s) deferred to the next run:"
+        f" {', '.join(targets)}"
+      )
+      self.logger.warning(message)
+      self.metrics.deferred.inc(len(entries), phase=phase)
+      self.slack.post_warn_message_to_slack(
+        SCALINGTYPE.DEADLINE.value, phase, message
+      )
+
+  def run(self):
+    ## A trace of the run is written when profiling is enabled
+    with self.profiler.run():
+      return self._run()
+
+  def _run(self):
+    result = "failed"
+    try:
+      with self.metrics.phase_duration.time(phase="plan"), self.tracer.span(
+        "plan"
+      ):
+        plan = self.build_plan()
+      if self.dry_run:
+        self.logger.info(
+          "Dry run, %s change(s) planned: %s", len(plan), plan.to_json()
+        )
+      else:
+        self.apply_plan(plan, Deadline(self.run_deadline))
+        if self._full_reconcile and self.state_store.enabled:
+          self.state_store.mark_full_reconcile()
+      result = "dry_run" if self.dry_run else "success"
+    finally:
+      self._use_state_store = False
+      self.state_store.commit()
+      self._report_resilience()
+      self.metrics.runs.inc(result=result)
+      self.metrics.last_run.set(time.time())
+      self.write_metrics()
+    return plan
+
+  def reconcile(self, status=None):
+    ## Refresh the day and time of day, then run again. App statuses are
+    ## kept between passes of the same time of day: reload_config fetch
+    ## the edited apps again, and every app is fetched on each morning or
+    ## night transition and once FULL_RECONCILE_INTERVAL has passed
+    previous = self.status
+    self.today = self._get_day_env()
+    self.status = status if status is not None else self._get_status_env()
+    self.pod_autoscale_status = {}
+    if self._application_status_loaded and (
+      self.status != previous
+      or time.monotonic() - self._application_status_loaded_at
+      >= self.full_reconcile_interval
+    ):
+      self._application_status_loaded = False
+    self.reload_config()
+    if self._application_status_loaded:
+      self._fetch_unreachable_applications()
+    self.run()
+
   def priority_checking(self):
     if self.status == STATUS.NIGHT.value:
       autoscale = self._evaluate_pods_scaling()
       if autoscale:
         self.logger.info("Server pods scaling completed")
-        if self.rds is not None:
+        if self.database_enabled:
           db_scale = self._scale_database_instance()
           if db_scale:
             self.logger.info("Database scaling completed")
@@ -985,7 +2184,7 @@ class AutoScaler:
       else:
         raise Exception("Server pods scaling failed")
     elif self.status == STATUS.MORNING.value:
-      if self.rds is not None:
+      if self.database_enabled:
         db_scale = self._scale_database_instance()
         if db_scale:
           self.logger.info("Database scaling completed")
@@ -67,6 +67,61 @@ class DEBUGGER(Enum):
     )
 
 
+class DISCOVERY(Enum):
+  """This enum consist of the DISCOVERY env parameter
+
+  It is used to validate if the discovery mode provided is
+  fall into the list below
+  """
+
+  SINGLE = "single"
+  BULK = "bulk"
+
+  @classmethod
+  def _missing_(cls, value):
+    choices = list(cls.__members__.keys())
+    raise ValueError(
+      f"{value} is not a valid {cls.__name__}, " f"please choose from {choices}"
+    )
+
+
+class PIPELINE(Enum):
+  """This enum consist of the PIPELINE env parameter
+
+  It is used to validate if the way the plan is applied is
+  fall into the list below
+  """
+
+  STREAM = "stream"
+  PHASES = "phases"
+
+  @classmethod
+  def _missing_(cls, value):
+    choices = list(cls.__members__.keys())
+    raise ValueError(
+      f"{value} is not a valid {cls.__name__}, " f"please choose from {choices}"
+    )
+
+
+class PROFILE(Enum):
+  """This enum consist of the PROFILE env parameter
+
+  It is used to validate if the profiling modes provided are
+  fall into the list below
+  """
+
+  TRACE = "trace"
+  CPROFILE = "cprofile"
+  TRACEMALLOC = "tracemalloc"
+
+  @classmethod
+  def _missing_(cls, value):
+    choices = list(cls.__members__.keys())
+    raise ValueError(
+      f"{value} is not a valid {cls.__name__}, " f"please choose from {choices}"
+    )
+
+
 class SYNC(Enum):
   ENABLED = "enabled"
   DISABLED = "disabled"
@@ -87,6 +142,11 @@ class DBSCALINGCHECK(Enum):
   SUCCESS = "success"
 
 
+class DBACTION(Enum):
+  START = "start"
+  STOP = "stop"
+
+
 class DBSTATUS(Enum):
   STOPPED = "stopped"
   AVAILABLE = "available"
@@ -0,0 +1,142 @@
+"""This is the aws module for Pod autoscaler
+
+boto3 and botocore are slow to import, they are only imported once the
+RDS client is created so that runs without database scaling skip them
+"""
+import sys
+
+from .resilience import FAILED
+
+# Error codes of a throttled request, it was refused before being applied
+THROTTLING_CODES = (
+  "Throttling",
+  "ThrottlingException",
+  "RequestLimitExceeded",
+)
+
+# Error codes worth retrying, the api is throttling or unavailable
+RETRYABLE_CODES = THROTTLING_CODES + ("ServiceUnavailable", "InternalFailure")
+
+# botocore errors raised when the endpoint cannot be reached
+RETRYABLE_ERRORS = (
+  "EndpointConnectionError",
+  "ConnectionClosedError",
+  "ConnectTimeoutError",
+  "ReadTimeoutError",
+)
+
+# botocore errors raised before the request reached the endpoint
+UNSENT_ERRORS = ("EndpointConnectionError", "ConnectTimeoutError")
+
+# Operations that only read, they are safe to send again
+READ_PREFIXES = ("describe_", "list_", "get_")
+
+
+class _NotImportedError(Exception):
+  """Stand in for ClientError until botocore is imported, never raised"""
+
+
+def client_error():
+  """
+  Return botocore ClientError to catch aws api errors. Until botocore is
+  imported no client could raise it, a stand in is returned instead
+  """
+  exceptions = sys.modules.get("botocore.exceptions")
+  return exceptions.ClientError if exceptions else _NotImportedError
+
+
+def create_rds_client(aws_secret):
+  # pylint: disable=import-outside-toplevel
+  import boto3
+  from botocore.config import Config
+
+  session = boto3.Session(
+    aws_access_key_id=aws_secret["aws_access_key_id"],
+    aws_secret_access_key=aws_secret["aws_secret_access_key"],
+    region_name=aws_secret["region_name"],
+  )
+  ## Retries are done by the resilience layer, not by botocore
+  return session.client(
+    "rds", config=Config(retries={"total_max_attempts": 1})
+  )
+
+
+def classify_error(result, error):
+  """Return (retryable, retry_after) of an aws api call"""
+  if error is None:
+    return False, None
+  if type(error).__name__ in RETRYABLE_ERRORS:
+    return True, None
+  response = getattr(error, "response", None) or {}
+  if response.get("Error", {}).get("Code") in RETRYABLE_CODES:
+    return True, None
+  status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+  return status >= 500, None
+
+
+def classify_write_error(result, error):
+  """
+  Return (retryable, retry_after) of an aws api call that change state,
+  e.g. start_db_instance. It is only retried when the request was
+  throttled or never sent: after a read timeout or a 5xx the change may
+  be applied and a retried start/stop would fail with
+  InvalidDBInstanceState
+  """
+  retryable, retry_after = classify_error(result, error)
+  if not retryable:
+    return retryable, retry_after
+  response = getattr(error, "response", None) or {}
+  if (
+    type(error).__name__ in UNSENT_ERRORS
+    or response.get("Error", {}).get("Code") in THROTTLING_CODES
+  ):
+    return True, retry_after
+  return FAILED, None
+
+
+class ResilientClient:
+  """
+  This class wrap a boto3 client so that every api call, including a
+  whole pagination, go through the resilience retries and breaker
+  """
+
+  def __init__(self, client, resilience):
+    self.client = client
+    self.resilience = resilience
+
+  def __getattr__(self, name):
+    method = getattr(self.client, name)
+    if not callable(method):
+      return method
+    classify = (
+      classify_error if name.startswith(READ_PREFIXES) else classify_write_error
+    )
+
+    def call(*args, **kwargs):
+      return self.resilience.call(
+        name, lambda: method(*args, **kwargs), classify
+      )
+
+    return call
+
+  def get_paginator(self, operation_name):
+    return _ResilientPaginator(
+      self.client.get_paginator(operation_name),
+      operation_name,
+      self.resilience,
+    )
+
+
+class _ResilientPaginator:
+  def __init__(self, paginator, operation_name, resilience):
+    self.paginator = paginator
+    self.operation_name = operation_name
+    self.resilience = resilience
+
+  def paginate(self, **kwargs):
+    ## A page failing midway restart the pagination from the first page
+    return self.resilience.call(
+      self.operation_name,
+      lambda: list(self.paginator.paginate(**kwargs)),
+      classify_error,
+    )
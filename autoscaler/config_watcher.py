@@ -0,0 +1,62 @@
+"""This module contains ConfigWatcher class
+
+Detect edits of config.yml and secret.yml in daemon mode, and compute the
+entries of the server and database lists that need to be evaluated again
+"""
+import os
+
+# Keys added to the config entries by the autoscaler itself
+RUNTIME_KEYS = ("application_status",)
+
+
+def _stat_signature(path):
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _strip_runtime_keys(entry):
+  return {k: v for k, v in entry.items() if k not in RUNTIME_KEYS}
+
+
+def diff_entries(old_entries, new_entries, key="name"):
+  """
+  Return (changed, removed) between two lists of config entries
+
+  changed keep the added or modified entries of new_entries in order,
+  removed is the set of keys no longer present
+  """
+  old = {entry[key]: _strip_runtime_keys(entry) for entry in old_entries}
+  changed = [
+    entry
+    for entry in new_entries
+    if old.get(entry[key]) != _strip_runtime_keys(entry)
+  ]
+  removed = set(old) - {entry[key] for entry in new_entries}
+  return changed, removed
+
+
+class ConfigWatcher:
+  """
+  This class track the modification time of a set of files
+
+  A file is reported once after each change, an unreadable file is
+  reported when it come back
+  """
+
+  def __init__(self, paths):
+    self.signatures = {path: _stat_signature(path) for path in paths}
+
+  def changed(self, *paths):
+    """Return the changed paths among paths, every path by default"""
+    changed = []
+    for path in paths or list(self.signatures):
+      signature = self.signatures[path]
+      current = _stat_signature(path)
+      if current != signature:
+        self.signatures[path] = current
+        if current is not None:
+          changed.append(path)
+    return changed
@@ -0,0 +1,64 @@
+"""This module contains DBInstanceIndex class
+
+Index over the RDS instance identifiers, built once per inventory
+snapshot to resolve the database of each application
+"""
+
+NGRAM = 3
+
+
+def _ngrams(value):
+  return {value[i : i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+class DBInstanceIndex:
+  """
+  This class resolve an application name to its database identifier
+
+  Exact and suffixed names are looked up in a set, substring search use
+  a trigram inverted index and only verify the identifiers it returns
+  """
+
+  def __init__(self, identifiers, suffix):
+    self.suffix = suffix
+    self.identifiers = list(identifiers)
+    self._exact = set(self.identifiers)
+    self._position = {x: i for i, x in enumerate(self.identifiers)}
+    self._postings = {}
+    for identifier in self.identifiers:
+      for gram in _ngrams(identifier):
+        self._postings.setdefault(gram, set()).add(identifier)
+
+  @classmethod
+  def from_db_list(cls, db_list, suffix):
+    identifiers = [x["DBInstanceIdentifier"] for x in db_list["DBInstances"]]
+    return cls(identifiers, suffix)
+
+  def find(self, key):
+    """Return every identifier containing key, in inventory order"""
+    if len(key) < NGRAM:
+      return [x for x in self.identifiers if key in x]
+    candidates = None
+    ## Rarest trigram first keeps the intersection small
+    grams = sorted(_ngrams(key), key=lambda x: len(self._postings.get(x, ())))
+    for gram in grams:
+      posting = self._postings.get(gram)
+      if not posting:
+        return []
+      candidates = set(posting) if candidates is None else candidates & posting
+      if not candidates:
+        return []
+    matches = [x for x in candidates if key in x]
+    return sorted(matches, key=self._position.__getitem__)
+
+  def resolve(self, key):
+    """Same result as the linear scan: exact, then suffixed, then unique"""
+    if key in self._exact:
+      return key
+    suffixed = f"{key}{self.suffix}"
+    if suffixed in self._exact:
+      return suffixed
+    matches = self.find(key)
+    if len(matches) == 1:
+      return matches[0]
+    return None
@@ -0,0 +1,71 @@
+"""This module contains DatabaseWaiter class
+
+Track the RDS instances that were started or stopped until they reach
+the expected status, every poll is a single inventory reload
+"""
+import threading
+import time
+
+
+class DatabaseWaiter:
+  """
+  This class wait for RDS instances to reach their target status
+
+  poll never block, wait keep polling until every instance is done or
+  the polling budget is used up. Instances can be tracked from several
+  threads while another one poll
+  """
+
+  def __init__(self, inventory, clock=time.monotonic, sleep=time.sleep):
+    self.inventory = inventory
+    self.clock = clock
+    self.sleep = sleep
+    self.pending = {}
+    self.completed = {}
+    self._lock = threading.Lock()
+
+  def track(self, identifier, target_status):
+    if isinstance(target_status, str):
+      target_status = (target_status,)
+    with self._lock:
+      self.pending[identifier] = (tuple(target_status), self.clock())
+
+  def poll(self):
+    """Reload the inventory once and return the instances that finished"""
+    with self._lock:
+      if not self.pending:
+        return {}
+      pending = dict(self.pending)
+    self.inventory.load()
+    finished = {}
+    for identifier, (target_status, started_at) in pending.items():
+      instance = self.inventory.get_instance(identifier)
+      if instance["DBInstanceStatus"] in target_status:
+        finished[identifier] = self.clock() - started_at
+    with self._lock:
+      for identifier in finished:
+        self.pending.pop(identifier, None)
+      self.completed.update(finished)
+    return finished
+
+  def expire(self, timeout):
+    """Stop tracking and return the instances pending for timeout seconds"""
+    now = self.clock()
+    with self._lock:
+      expired = [
+        identifier
+        for identifier, (_, started_at) in self.pending.items()
+        if now - started_at >= timeout
+      ]
+      for identifier in expired:
+        del self.pending[identifier]
+    return expired
+
+  def wait(self, timeout, interval=30):
+    """Poll until nothing is pending or timeout seconds have passed"""
+    deadline = self.clock() + timeout
+    self.poll()
+    while self.pending and self.clock() < deadline:
+      self.sleep(max(0, min(interval, deadline - self.clock())))
+      self.poll()
+    return self.completed
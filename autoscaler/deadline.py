@@ -0,0 +1,57 @@
+"""This module contains Deadline class
+
+Time budget of a run and of each of its phases, work that was not started
+before the budget ran out is deferred to the next run
+"""
+import math
+import time
+
+# Phases of a run that can be given their own budget
+PHASES = ("autosync", "deployments", "databases")
+
+
+class Deadline:
+  """
+  This class track the time left before a deadline, 0 seconds mean no
+  deadline
+
+  A child deadline expire with its own budget or with its parent,
+  whichever come first
+  """
+
+  def __init__(self, seconds=0, clock=None, parent=None):
+    self.parent = parent
+    self.clock = clock or (parent.clock if parent else time.monotonic)
+    self.seconds = seconds
+    self.expires_at = self.clock() + seconds if seconds > 0 else math.inf
+
+  def remaining(self):
+    remaining = self.expires_at - self.clock()
+    if self.parent is not None:
+      remaining = min(remaining, self.parent.remaining())
+    return max(remaining, 0)
+
+  def expired(self):
+    return self.remaining() <= 0
+
+  def child(self, seconds=0):
+    return Deadline(seconds, parent=self)
+
+
+def parse_budgets(value):
+  """Parse "autosync=60,deployments=300" into {phase: seconds}"""
+  budgets = {}
+  for item in value.split(","):
+    if not item.strip():
+      continue
+    phase, sep, seconds = item.partition("=")
+    phase = phase.strip()
+    if not sep or phase not in PHASES:
+      raise ValueError(
+        f"Invalid phase budget '{item.strip()}', expected one of"
+        f" {', '.join(PHASES)} as phase=seconds"
+      )
+    budgets[phase] = float(seconds)
+    if budgets[phase] < 0:
+      raise ValueError(f"Budget of {phase} should be at least 0")
+  return budgets
@@ -0,0 +1,181 @@
+"""This is the decision module for Pod autoscaler
+
+The schedule rules deciding whether an app, a deployment or a database
+is scaled up (True), scaled down (False) or left as is (None) only depend
+on a handful of small enums. The rules are evaluated once for every
+combination and looked up afterwards, values outside of the enums are
+looked up as the enum value they behave like
+"""
+import itertools
+
+from .autoscaler_enum import DAY, LOGTYPE, OPERATE, STATUS
+
+STATUSES = tuple(status.value for status in STATUS)
+DAYS = tuple(day.value for day in DAY)
+# operate_day is optional when autoscaledown is false
+OPERATE_DAYS = tuple(operate.value for operate in OPERATE) + (None,)
+BOOLEANS = (True, False)
+
+
+def _decision_rule(
+  status,
+  today,
+  operate_day,
+  autoscaledown,
+  criteria_scale_up,
+  criteria_scale_down,
+):
+  ## The schedule rules the decision table is compiled from
+  if autoscaledown is False and criteria_scale_up:
+    return True
+  elif (
+    autoscaledown
+    and status == STATUS.MORNING.value
+    and (
+      today == DAY.SUNDAY.value
+      or (
+        operate_day == OPERATE.WEEKDAYS.value and today == DAY.SATURDAY.value
+      )
+    )
+    and criteria_scale_down
+  ):
+    return False
+  elif (
+    autoscaledown
+    and status == STATUS.MORNING.value
+    and today != DAY.SATURDAY.value
+    and today != DAY.SUNDAY.value
+    and criteria_scale_up
+  ):
+    return True
+  elif (
+    autoscaledown
+    and status == STATUS.MORNING.value
+    and today != DAY.SUNDAY.value
+    and (
+      (operate_day == OPERATE.WEEKEND.value and today == DAY.SATURDAY.value)
+      or (
+        operate_day == OPERATE.WEEKDAYS.value and today != DAY.SATURDAY.value
+      )
+    )
+    and criteria_scale_up
+  ):
+    return True
+  elif (
+    autoscaledown
+    and status == STATUS.NIGHT.value
+    and today != DAY.SUNDAY.value
+    and operate_day == OPERATE.WEEKEND.value
+    and today != DAY.SATURDAY.value
+    and criteria_scale_up
+  ):
+    return True
+  elif (
+    autoscaledown
+    and status == STATUS.NIGHT.value
+    and (
+      today == DAY.SUNDAY.value
+      or (operate_day == OPERATE.WEEKEND.value and today == DAY.SATURDAY.value)
+      or (
+        operate_day == OPERATE.WEEKDAYS.value
+        and today != DAY.SATURDAY.value
+        and today != DAY.SUNDAY.value
+      )
+    )
+    and criteria_scale_down
+  ):
+    return False
+  else:
+    return None
+
+
+def _log_type_rule(status, today, operate_day):
+  ## The rules choosing the log message when nothing is scaled
+  if status == STATUS.MORNING.value:
+    if (
+      operate_day == OPERATE.WEEKDAYS.value
+      and (today in (DAY.SATURDAY.value, DAY.SUNDAY.value))
+    ) or (operate_day == OPERATE.WEEKEND.value and today == DAY.SUNDAY.value):
+      return LOGTYPE.DETAILS.value
+  elif status == STATUS.NIGHT.value:
+    if (
+      operate_day == OPERATE.WEEKEND.value and today != DAY.SATURDAY.value
+    ) or (operate_day == OPERATE.WEEKDAYS.value and today == DAY.SUNDAY.value):
+      return LOGTYPE.DETAILS.value
+  return LOGTYPE.DEFAULT.value
+
+
+def _compile_decisions():
+  table = {}
+  for status, today in itertools.product(STATUSES, DAYS):
+    table[status, today] = {
+      target: _decision_rule(status, today, *target)
+      for target in itertools.product(
+        OPERATE_DAYS, BOOLEANS, BOOLEANS, BOOLEANS
+      )
+    }
+  return table
+
+
+# {(status, today): {(operate_day, autoscaledown, up, down): decision}}
+DECISIONS = _compile_decisions()
+
+# {(status, today, operate_day): log type}
+LOG_TYPES = {
+  key: _log_type_rule(*key)
+  for key in itertools.product(STATUSES, DAYS, OPERATE_DAYS)
+}
+
+
+def _known(status, today, operate_day):
+  ## The rules only compare with these values, anything else behave like
+  ## the working hours, a week day or no operate_day
+  if status not in STATUSES:
+    status = STATUS.WORKING.value
+  if today not in DAYS:
+    today = DAY.MONDAY.value
+  if operate_day not in OPERATE_DAYS:
+    operate_day = None
+  return status, today, operate_day
+
+
+def decide(
+  status,
+  today,
+  operate_day,
+  autoscaledown,
+  criteria_scale_up,
+  criteria_scale_down,
+):
+  return decide_batch(
+    status,
+    today,
+    [(operate_day, autoscaledown, criteria_scale_up, criteria_scale_down)],
+  )[0]
+
+
+def decide_batch(status, today, targets):
+  """
+  Decide a list of (operate_day, autoscaledown, up, down) targets sharing
+  the same status and day, the decisions are returned in order. The table
+  of the status and day is only looked up once, then each target is
+  looked up in it
+  """
+  status, today, _ = _known(status, today, None)
+  table = DECISIONS[status, today]
+  decisions = []
+  for operate_day, autoscaledown, up, down in targets:
+    if autoscaledown is not False and not autoscaledown:
+      ## Neither false nor truthy, e.g. None, never scaled
+      decisions.append(None)
+      continue
+    if operate_day not in OPERATE_DAYS:
+      operate_day = None
+    decisions.append(
+      table[operate_day, autoscaledown is not False, bool(up), bool(down)]
+    )
+  return decisions
+
+
+def log_type(status, today, operate_day):
+  return LOG_TYPES[_known(status, today, operate_day)]
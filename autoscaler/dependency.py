@@ -0,0 +1,40 @@
+"""This is the dependency module for Pod autoscaler
+
+Group the deployments of an application into tiers from the dependency
+graph in config.yml, every deployment in a tier can be scaled together
+"""
+
+
+def build_tiers(names, dependencies):
+  """Return the deployments grouped in scale up order
+
+  dependencies map a deployment to the deployments it depends on, those
+  are placed in an earlier tier. Dependencies on deployments that are not
+  in names are ignored. Raise ValueError when the graph has a cycle.
+  """
+  names = list(names)
+  known = set(names)
+  pending = {
+    name: {x for x in dependencies.get(name, []) if x in known and x != name}
+    for name in names
+  }
+  tiers = []
+  while pending:
+    tier = [name for name in names if name in pending and not pending[name]]
+    if not tier:
+      raise ValueError(
+        f"Dependency cycle found between deployments: {sorted(pending)}"
+      )
+    for name in tier:
+      del pending[name]
+    for remaining in pending.values():
+      remaining.difference_update(tier)
+    tiers.append(tier)
+  return tiers
+
+
+def check_dependencies(dependencies):
+  names = set(dependencies)
+  for depends_on in dependencies.values():
+    names.update(depends_on)
+  build_tiers(sorted(names), dependencies)
@@ -5,4 +5,8 @@ class Empty:
 
     def post_warn_message_to_slack(self, server_type, staging, message): pass
 
-    def post_fail_message_to_slack(self, server_type, staging, message): pass
\ No newline at end of file
+    def post_fail_message_to_slack(self, server_type, staging, message): pass
+
+    def flush(self, timeout=60): pass
+
+    def close(self, timeout=60): pass
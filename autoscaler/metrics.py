@@ -0,0 +1,301 @@
+"""This is the metrics module for Pod autoscaler
+
+Counters and histograms in the Prometheus text format, written to a file
+for the node exporter textfile collector (Job mode) or served over HTTP
+on /metrics (daemon mode)
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .resilience import CircuitBreaker
+
+# Latency buckets in seconds, from a single api call to a whole phase
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+  return (
+    str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+  )
+
+
+def _format_labels(labels):
+  if not labels:
+    return ""
+  pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+  return "{" + pairs + "}"
+
+
+def _format_value(value):
+  if float(value).is_integer():
+    return str(int(value))
+  return repr(float(value))
+
+
+class Counter:
+  """This class count events by label values"""
+
+  kind = "counter"
+
+  def __init__(self, name, documentation, labelnames=()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def _key(self, labels):
+    if set(labels) != set(self.labelnames):
+      raise ValueError(f"{self.name} expect labels {self.labelnames}")
+    return tuple(str(labels[name]) for name in self.labelnames)
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def get(self, **labels):
+    with self._lock:
+      return self._values.get(self._key(labels), 0)
+
+  def samples(self):
+    """Yield (name, [(label, value)], value)"""
+    with self._lock:
+      values = sorted(self._values.items())
+    for key, value in values:
+      yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+  """This class hold the last value set by label values"""
+
+  kind = "gauge"
+
+  def set(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = value
+
+
+class Histogram(Counter):
+  """This class count observations in cumulative buckets by label values"""
+
+  kind = "histogram"
+
+  def __init__(self, name, documentation, labelnames=(), buckets=None):
+    super().__init__(name, documentation, labelnames)
+    self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+
+  def observe(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      counts, total, count = self._values.get(
+        key, ([0] * len(self.buckets), 0, 0)
+      )
+      counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+      self._values[key] = (counts, total + value, count + 1)
+
+  @contextmanager
+  def time(self, **labels):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start, **labels)
+
+  def get(self, **labels):
+    """Return the number of observations"""
+    with self._lock:
+      return self._values.get(self._key(labels), (None, 0, 0))[2]
+
+  def samples(self):
+    with self._lock:
+      values = sorted(self._values.items())
+    for key, (counts, total, count) in values:
+      labels = list(zip(self.labelnames, key))
+      for bound, bucket in zip(self.buckets, counts):
+        le = ("le", _format_value(bound))
+        yield f"{self.name}_bucket", labels + [le], bucket
+      yield f"{self.name}_bucket", labels + [("le", "+Inf")], count
+      yield f"{self.name}_sum", labels, total
+      yield f"{self.name}_count", labels, count
+
+
+class Registry:
+  """
+  This class hold every metric and render them in the Prometheus text
+  format
+
+  A collector is called on every render and return extra metrics, e.g.
+  counters kept elsewhere
+  """
+
+  def __init__(self):
+    self._metrics = []
+    self._collectors = []
+
+  def register(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def counter(self, name, documentation, labelnames=()):
+    return self.register(Counter(name, documentation, labelnames))
+
+  def gauge(self, name, documentation, labelnames=()):
+    return self.register(Gauge(name, documentation, labelnames))
+
+  def histogram(self, name, documentation, labelnames=(), buckets=None):
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def add_collector(self, collector):
+    self._collectors.append(collector)
+
+  def collect(self):
+    metrics = list(self._metrics)
+    for collector in self._collectors:
+      metrics.extend(collector())
+    return metrics
+
+  def render(self):
+    lines = []
+    for metric in self.collect():
+      lines.append(f"# HELP {metric.name} {metric.documentation}")
+      lines.append(f"# TYPE {metric.name} {metric.kind}")
+      for name, labels, value in metric.samples():
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+  def write_textfile(self, path):
+    """Atomically replace path, the collector never read a partial file"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+    try:
+      with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(self.render())
+      os.chmod(tmp, 0o644)
+      os.replace(tmp, path)
+    except OSError:
+      os.unlink(tmp)
+      raise
+
+
+class MetricsServer:
+  """This class serve the registry on /metrics from a daemon thread"""
+
+  def __init__(self, registry, port, host=""):
+    class Handler(BaseHTTPRequestHandler):
+      """Answer GET /metrics with the rendered registry, 404 otherwise"""
+
+      def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split("?")[0] != "/metrics":
+          self.send_error(404)
+          return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        ## Scrapes are not worth a log line each
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.server.daemon_threads = True
+    self._thread = threading.Thread(
+      target=self.server.serve_forever, name="metrics-server", daemon=True
+    )
+
+  @property
+  def port(self):
+    return self.server.server_address[1]
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class AutoscalerMetrics(Registry):
+  """
+  This class hold the metrics of the AutoScaler, the retries and circuit
+  breaker counters of resilience_metrics are exported as well
+  """
+
+  def __init__(self, resilience_metrics=None):
+    super().__init__()
+    self.api_calls = self.counter(
+      "autoscaler_api_calls_total",
+      "Calls to the argocd and rds api, retries included, by status",
+      ("api", "endpoint", "status"),
+    )
+    self.api_duration = self.histogram(
+      "autoscaler_api_call_duration_seconds",
+      "Duration of argocd and rds api calls, retries included",
+      ("api", "endpoint"),
+    )
+    self.phase_duration = self.histogram(
+      "autoscaler_phase_duration_seconds",
+      "Duration of each phase of a run",
+      ("phase",),
+    )
+    self.deployments_scaled = self.counter(
+      "autoscaler_deployments_scaled_total",
+      "Deployments scaled up or down",
+      ("direction",),
+    )
+    self.deferred = self.counter(
+      "autoscaler_deferred_changes_total",
+      "Changes deferred to the next run by the run deadline",
+      ("phase",),
+    )
+    self.slack_posts = self.counter(
+      "autoscaler_slack_posts_total",
+      "Slack messages posted, by result",
+      ("result",),
+    )
+    self.runs = self.counter(
+      "autoscaler_runs_total", "Runs, by result", ("result",)
+    )
+    self.last_run = self.gauge(
+      "autoscaler_last_run_timestamp_seconds",
+      "Unix time the last run finished",
+    )
+    if resilience_metrics is not None:
+      self.add_collector(lambda: self._collect_resilience(resilience_metrics))
+
+  def observe_api_call(self, api, endpoint, status, seconds):
+    self.api_calls.inc(api=api, endpoint=endpoint, status=status)
+    self.api_duration.observe(seconds, api=api, endpoint=endpoint)
+
+  def observe_slack_post(self, sent):
+    self.slack_posts.inc(result="ok" if sent else "failed")
+
+  @staticmethod
+  def _collect_resilience(resilience_metrics):
+    events = Counter(
+      "autoscaler_resilience_events_total",
+      "Retries, failures and circuit breaker events",
+      ("api", "event", "endpoint"),
+    )
+    for (name, event, endpoint), count in resilience_metrics.counters().items():
+      events.inc(count, api=name, event=event, endpoint=endpoint)
+    circuit = Gauge(
+      "autoscaler_circuit_open",
+      "1 while the circuit of an api is open",
+      ("api",),
+    )
+    for name, state in resilience_metrics.states().items():
+      circuit.set(int(state != CircuitBreaker.CLOSED), api=name)
+    return [events, circuit]
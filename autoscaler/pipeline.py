@@ -0,0 +1,92 @@
+"""This module contains Pipeline class
+
+Run the stages of every app on a shared worker pool without a barrier
+between stages, an app enter its next stage as soon as its previous one
+is done while the other apps keep going
+"""
+import collections
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Pipeline:
+  """
+  This class run jobs, each a list of stages called in order
+
+  At most workers stages run at once and jobs are taken depth-first: a
+  started job keep its worker for its next stage, and a new job is only
+  taken once a started one is done or parked. A stage that return True
+  park its job until poll release it. poll is called from the calling
+  thread with the parked keys while a job is parked and return (keys of
+  the jobs to resume, seconds before the next poll)
+  """
+
+  def __init__(
+    self,
+    workers,
+    thread_name_prefix="pipeline",
+    poll=None,
+    clock=time.monotonic,
+    sleep=time.sleep,
+  ):
+    self.workers = workers
+    self.thread_name_prefix = thread_name_prefix
+    self.poll = poll
+    self.clock = clock
+    self.sleep = sleep
+
+  def run(self, jobs):
+    """Run [(key, [stage, ...])] until every stage of every job is done"""
+    stages = {key: list(job) for key, job in jobs}
+    if not stages:
+      return
+    position = dict.fromkeys(stages, 0)
+    # Jobs not started yet, in the given order
+    new = collections.deque(stages)
+    # Started jobs whose next stage can run, they go before new jobs
+    ready = collections.deque()
+    futures = {}
+    parked = set()
+    next_poll = None
+
+    with ThreadPoolExecutor(
+      max_workers=min(self.workers, len(stages)),
+      thread_name_prefix=self.thread_name_prefix,
+    ) as executor:
+
+      def fill():
+        while len(futures) < self.workers and (ready or new):
+          key = ready.popleft() if ready else new.popleft()
+          if position[key] < len(stages[key]):
+            stage = stages[key][position[key]]
+            position[key] += 1
+            futures[executor.submit(stage)] = key
+
+      fill()
+      while futures or parked:
+        timeout = None
+        if parked:
+          timeout = max(0, next_poll - self.clock())
+        if futures:
+          done, _ = wait(futures, timeout, return_when=FIRST_COMPLETED)
+        else:
+          ## Only parked jobs left, nothing to do until the next poll
+          self.sleep(timeout)
+          done = ()
+        for future in done:
+          key = futures.pop(future)
+          if future.result():
+            parked.add(key)
+            if next_poll is None:
+              next_poll = self.clock()
+          else:
+            ## The job keep the worker it just freed
+            ready.appendleft(key)
+        if parked and self.clock() >= next_poll:
+          released, delay = self.poll(frozenset(parked))
+          for key in released:
+            if key in parked:
+              parked.discard(key)
+              ready.append(key)
+          next_poll = self.clock() + delay if parked else None
+        fill()
@@ -0,0 +1,101 @@
+"""This module contains Plan class
+
+A plan hold every write a run is going to make, it is built from the
+prefetched state before anything is changed so that it can be reviewed
+(dry run) or applied in one go
+"""
+import json
+
+from .autoscaler_enum import STATUS
+
+
+class Plan:
+  """
+  This class hold the autosync toggles, deployment patches and database
+  start/stop of a run
+
+  Every entry is a plain dict so that the plan can be dumped to json and
+  loaded back
+  """
+
+  def __init__(
+    self, status, today, autosync=None, deployments=None, databases=None
+  ):
+    self.status = status
+    self.today = today
+    # [{"app", "action"}], action is SYNC enabled/disabled
+    self.autosync = autosync or []
+    # [{"app", "tier", "name", "params", "replicas", "target"}]
+    self.deployments = deployments or []
+    # [{"app", "instance", "staging_name", "action", "target_status"}],
+    # action is DBACTION start/stop
+    self.databases = databases or []
+
+  def __len__(self):
+    return len(self.autosync) + len(self.deployments) + len(self.databases)
+
+  def add_autosync(self, app, action):
+    self.autosync.append({"app": app, "action": action})
+
+  def add_deployment(self, app, tier, params, replicas, target):
+    self.deployments.append(
+      {
+        "app": app,
+        "tier": tier,
+        "name": params["name"],
+        "params": params,
+        "replicas": replicas,
+        "target": target,
+      }
+    )
+
+  def add_database(self, app, instance, staging_name, action, target_status):
+    self.databases.append(
+      {
+        "app": app,
+        "instance": instance,
+        "staging_name": staging_name,
+        "action": action,
+        "target_status": target_status,
+      }
+    )
+
+  def deployment_tiers(self):
+    """Return the deployment patches grouped by tier, in tier order"""
+    tiers = {}
+    for deployment in self.deployments:
+      tiers.setdefault(deployment["tier"], []).append(deployment)
+    return [tiers[tier] for tier in sorted(tiers)]
+
+  def phases(self):
+    ## Pods are scaled down before the database at night, and the
+    ## database is started before the pods in the morning
+    if self.status == STATUS.NIGHT.value:
+      return ("autosync", "deployments", "databases")
+    return ("autosync", "databases", "deployments")
+
+  def to_dict(self):
+    return {
+      "status": self.status,
+      "today": self.today,
+      "autosync": self.autosync,
+      "deployments": self.deployments,
+      "databases": self.databases,
+    }
+
+  @classmethod
+  def from_dict(cls, data):
+    return cls(
+      data["status"],
+      data["today"],
+      autosync=data.get("autosync"),
+      deployments=data.get("deployments"),
+      databases=data.get("databases"),
+    )
+
+  def to_json(self, indent=None):
+    return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+  @classmethod
+  def from_json(cls, content):
+    return cls.from_dict(json.loads(content))
@@ -0,0 +1,178 @@
+"""This is the profiling module for Pod autoscaler
+
+Opt-in timing spans of every phase and outbound call, written per run as
+a Chrome trace-event file (chrome://tracing or https://ui.perfetto.dev),
+with optional cProfile and tracemalloc snapshots next to it
+"""
+import contextlib
+import cProfile
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from .autoscaler_enum import PROFILE
+
+
+class Tracer:
+  """
+  This class record timing spans as Chrome trace complete events
+
+  A disabled tracer record nothing and its spans cost a single check
+  """
+
+  def __init__(self, enabled=False, clock=time.perf_counter):
+    self.enabled = enabled
+    self.clock = clock
+    self._lock = threading.Lock()
+    self._events = []
+    self._threads = {}
+
+  def reset(self):
+    with self._lock:
+      self._events = []
+      self._threads = {}
+
+  def record(self, name, category, start, duration, **args):
+    """Record a span that started at start (clock) and took duration"""
+    if not self.enabled:
+      return
+    thread = threading.current_thread()
+    event = {
+      "name": name,
+      "cat": category,
+      "ph": "X",
+      "ts": start * 1e6,
+      "dur": duration * 1e6,
+      "pid": os.getpid(),
+      "tid": thread.ident,
+      "args": args,
+    }
+    with self._lock:
+      self._events.append(event)
+      self._threads[thread.ident] = thread.name
+
+  def span(self, name, category="phase", **args):
+    if not self.enabled:
+      return contextlib.nullcontext()
+    return self._span(name, category, args)
+
+  @contextlib.contextmanager
+  def _span(self, name, category, args):
+    start = self.clock()
+    try:
+      yield
+    finally:
+      self.record(name, category, start, self.clock() - start, **args)
+
+  def events(self):
+    with self._lock:
+      return list(self._events)
+
+  def to_chrome_trace(self, metadata=None):
+    with self._lock:
+      events = list(self._events)
+      threads = dict(self._threads)
+    ## Thread names are shown instead of their ident
+    names = [
+      {
+        "name": "thread_name",
+        "ph": "M",
+        "pid": os.getpid(),
+        "tid": ident,
+        "args": {"name": name},
+      }
+      for ident, name in threads.items()
+    ]
+    return {
+      "traceEvents": names + events,
+      "displayTimeUnit": "ms",
+      "otherData": metadata or {},
+    }
+
+
+class Profiler:
+  """
+  This class profile a run with the PROFILE modes
+
+  trace write <prefix>.trace.json, cprofile add <prefix>.prof (pstats,
+  thread calling run only) and tracemalloc add <prefix>.tracemalloc
+  (tracemalloc.Snapshot.load) in directory
+  """
+
+  def __init__(self, directory, modes=()):
+    self.logger = logging.getLogger("pod-autoscaler")
+    self.directory = directory
+    self.modes = set()
+    self.tracer = Tracer()
+    self.files = []
+    self.enable(*modes)
+
+  @property
+  def enabled(self):
+    return bool(self.modes)
+
+  def enable(self, *modes):
+    ## cProfile and tracemalloc snapshots come with the trace
+    self.modes.update(PROFILE(mode).value for mode in modes)
+    if self.modes:
+      self.modes.add(PROFILE.TRACE.value)
+    self.tracer.enabled = self.enabled
+
+  def _prefix(self):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return os.path.join(
+      self.directory, f"{now.strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+    )
+
+  @contextlib.contextmanager
+  def run(self, name="run"):
+    if not self.enabled:
+      yield
+      return
+    self.tracer.reset()
+    profile = None
+    ## tracemalloc may already be tracing, e.g. PYTHONTRACEMALLOC
+    snapshot_memory = PROFILE.TRACEMALLOC.value in self.modes
+    started_tracemalloc = snapshot_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+      tracemalloc.start()
+    if PROFILE.CPROFILE.value in self.modes:
+      profile = cProfile.Profile()
+      profile.enable()
+    try:
+      with self.tracer.span(name, "run"):
+        yield
+    finally:
+      if profile is not None:
+        profile.disable()
+      snapshot, metadata = None, {}
+      if snapshot_memory and tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        metadata = {"memory_current": current, "memory_peak": peak}
+        if started_tracemalloc:
+          tracemalloc.stop()
+      self._write(profile, snapshot, metadata)
+
+  def _write(self, profile, snapshot, metadata):
+    prefix = self._prefix()
+    files = [f"{prefix}.trace.json"]
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      with open(files[0], "w", encoding="utf-8") as f:
+        json.dump(self.tracer.to_chrome_trace(metadata), f)
+      if profile is not None:
+        files.append(f"{prefix}.prof")
+        profile.dump_stats(files[-1])
+      if snapshot is not None:
+        files.append(f"{prefix}.tracemalloc")
+        snapshot.dump(files[-1])
+    except OSError as err:
+      self.logger.warning("Failed to write profile: %s", err)
+      return
+    self.files = files
+    self.logger.info("Profile written to %s", ", ".join(files))
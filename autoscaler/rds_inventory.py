@@ -0,0 +1,100 @@
+"""This module contains RDSInventory class
+
+Per run snapshot of every RDS instance so that status lookups do not
+need one describe_db_instances call per instance
+"""
+import threading
+import time
+
+
+class RDSInventory:
+  """
+  This class keep a paginated snapshot of describe_db_instances
+
+  The whole snapshot is reloaded once it is older than ttl seconds,
+  instances marked as changed are refreshed one by one on the next read
+  """
+
+  def __init__(self, rds, ttl=300, clock=time.monotonic):
+    self.rds = rds
+    self.ttl = ttl
+    self.clock = clock
+    self._lock = threading.RLock()
+    self._instances = {}
+    self._snapshot = None
+    self._loaded_at = None
+    self._changed = set()
+
+  def _expired(self):
+    return self._loaded_at is None or (
+      self.clock() - self._loaded_at >= self.ttl
+    )
+
+  def load(self):
+    instances = {}
+    paginator = self.rds.get_paginator("describe_db_instances")
+    for page in paginator.paginate():
+      for instance in page["DBInstances"]:
+        instances[instance["DBInstanceIdentifier"]] = instance
+    with self._lock:
+      self._instances = instances
+      self._snapshot = None
+      self._loaded_at = self.clock()
+      self._changed.clear()
+
+  def _ensure_loaded(self):
+    with self._lock:
+      if self._expired():
+        self.load()
+
+  def refresh(self, identifier):
+    response = self.rds.describe_db_instances(DBInstanceIdentifier=identifier)
+    instance = response["DBInstances"][0]
+    with self._lock:
+      self._instances[identifier] = instance
+      self._snapshot = None
+      self._changed.discard(identifier)
+    return instance
+
+  def mark_changed(self, identifier):
+    with self._lock:
+      self._changed.add(identifier)
+
+  def snapshot(self):
+    ## Same object until the inventory change, so that callers can cache
+    ## what they build from it (e.g. the identifier index)
+    self._ensure_loaded()
+    with self._lock:
+      if self._snapshot is None:
+        self._snapshot = {"DBInstances": list(self._instances.values())}
+      return self._snapshot
+
+  def get_instance(self, identifier):
+    self._ensure_loaded()
+    with self._lock:
+      instance = self._instances.get(identifier)
+      stale = instance is None or identifier in self._changed
+    if stale:
+      instance = self.refresh(identifier)
+    return instance
+
+  def get_status(self, identifier):
+    return self.get_instance(identifier)["DBInstanceStatus"]
+
+
+# Relative cost of an instance class size, NxlargeN is N times xlarge
+SIZE_COST = {"micro": 1, "small": 2, "medium": 4, "large": 8, "xlarge": 16}
+
+
+def instance_cost(instance):
+  """Relative hourly cost of an instance from its class, doubled for MultiAZ"""
+  size = instance.get("DBInstanceClass", "").rsplit(".", 1)[-1]
+  if size in SIZE_COST:
+    cost = SIZE_COST[size]
+  elif size.endswith("xlarge") and size[:-6].isdigit():
+    cost = SIZE_COST["xlarge"] * int(size[:-6])
+  else:
+    cost = 0
+  if instance.get("MultiAZ"):
+    cost *= 2
+  return cost
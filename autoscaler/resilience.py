@@ -0,0 +1,210 @@
+"""This is the resilience module for Pod autoscaler
+
+Shared retry with jittered exponential backoff and circuit breaker for
+the ArgoCD and RDS api calls, with counters of what happened
+"""
+import random
+import threading
+import time
+
+# Classification of a call that failed but is not worth retrying, e.g.
+# a read timeout or a write that may already have been applied
+FAILED = "failed"
+
+
+class CircuitOpenError(Exception):
+  """Raised instead of calling an api whose circuit is open"""
+
+
+class ResilienceMetrics:
+  """
+  This class count the retries, failures and circuit breaker events of
+  every api, it is shared by every Resilience
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._counters = {}
+    self._states = {}
+
+  def incr(self, name, event, endpoint):
+    with self._lock:
+      key = (name, event, endpoint)
+      self._counters[key] = self._counters.get(key, 0) + 1
+
+  def set_state(self, name, state):
+    with self._lock:
+      self._states[name] = state
+
+  def counters(self):
+    """Return {(name, event, endpoint): count}"""
+    with self._lock:
+      return dict(self._counters)
+
+  def states(self):
+    """Return {name: circuit state}"""
+    with self._lock:
+      return dict(self._states)
+
+  def summary(self):
+    ## {name: {event: count}} summed over the endpoints
+    summary = {}
+    for (name, event, _), count in self.counters().items():
+      events = summary.setdefault(name, {})
+      events[event] = events.get(event, 0) + count
+    return summary
+
+
+class RetryPolicy:
+  """
+  This class compute the delay before each retry, full jitter over an
+  exponential backoff capped at max_delay
+  """
+
+  def __init__(self, attempts=3, base_delay=0.5, max_delay=10, rand=None):
+    self.attempts = attempts
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.rand = rand or random.random
+
+  def delay(self, attempt, retry_after=None):
+    if retry_after is not None:
+      return min(max(retry_after, 0), self.max_delay)
+    backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+    return backoff * self.rand()
+
+
+class CircuitBreaker:
+  """
+  This class stop calling an api after failure_threshold consecutive
+  failures
+
+  Once reset_timeout seconds passed, a single trial call is let through,
+  the circuit close again when it succeed
+  """
+
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+  def __init__(self, failure_threshold=5, reset_timeout=30, clock=None):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.clock = clock or time.monotonic
+    self.state = self.CLOSED
+    self.failures = 0
+    self.opened_at = None
+    self._trial_running = False
+    self._lock = threading.Lock()
+
+  def allow(self):
+    with self._lock:
+      if self.state == self.CLOSED:
+        return True
+      if self.state == self.OPEN:
+        if self.clock() - self.opened_at < self.reset_timeout:
+          return False
+        self.state = self.HALF_OPEN
+      if self._trial_running:
+        return False
+      self._trial_running = True
+      return True
+
+  def record_success(self):
+    with self._lock:
+      self.state = self.CLOSED
+      self.failures = 0
+      self._trial_running = False
+
+  def record_failure(self):
+    """Return True when this failure open the circuit"""
+    with self._lock:
+      self._trial_running = False
+      self.failures += 1
+      if self.state == self.HALF_OPEN or (
+        self.state == self.CLOSED and self.failures >= self.failure_threshold
+      ):
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        return True
+      return False
+
+
+class Resilience:
+  """
+  This class call an api with retries and a circuit breaker
+
+  classify(result, error) return (retryable, retry_after), a call is
+  retried while retryable, up to retry.attempts attempts. A call still
+  retryable after the last attempt count as a failure for the breaker,
+  a call classified FAILED count as one right away without retry.
+  observe(name, endpoint, status, seconds) is called once per call
+  """
+
+  def __init__(
+    self,
+    name,
+    retry=None,
+    breaker=None,
+    metrics=None,
+    sleep=None,
+    open_error=CircuitOpenError,
+    observe=None,
+  ):
+    self.name = name
+    self.retry = retry or RetryPolicy()
+    self.breaker = breaker or CircuitBreaker()
+    self.metrics = metrics or ResilienceMetrics()
+    self.sleep = sleep or time.sleep
+    self.open_error = open_error
+    self.observe = observe
+    self.metrics.set_state(name, self.breaker.state)
+
+  def call(self, endpoint, fn, classify):
+    if self.observe is None:
+      return self._call(endpoint, fn, classify)
+    start = time.perf_counter()
+    status = "error"
+    try:
+      result = self._call(endpoint, fn, classify)
+      ## Http status of an argocd response, ok for an aws call
+      status = str(getattr(result, "status_code", "ok"))
+      return result
+    except Exception as exc:
+      status = type(exc).__name__
+      raise
+    finally:
+      self.observe(self.name, endpoint, status, time.perf_counter() - start)
+
+  def _call(self, endpoint, fn, classify):
+    if not self.breaker.allow():
+      self.metrics.incr(self.name, "short_circuited", endpoint)
+      raise self.open_error(f"{self.name} circuit is open")
+    attempt = 0
+    while True:
+      attempt += 1
+      result, error = None, None
+      try:
+        result = fn()
+      # pylint: disable=broad-except
+      except Exception as exc:
+        error = exc
+      retryable, retry_after = classify(result, error)
+      if retryable is FAILED:
+        attempt = self.retry.attempts
+      elif not retryable:
+        self.breaker.record_success()
+        self.metrics.set_state(self.name, self.breaker.state)
+        if error is not None:
+          raise error
+        return result
+      if attempt >= self.retry.attempts:
+        self.metrics.incr(self.name, "failures", endpoint)
+        if self.breaker.record_failure():
+          self.metrics.incr(self.name, "circuit_opened", endpoint)
+        self.metrics.set_state(self.name, self.breaker.state)
+        if error is not None:
+          raise error
+        return result
+      self.metrics.incr(self.name, "retries", endpoint)
+      self.sleep(self.retry.delay(attempt, retry_after))
@@ -0,0 +1,89 @@
+"""This is the scheduler module for Pod autoscaler
+
+Keep a single AutoScaler alive in daemon mode and run it at every scale
+up and scale down time instead of starting a new process for each run
+"""
+import datetime
+import threading
+
+import pytz
+
+from .autoscaler_enum import STATUS
+
+
+def next_transition(now, time_scale_up, time_scale_down):
+  """Return the next (datetime, status) strictly after now, in UTC"""
+  midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+  candidates = []
+  for time_scale, status in (
+    (time_scale_up, STATUS.MORNING.value),
+    (time_scale_down, STATUS.NIGHT.value),
+  ):
+    at = midnight + datetime.timedelta(
+      hours=time_scale["hours"], minutes=time_scale["minutes"]
+    )
+    while at <= now:
+      at += datetime.timedelta(days=1)
+    candidates.append((at, status))
+  return min(candidates)
+
+
+class Scheduler:
+  """
+  This class run reconciliation passes for a long running AutoScaler
+
+  A pass run at every TIME_SCALE_UP and TIME_SCALE_DOWN, and every
+  interval seconds in between when interval is set. Edits of config and
+  secret are applied every watch_interval seconds while waiting
+  """
+
+  def __init__(self, autoscaler, interval=0, now=None, watch_interval=0):
+    self.autoscaler = autoscaler
+    self.logger = autoscaler.logger
+    self.interval = interval
+    self.watch_interval = watch_interval
+    self.now = now or (lambda: datetime.datetime.now(tz=pytz.utc))
+    self.stop = threading.Event()
+
+  def _run_pass(self, runner, *args):
+    try:
+      runner(*args)
+    # pylint: disable=broad-except
+    except Exception as exc:
+      self.logger.error("Oops something went wrong: %s", repr(exc))
+    finally:
+      # Post every buffered slack notification as one digest
+      self.autoscaler.slack.flush()
+
+  def next_wakeup(self):
+    now = self.now()
+    at, status = next_transition(
+      now, self.autoscaler.time_scale_up, self.autoscaler.time_scale_down
+    )
+    if self.interval and now + datetime.timedelta(seconds=self.interval) < at:
+      ## In between transitions the status is evaluated as usual
+      return now + datetime.timedelta(seconds=self.interval), None
+    return at, status
+
+  def _wait_until(self, at):
+    ## Return True once stopped
+    while True:
+      remaining = max(0, (at - self.now()).total_seconds())
+      if not self.watch_interval or remaining <= self.watch_interval:
+        return self.stop.wait(remaining)
+      if self.stop.wait(self.watch_interval):
+        return True
+      self._run_pass(self.autoscaler.reload_config)
+
+  def run_forever(self):
+    ## The AutoScaler is already initialised, the first pass run right away
+    self._run_pass(self.autoscaler.run)
+    while not self.stop.is_set():
+      at, status = self.next_wakeup()
+      self.logger.info(
+        "Next reconciliation at %s (%s)", at.isoformat(), status or "interval"
+      )
+      if self._wait_until(at):
+        break
+      self._run_pass(self.autoscaler.reconcile, status)
+    self.logger.info("Daemon stopped")
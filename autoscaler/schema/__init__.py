@@ -0,0 +1,61 @@
+"""This is the schema module for Pod autoscaler
+
+Validation schemas are shipped with the package, loaded once and their
+validators are reused. A document whose content has already been
+validated is not validated again
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import yaml
+
+from ..validator import AutoscalerValidator
+
+try:
+  from yaml import CSafeLoader as SafeLoader
+except ImportError:
+  from yaml import SafeLoader
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_validated = set()
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(name):
+  with open(
+    os.path.join(SCHEMA_DIR, f"{name}.json"), "r", encoding="utf-8"
+  ) as validation_rules:
+    return json.load(validation_rules)
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(name):
+  return AutoscalerValidator(load_schema(name))
+
+
+def load_yaml(content):
+  return yaml.load(content, Loader=SafeLoader)
+
+
+def content_hash(content):
+  if isinstance(content, str):
+    content = content.encode("utf-8")
+  return hashlib.sha256(content).hexdigest()
+
+
+def validate(name, document, content):
+  """Return the validation errors, None when the document is valid"""
+  key = (name, content_hash(content))
+  with _lock:
+    if key in _validated:
+      return None
+    v = get_validator(name)
+    if v.validate(document):
+      _validated.add(key)
+      return None
+    return v.errors
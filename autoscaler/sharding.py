@@ -0,0 +1,70 @@
+"""This module contains Shard class
+
+Split the config between several autoscaler replicas with a consistent
+hash ring on the app name, every replica compute the same split without
+talking to the others
+"""
+import bisect
+import hashlib
+
+# Points of every shard on the ring, more points even out the split
+VNODES = 128
+
+
+def _hash(value):
+  ## Python hash() is salted per process, every replica must agree
+  digest = hashlib.sha256(value.encode("utf-8")).digest()
+  return int.from_bytes(digest[:8], "big")
+
+
+class HashRing:
+  """
+  This class map a key to one of count shards
+
+  A key keep its shard when keys are added or removed, and only about
+  1/count of the keys move when a shard is added
+  """
+
+  def __init__(self, count, vnodes=VNODES):
+    self.count = count
+    points = sorted(
+      (_hash(f"shard-{shard}#{vnode}"), shard)
+      for shard in range(count)
+      for vnode in range(vnodes)
+    )
+    self._hashes = [point for point, _ in points]
+    self._shards = [shard for _, shard in points]
+
+  def shard_of(self, key):
+    position = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+    return self._shards[position]
+
+
+class Shard:
+  """
+  This class keep the servers and databases of config owned by shard
+  index out of count, a server database is always in the server shard
+  """
+
+  def __init__(self, index=0, count=1, vnodes=VNODES):
+    if count < 1:
+      raise ValueError(f"SHARD_COUNT should be at least 1, got {count}")
+    if not 0 <= index < count:
+      raise ValueError(
+        f"SHARD_INDEX should be between 0 and {count - 1}, got {index}"
+      )
+    self.index = index
+    self.count = count
+    self.ring = HashRing(count, vnodes) if count > 1 else None
+
+  def owns(self, name):
+    return self.ring is None or self.ring.shard_of(name) == self.index
+
+  def filter_config(self, config):
+    if self.ring is None:
+      return config
+    sharded = dict(config)
+    for section in ("server", "database"):
+      if config.get(section) is not None:
+        sharded[section] = [x for x in config[section] if self.owns(x["name"])]
+    return sharded
@@ -2,22 +2,75 @@
 This module contains SlackBot class
 """
 
-import json, os
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
 import time
-from dotenv import load_dotenv
+
 import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 from .slackbot_enum import SLACKBOTENUM
 
 load_dotenv()
 
+SLACK_URL = "https://slack.com/api/chat.postMessage"
+
+
+class TokenBucket:
+  """
+  This class pace the messages sent to a Slack channel
+
+  Allow a burst of capacity messages, then rate messages per second
+  """
+
+  def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+    self.rate = rate
+    self.capacity = capacity
+    self.tokens = capacity
+    self.clock = clock
+    self.sleep = sleep
+    self.updated_at = clock()
+
+  def acquire(self):
+    while True:
+      now = self.clock()
+      self.tokens = min(
+        self.capacity, self.tokens + (now - self.updated_at) * self.rate
+      )
+      self.updated_at = now
+      if self.tokens >= 1:
+        self.tokens -= 1
+        return
+      self.sleep((1 - self.tokens) / self.rate)
+
+
 class SlackBot:
   """
   This class is used to send message to Slack channel
+
+  Messages are buffered by a background sender and posted as a single
+  digest per run when flush is called, so posting never block scaling.
+  The sender reuse one pooled session, pace each channel and retry when
+  Slack rate limit the message
   """
 
-  def __init__(self, secret):
+  # Maximum attachments in a single chat.postMessage
+  max_attachments = 20
+  # Maximum lines in a single attachment
+  max_lines = 50
+  max_retries = 3
+  # Longest time to wait before retrying, in seconds
+  max_retry_after = 30
+
+  def __init__(self, secret, on_post=None):
     self.secret = secret
+    # Called with True/False after every message posted or given up
+    self.on_post = on_post
     self.token = self.secret["slack"]["token"]
     self.channel = self._get_slack_channel()
     self.footer_icon = (
@@ -27,7 +80,24 @@ class SlackBot:
     self.title_link = (
       f"{self._get_slack_redirect()}"
     )
-    self.time = time.time()
+    self.logger = logging.getLogger("pod-autoscaler")
+    self.session = requests.Session()
+    self.session.mount("https://", HTTPAdapter(pool_maxsize=1))
+    self.rate = self._get_slack_rate()
+    self._buckets = {}
+    self._sleep = time.sleep
+    # Notifications buffered until the next digest, the ones that do not
+    # fit are counted in _dropped
+    self.queue_size = self._get_slack_queue_size()
+    self._events = queue.Queue(maxsize=self.queue_size)
+    self._buffer = []
+    self._dropped = 0
+    self._dropped_lock = threading.Lock()
+    self._sender = threading.Thread(
+      target=self._run_sender, name="slack-sender", daemon=True
+    )
+    self._sender.start()
+    atexit.register(self.flush)
 
   def _get_slack_channel(self) -> str:
     try:
@@ -38,6 +108,31 @@ class SlackBot:
       slack_channel = "#alerts-autoscaler"
       return slack_channel
 
+  def _get_slack_rate(self) -> float:
+    try:
+      rate = float(os.environ['SLACKRATE'])
+      ## The bucket wait 1 / rate seconds between messages
+      if rate <= 0:
+        raise ValueError(f"SLACKRATE should be above 0, got {rate}")
+      return rate
+    except KeyError:
+      return 1.0
+    except ValueError as err:
+      self.logger.warning("Environment variable SLACKRATE error: %s", err)
+      return 1.0
+
+  def _get_slack_queue_size(self) -> int:
+    try:
+      size = int(os.environ['SLACKQUEUESIZE'])
+      if size < 1:
+        raise ValueError(f"SLACKQUEUESIZE should be at least 1, got {size}")
+      return size
+    except KeyError:
+      return 1000
+    except ValueError as err:
+      self.logger.warning("Environment variable SLACKQUEUESIZE error: %s", err)
+      return 1000
+
   def _get_slack_redirect(self) -> str:
     try:
       slack_redirect = os.environ['SLACKREDIRECT']
@@ -82,10 +177,32 @@ class SlackBot:
           "title": "WARN: Pod scaling failed for: {s}",
           "text": warn_text_message + "\n\nDetails:\n{m}",
         },
+        "deadline": {
+          "title": "WARN: Run deadline reached, {s} deferred",
+          "text": "\n\nDetails:\n{m}",
+        },
+      },
+    }
+    ## A type without its own message still get posted, a KeyError would
+    ## drop the whole digest it is part of
+    generic = {
+      SLACKBOTENUM.ERROR.value: {
+        "title": "ERROR: {t} failed for: {s}",
+        "text": "\n\nDetails:\n{m}",
+      },
+      SLACKBOTENUM.WARNING.value: {
+        "title": "WARN: {t} skipped for: {s}",
+        "text": "\n\nDetails:\n{m}",
       },
     }
 
-    return message_criteria[current_status][server_type]
+    criteria = message_criteria[current_status].get(server_type)
+    if criteria is None:
+      self.logger.warning(
+        "No slack message for %s %s", current_status, server_type
+      )
+      criteria = generic[current_status]
+    return criteria
 
   def get_fail_message(self, server_type, server, message):
     fail = [
@@ -100,7 +217,7 @@ class SlackBot:
         ].format(t=server_type, s=server, m=message),
         "footer": "Pod Autoscaler",
         "footer_icon": self.footer_icon,
-        "ts": self.time,
+        "ts": time.time(),
       }
     ]
     return fail
@@ -118,35 +235,168 @@ class SlackBot:
         ].format(t=server_type, s=server, m=message),
         "footer": "Pod Autoscaler",
         "footer_icon": self.footer_icon,
-        "ts": self.time,
+        "ts": time.time(),
       }
     ]
     return warn
 
+  def get_digest_message(self, events, ts=None):
+    ts = time.time() if ts is None else ts
+    groups = {}
+    for current_status, server_type, staging, message in events:
+      groups.setdefault((current_status, server_type), []).append(
+        (staging, message)
+      )
+    colors = {
+      SLACKBOTENUM.ERROR.value: "#DC143C",
+      SLACKBOTENUM.WARNING.value: "#F4BB44",
+    }
+    ## Errors first, then warnings, each grouped by scaling type
+    order = [SLACKBOTENUM.ERROR.value, SLACKBOTENUM.WARNING.value]
+    digest = []
+    for (current_status, server_type), items in sorted(
+      groups.items(), key=lambda x: order.index(x[0][0])
+    ):
+      criteria = self.message_creator(current_status, server_type)
+      for i in range(0, len(items), self.max_lines):
+        chunk = items[i : i + self.max_lines]
+        stagings = ", ".join(dict.fromkeys(staging for staging, _ in chunk))
+        digest.append(
+          {
+            "color": colors[current_status],
+            "title": criteria["title"].format(t=server_type, s=stagings, m=""),
+            "title_link": self.title_link,
+            "text": "\n".join(
+              f"• {staging}: {message}" for staging, message in chunk
+            ),
+            "footer": "Pod Autoscaler",
+            "footer_icon": self.footer_icon,
+            "ts": ts,
+          }
+        )
+    return digest
+
+  def _bucket(self, channel):
+    if channel not in self._buckets:
+      self._buckets[channel] = TokenBucket(self.rate, sleep=self._sleep)
+    return self._buckets[channel]
+
+  def _retry_after(self, response):
+    try:
+      return float(response.headers.get("Retry-After", 1))
+    except ValueError:
+      return 1.0
+
+  def _send(self, payload):
+    """Post a message, retrying on rate limit and server errors"""
+    for attempt in range(self.max_retries + 1):
+      self._bucket(payload["channel"]).acquire()
+      try:
+        response = self.session.post(SLACK_URL, payload, timeout=5)
+      except requests.exceptions.RequestException as reqerr:
+        self.logger.warning("Failed to post slack message: %s", reqerr)
+        delay = 2**attempt
+      else:
+        if response.status_code == 429:
+          delay = self._retry_after(response)
+        elif response.status_code >= 500:
+          delay = 2**attempt
+        else:
+          try:
+            body = response.json()
+          except ValueError:
+            body = {"ok": False, "error": response.text}
+          if body.get("ok"):
+            return True
+          if body.get("error") != "ratelimited":
+            self.logger.error("Slack rejected message: %s", body.get("error"))
+            return False
+          delay = self._retry_after(response)
+      if attempt < self.max_retries:
+        self._sleep(min(delay, self.max_retry_after))
+    self.logger.error("Giving up slack message after %s retries", attempt)
+    return False
+
+  def _post_digest(self):
+    with self._dropped_lock:
+      dropped, self._dropped = self._dropped, 0
+    if not self._buffer and not dropped:
+      return
+    events, self._buffer = self._buffer, []
+    ts = time.time()
+    attachments = self.get_digest_message(events, ts)
+    if dropped:
+      attachments.append(
+        {
+          "color": "#F4BB44",
+          "title": f"WARN: {dropped} notification(s) dropped, queue was full",
+          "footer": "Pod Autoscaler",
+          "footer_icon": self.footer_icon,
+          "ts": ts,
+        }
+      )
+    for i in range(0, len(attachments), self.max_attachments):
+      sent = self._send(
+        {
+          "token": self.token,
+          "channel": self.channel,
+          "text": None,
+          "attachments": json.dumps(attachments[i : i + self.max_attachments]),
+        }
+      )
+      if self.on_post is not None:
+        self.on_post(sent)
+
+  def _run_sender(self):
+    while True:
+      event = self._events.get()
+      if event is None:
+        return
+      if isinstance(event, threading.Event):
+        ## A failed digest must not stop the sender or block flush
+        try:
+          self._post_digest()
+        # pylint: disable=broad-except
+        except Exception as err:
+          self.logger.error("Failed to post slack digest: %s", err)
+        finally:
+          event.set()
+      elif len(self._buffer) >= self.queue_size:
+        with self._dropped_lock:
+          self._dropped += 1
+      else:
+        self._buffer.append(event)
+
+  def _put(self, event):
+    ## Never block the caller, count what does not fit in the queue
+    try:
+      self._events.put_nowait(event)
+    except queue.Full:
+      with self._dropped_lock:
+        self._dropped += 1
+
+  def flush(self, timeout=60):
+    """Post everything buffered so far as one digest"""
+    done = threading.Event()
+    try:
+      self._events.put(done, timeout=timeout)
+    except queue.Full:
+      return False
+    return done.wait(timeout)
+
+  def close(self, timeout=60):
+    """Post everything buffered, then stop the sender"""
+    self.flush(timeout)
+    atexit.unregister(self.flush)
+    try:
+      self._events.put(None, timeout=timeout)
+    except queue.Full:
+      pass
+    self._sender.join(timeout)
+    self.session.close()
+
   def post_warn_message_to_slack(self, server_type, staging, message):
-    return requests.post(
-      "https://slack.com/api/chat.postMessage",
-      {
-        "token": self.token,
-        "channel": self.channel,
-        "text": None,
-        "attachments": json.dumps(
-          self.get_warn_message(server_type, staging, message)
-        ),
-      },
-      timeout=5,
-    ).json()
+    self._put((SLACKBOTENUM.WARNING.value, server_type, staging, message))
 
   def post_fail_message_to_slack(self, server_type, staging, message):
-    return requests.post(
-      "https://slack.com/api/chat.postMessage",
-      {
-        "token": self.token,
-        "channel": self.channel,
-        "text": None,
-        "attachments": json.dumps(
-          self.get_fail_message(server_type, staging, message)
-        ),
-      },
-      timeout=5,
-    ).json()
+    self._put((SLACKBOTENUM.ERROR.value, server_type, staging, message))
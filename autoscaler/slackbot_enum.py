@@ -11,6 +11,7 @@ class SCALINGTYPE(Enum):
   INIT = "init"
   TOKEN = "token"
   SYNC = "sync"
+  DEADLINE = "deadline"
 
 
 class SLACKBOTENUM(Enum):
@@ -0,0 +1,117 @@
+"""This module contains StateStore class
+
+SQLite record of the last applied or observed state of every target
+(autosync, deployment replicas, database status) so that targets already
+in their desired state can be decided without reading them live
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Kinds of target recorded in the store
+APPLICATION = "application"
+DEPLOYMENT = "deployment"
+DATABASE = "database"
+DB_INSTANCE = "db_instance"
+
+
+class StateStore:
+  """
+  This class read and write the state of a target, a record is only
+  returned for ttl seconds after it was written
+
+  A store without path or with a ttl of 0 is disabled, it never return a
+  record. A full reconcile is due every full_reconcile_interval seconds,
+  the store is not used during a full reconcile
+  """
+
+  def __init__(self, path, ttl, full_reconcile_interval=86400, clock=None):
+    self.logger = logging.getLogger("pod-autoscaler")
+    self.path = path
+    self.ttl = ttl
+    self.full_reconcile_interval = full_reconcile_interval
+    self.clock = clock or time.time
+    self._lock = threading.Lock()
+    self._connection = None
+
+  @property
+  def enabled(self):
+    return bool(self.path) and self.ttl > 0
+
+  def _connect(self):
+    if self._connection is None:
+      directory = os.path.dirname(self.path)
+      if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+      connection = sqlite3.connect(self.path, check_same_thread=False)
+      connection.execute(
+        "CREATE TABLE IF NOT EXISTS state ("
+        " kind TEXT NOT NULL, target TEXT NOT NULL, value TEXT NOT NULL,"
+        " updated_at REAL NOT NULL, PRIMARY KEY (kind, target))"
+      )
+      connection.execute(
+        "CREATE TABLE IF NOT EXISTS meta"
+        " (key TEXT PRIMARY KEY, value REAL NOT NULL)"
+      )
+      connection.commit()
+      self._connection = connection
+    return self._connection
+
+  def _execute(self, query, params=()):
+    ## A broken store disable itself, every target is then read live
+    with self._lock:
+      if not self.enabled:
+        return None
+      try:
+        return self._connect().execute(query, params).fetchone()
+      except (sqlite3.Error, OSError) as err:
+        self.logger.warning("State store disabled: %s", err)
+        self.path = None
+        return None
+
+  def get(self, kind, target):
+    row = self._execute(
+      "SELECT value, updated_at FROM state WHERE kind = ? AND target = ?",
+      (kind, target),
+    )
+    if row is None or self.clock() - row[1] >= self.ttl:
+      return None
+    return json.loads(row[0])
+
+  def put(self, kind, target, value):
+    self._execute(
+      "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+      (kind, target, json.dumps(value), self.clock()),
+    )
+
+  def needs_full_reconcile(self):
+    row = self._execute("SELECT value FROM meta WHERE key = 'full_reconcile'")
+    return (
+      row is None or self.clock() - row[0] >= self.full_reconcile_interval
+    )
+
+  def mark_full_reconcile(self):
+    self._execute(
+      "INSERT OR REPLACE INTO meta VALUES ('full_reconcile', ?)",
+      (self.clock(),),
+    )
+
+  def commit(self):
+    ## Writes are committed once per run instead of once per target
+    with self._lock:
+      if self._connection is None:
+        return
+      try:
+        self._connection.commit()
+      except sqlite3.Error as err:
+        self.logger.warning("Failed to save state store: %s", err)
+
+  def close(self):
+    self.commit()
+    with self._lock:
+      if self._connection is not None:
+        self._connection.close()
+        self._connection = None
@@ -0,0 +1,88 @@
+"""This module contains TokenCache class
+
+File backed cache of the ArgoCD session token so that it can be reused
+across runs until shortly before it expires
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+
+
+def decode_expiry(token):
+  """Return the exp claim of a JWT, None when it cannot be read"""
+  try:
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    claims = json.loads(base64.urlsafe_b64decode(payload))
+    return float(claims["exp"])
+  except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+    return None
+
+
+class TokenCache:
+  """
+  This class read and write the session token to a file only readable
+  by the current user
+
+  The token is keyed by argocd url and username, and only returned while
+  it is valid for more than refresh_before seconds
+  """
+
+  def __init__(self, path, url, username, refresh_before=300):
+    self.path = path
+    self.key = hashlib.sha256(f"{url}|{username}".encode()).hexdigest()
+    self.refresh_before = refresh_before
+
+  def is_fresh(self, token, now=None):
+    expiry = decode_expiry(token)
+    if expiry is None:
+      return False
+    now = time.time() if now is None else now
+    return expiry - self.refresh_before > now
+
+  def _read(self):
+    ## Return the cached entry of this url and username, None otherwise
+    if not self.path:
+      return None
+    try:
+      with open(self.path, "r", encoding="utf-8") as stream:
+        data = json.load(stream)
+    except (OSError, ValueError):
+      return None
+    if not isinstance(data, dict) or data.get("key") != self.key:
+      return None
+    return data
+
+  def load(self):
+    data = self._read()
+    if data is None:
+      return None
+    token = data.get("token")
+    if isinstance(token, str) and self.is_fresh(token):
+      return token
+    return None
+
+  def clear(self):
+    ## Only the token of this url and username is removed
+    if self._read() is None:
+      return
+    try:
+      os.remove(self.path)
+    except OSError:
+      pass
+
+  def store(self, token):
+    ## Token without expiry cannot be safely reused
+    if not self.path or decode_expiry(token) is None:
+      return
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, mode=0o700, exist_ok=True)
+    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as stream:
+      json.dump({"key": self.key, "token": token}, stream)
+    os.replace(tmp_path, self.path)
@@ -0,0 +1,6 @@
+"""Offline benchmarks for Pod autoscaler
+
+Stand-ins for the ArgoCD api and the RDS client with configurable fleet
+size, latency and error rate, so that a whole run can be timed without
+a live cluster or AWS account
+"""
@@ -0,0 +1,189 @@
+"""This module contains FakeArgoCD class
+
+Local HTTP stand-in of the ArgoCD api endpoints used by the autoscaler
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API = "/api/v1"
+
+
+def route_name(method, path):
+  """Group the requests by endpoint, e.g. GET managed-resources"""
+  parts = path[len(API) :].strip("/").split("/")
+  if len(parts) == 2:
+    return f"{method} application"
+  return f"{method} {parts[-1] if len(parts) > 2 else parts[0]}"
+
+
+def app_name(index):
+  ## Zero padded so that no name is a substring of another
+  return f"app-{index:05d}"
+
+
+class FakeArgoCD:
+  """
+  This class serve apps applications with deployments deployments each
+
+  Every request wait latency seconds (plus up to jitter), error_rate of
+  them answer 503. Patched replicas are kept so that a second run see
+  the first one's changes
+  """
+
+  def __init__(
+    self,
+    apps=10,
+    deployments=3,
+    replicas=1,
+    latency=0.0,
+    jitter=0.0,
+    error_rate=0.0,
+    seed=0,
+  ):
+    self.names = [app_name(i) for i in range(apps)]
+    self.latency = latency
+    self.jitter = jitter
+    self.error_rate = error_rate
+    self.random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.requests = {}
+    self.applications = {}
+    self.replicas = {}
+    for name in self.names:
+      resources = [
+        {
+          "group": "apps",
+          "version": "v1",
+          "kind": "Deployment",
+          "namespace": name,
+          "name": f"{name}-web-{i}" if i else f"{name}-sidekiq",
+        }
+        for i in range(deployments)
+      ]
+      self.applications[name] = {
+        "metadata": {"name": name},
+        "spec": {"syncPolicy": {"automated": {"prune": True}}},
+        "status": {"resources": resources},
+      }
+      for resource in resources:
+        self.replicas[(name, resource["name"])] = replicas
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+    self.server.daemon_threads = True
+    self._thread = threading.Thread(
+      target=self.server.serve_forever, name="fake-argocd", daemon=True
+    )
+
+  @property
+  def url(self):
+    return f"http://127.0.0.1:{self.server.server_address[1]}{API}"
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.stop()
+
+  def request_count(self):
+    with self._lock:
+      return sum(self.requests.values())
+
+  def delay_and_fail(self, route):
+    """Count a request of route, wait its latency and return if it fail"""
+    with self._lock:
+      self.requests[route] = self.requests.get(route, 0) + 1
+      delay = self.latency + self.jitter * self.random.random()
+      failed = self.random.random() < self.error_rate
+    if delay:
+      time.sleep(delay)
+    return failed
+
+  def _live_state(self, name, resource):
+    replicas = self.replicas[(name, resource["name"])]
+    return {
+      "kind": resource["kind"],
+      "namespace": resource["namespace"],
+      "name": resource["name"],
+      "liveState": json.dumps({"spec": {"replicas": replicas}}),
+    }
+
+  def route(self, method, path, query, body):
+    """Return (status, json body) of a request"""
+    parts = path[len(API) :].strip("/").split("/")
+    if method == "POST" and parts == ["session"]:
+      return 200, {"token": "fake-token"}
+    if parts[0] != "applications":
+      return 404, {"message": "not found"}
+    if len(parts) == 1:
+      items = [self.applications[name] for name in self.names]
+      return 200, {"items": items}
+    name = parts[1]
+    if name not in self.applications:
+      return 404, {"message": f"application {name} not found"}
+    application = self.applications[name]
+    if len(parts) == 2 and method == "GET":
+      return 200, application
+    if len(parts) == 2 and method == "PUT":
+      with self._lock:
+        application["spec"] = body["spec"]
+      return 200, application
+    resources = application["status"]["resources"]
+    if parts[2] == "managed-resources":
+      return 200, {"items": [self._live_state(name, x) for x in resources]}
+    if parts[2] == "resource":
+      resource = query["name"][0]
+      if (name, resource) not in self.replicas:
+        return 404, {"message": f"resource {resource} not found"}
+      if method == "POST":
+        ## The autoscaler send the merge patch as a json encoded string
+        patch = json.loads(body) if isinstance(body, str) else body
+        with self._lock:
+          self.replicas[(name, resource)] = patch["spec"]["replicas"]
+      replicas = self.replicas[(name, resource)]
+      return 200, {"manifest": json.dumps({"spec": {"replicas": replicas}})}
+    return 404, {"message": "not found"}
+
+  def _handler(self):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      """Answer every request with the route of the fake"""
+
+      protocol_version = "HTTP/1.1"
+      # Headers and body are written apart, do not wait for their ack
+      disable_nagle_algorithm = True
+
+      def _reply(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if fake.delay_and_fail(route_name(self.command, url.path)):
+          status, response = 503, {"message": "injected error"}
+        else:
+          status, response = fake.route(
+            self.command, url.path, parse_qs(url.query), body
+          )
+        content = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+      do_GET = do_PUT = do_POST = _reply
+
+      def log_message(self, *args):
+        pass
+
+    return Handler
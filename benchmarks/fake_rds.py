@@ -0,0 +1,107 @@
+"""This module contains FakeRDS class
+
+In-memory stand-in of the boto3 RDS client calls used by the autoscaler
+"""
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from .fake_argocd import app_name
+
+
+def throttling_error(operation):
+  return ClientError(
+    {
+      "Error": {"Code": "Throttling", "Message": "injected error"},
+      "ResponseMetadata": {"HTTPStatusCode": 400},
+    },
+    operation,
+  )
+
+
+class _Paginator:
+  def __init__(self, rds, page_size):
+    self.rds = rds
+    self.page_size = page_size
+
+  def paginate(self, **kwargs):
+    instances = self.rds.describe_all()
+    for i in range(0, max(len(instances), 1), self.page_size):
+      yield {"DBInstances": instances[i : i + self.page_size]}
+
+
+class FakeRDS:
+  """
+  This class hold instances RDS instances named after the fake apps
+
+  Every call wait latency seconds, error_rate of them raise a throttling
+  ClientError. Instances reach their new status right away
+  """
+
+  def __init__(
+    self,
+    instances=10,
+    status="available",
+    instance_class="db.t3.medium",
+    latency=0.0,
+    error_rate=0.0,
+    page_size=100,
+    seed=0,
+  ):
+    self.latency = latency
+    self.error_rate = error_rate
+    self.page_size = page_size
+    self.random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.calls = {}
+    self.instances = {
+      f"{app_name(i)}-v1": {
+        "DBInstanceIdentifier": f"{app_name(i)}-v1",
+        "DBInstanceStatus": status,
+        "DBInstanceClass": instance_class,
+        "MultiAZ": False,
+      }
+      for i in range(instances)
+    }
+
+  def call_count(self):
+    with self._lock:
+      return sum(self.calls.values())
+
+  def _call(self, operation):
+    with self._lock:
+      self.calls[operation] = self.calls.get(operation, 0) + 1
+      failed = self.random.random() < self.error_rate
+    if self.latency:
+      time.sleep(self.latency)
+    if failed:
+      raise throttling_error(operation)
+
+  def describe_all(self):
+    self._call("DescribeDBInstances")
+    with self._lock:
+      return [dict(x) for x in self.instances.values()]
+
+  def get_paginator(self, operation_name):
+    return _Paginator(self, self.page_size)
+
+  def describe_db_instances(self, DBInstanceIdentifier):
+    self._call("DescribeDBInstances")
+    with self._lock:
+      return {"DBInstances": [dict(self.instances[DBInstanceIdentifier])]}
+
+  def _set_status(self, operation, identifier, status):
+    self._call(operation)
+    with self._lock:
+      self.instances[identifier]["DBInstanceStatus"] = status
+    return {"DBInstance": {"DBInstanceIdentifier": identifier}}
+
+  def stop_db_instance(self, DBInstanceIdentifier):
+    return self._set_status("StopDBInstance", DBInstanceIdentifier, "stopped")
+
+  def start_db_instance(self, DBInstanceIdentifier):
+    return self._set_status(
+      "StartDBInstance", DBInstanceIdentifier, "available"
+    )
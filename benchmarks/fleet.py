@@ -0,0 +1,201 @@
+"""This is the fleet benchmark for Pod autoscaler
+
+Time a whole run against FakeArgoCD and FakeRDS for synthetic fleets,
+e.g. python -m benchmarks.fleet --apps 10,100,1000,5000
+
+--output save the results as json, --baseline compare against saved
+results and exit 1 when a fleet got slower than --tolerance allow
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import yaml
+
+from autoscaler import AutoScaler
+
+from .fake_argocd import FakeArgoCD
+from .fake_rds import FakeRDS
+
+
+def write_fleet(directory, apps):
+  config_name = os.path.join(directory, "config.yml")
+  secret_name = os.path.join(directory, "secret.yml")
+  config = {
+    "server": [
+      {"name": name, "autoscaledown": True, "operate_day": "weekdays"}
+      for name in apps
+    ]
+  }
+  secret = {
+    "argocd": {"username": "benchmark", "password": "benchmark"},
+    "aws": {
+      "aws_access_key_id": "benchmark",
+      "aws_secret_access_key": "benchmark",
+      "region_name": "ap-southeast-1",
+    },
+  }
+  with open(config_name, "w", encoding="utf-8") as f:
+    yaml.safe_dump(config, f)
+  with open(secret_name, "w", encoding="utf-8") as f:
+    yaml.safe_dump(secret, f)
+  return config_name, secret_name
+
+
+def run_fleet(
+  apps,
+  deployments=3,
+  status="night",
+  discovery="bulk",
+  workers=10,
+  argocd_latency=0.0,
+  rds_latency=0.0,
+  error_rate=0.0,
+  repeat=1,
+  verbose=False,
+):
+  """Return the timings of repeat runs, each against a fresh fleet"""
+  timings = []
+  for _ in range(repeat):
+    ## Pods are scaled down at night and up in the morning
+    replicas = 1 if status == "night" else 0
+    db_status = "available" if status == "night" else "stopped"
+    argocd = FakeArgoCD(
+      apps,
+      deployments,
+      replicas=replicas,
+      latency=argocd_latency,
+      error_rate=error_rate,
+    )
+    rds = FakeRDS(
+      apps, status=db_status, latency=rds_latency, error_rate=error_rate
+    )
+    with argocd, tempfile.TemporaryDirectory() as directory:
+      config_name, secret_name = write_fleet(directory, argocd.names)
+      environ = {
+        "URL": argocd.url,
+        "STATUS": status,
+        "DAY": "Monday",
+        "LOGLEVEL": "ERROR",
+        "WORKERS": str(workers),
+        "DISCOVERY": discovery,
+        "TOKEN_CACHE": os.path.join(directory, "token.json"),
+        "STATE_STORE": os.path.join(directory, "state.db"),
+        "STATE_TTL": "0",
+        "DB_WAIT_TIMEOUT": "0",
+        "RETRY_BACKOFF": "0.01",
+        "RETRY_MAX_DELAY": "0.05",
+      }
+      with mock.patch.dict(os.environ, environ):
+        start = time.perf_counter()
+        autoscaler = AutoScaler(
+          config_name, secret_name, rds_client_factory=lambda _, rds=rds: rds
+        )
+        if not verbose:
+          autoscaler.logger.setLevel(logging.CRITICAL)
+        initialised = time.perf_counter()
+        plan = autoscaler.run()
+        finished = time.perf_counter()
+        autoscaler.argocd.close()
+    timings.append(
+      {
+        "init_seconds": initialised - start,
+        "run_seconds": finished - initialised,
+        "changes": len(plan),
+        "argocd_requests": argocd.request_count(),
+        "rds_calls": rds.call_count(),
+      }
+    )
+  best = min(timings, key=lambda x: x["run_seconds"])
+  return dict(
+    best,
+    apps=apps,
+    deployments=deployments,
+    apps_per_second=apps / best["run_seconds"],
+  )
+
+
+def check_regression(results, baseline, tolerance):
+  """Return a message for every fleet slower than baseline * (1 + tolerance)"""
+  previous = {x["apps"]: x for x in baseline}
+  regressions = []
+  for result in results:
+    before = previous.get(result["apps"])
+    if before is None:
+      continue
+    limit = before["run_seconds"] * (1 + tolerance)
+    if result["run_seconds"] > limit:
+      regressions.append(
+        f"{result['apps']} apps: {result['run_seconds']:.3f}s, baseline"
+        f" {before['run_seconds']:.3f}s (+{tolerance:.0%} allowed)"
+      )
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="benchmarks.fleet")
+  parser.add_argument("--apps", default="10,100,1000")
+  parser.add_argument("--deployments", type=int, default=3)
+  parser.add_argument("--status", choices=["night", "morning"], default="night")
+  parser.add_argument("--discovery", choices=["single", "bulk"], default="bulk")
+  parser.add_argument("--workers", type=int, default=10)
+  parser.add_argument(
+    "--argocd-latency", type=float, default=0.0, help="seconds per request"
+  )
+  parser.add_argument(
+    "--rds-latency", type=float, default=0.0, help="seconds per call"
+  )
+  parser.add_argument(
+    "--error-rate", type=float, default=0.0, help="share of failed calls"
+  )
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument("--output", help="save the results as json")
+  parser.add_argument("--baseline", help="results json to compare against")
+  parser.add_argument("--tolerance", type=float, default=0.25)
+  parser.add_argument("--verbose", action="store_true")
+  args = parser.parse_args(argv)
+
+  results = []
+  print(
+    f"{'apps':>6} {'run (s)':>9} {'init (s)':>9} {'apps/s':>9}"
+    f" {'changes':>8} {'argocd':>7} {'rds':>6}"
+  )
+  for apps in (int(x) for x in args.apps.split(",")):
+    result = run_fleet(
+      apps,
+      deployments=args.deployments,
+      status=args.status,
+      discovery=args.discovery,
+      workers=args.workers,
+      argocd_latency=args.argocd_latency,
+      rds_latency=args.rds_latency,
+      error_rate=args.error_rate,
+      repeat=args.repeat,
+      verbose=args.verbose,
+    )
+    results.append(result)
+    print(
+      f"{apps:>6} {result['run_seconds']:>9.3f} {result['init_seconds']:>9.3f}"
+      f" {result['apps_per_second']:>9.1f} {result['changes']:>8}"
+      f" {result['argocd_requests']:>7} {result['rds_calls']:>6}"
+    )
+
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+  if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+      regressions = check_regression(results, json.load(f), args.tolerance)
+    for regression in regressions:
+      print(f"Regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,104 @@
+## Fixtures shared by the unit tests running an AutoScaler
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from autoscaler import AutoScaler
+
+MOCK_URL = "http://test.com"
+
+SECRET = {"argocd": {"username": "autoscaler", "password": "password"}}
+
+AWS_SECRET = dict(
+  SECRET,
+  aws={
+    "aws_access_key_id": "key",
+    "aws_secret_access_key": "secret",
+    "region_name": "ap-southeast-1",
+  },
+)
+
+ENVIRON = {
+  "URL": MOCK_URL,
+  "LOGLEVEL": "ERROR",
+  "STATUS": "night",
+  "DAY": "Monday",
+}
+
+
+def server(name, autoscaledown=True, operate_day="weekdays", **entry):
+  return dict(
+    entry, name=name, autoscaledown=autoscaledown, operate_day=operate_day
+  )
+
+
+def deployment(name):
+  return {
+    "group": "apps",
+    "version": "v1",
+    "kind": "Deployment",
+    "namespace": "staging",
+    "name": name,
+  }
+
+
+def managed_resource(name, replicas):
+  return {
+    "kind": "Deployment",
+    "namespace": "staging",
+    "name": name,
+    "liveState": json.dumps({"spec": {"replicas": replicas}}),
+  }
+
+
+def db_instance(identifier, status="available", **fields):
+  return dict(
+    fields, DBInstanceIdentifier=identifier, DBInstanceStatus=status
+  )
+
+
+def write_yaml(path, data):
+  with open(path, "w", encoding="utf-8") as f:
+    yaml.safe_dump(data, f)
+
+
+class AutoScalerTestCase(unittest.TestCase):
+  """
+  Base class of the tests running an AutoScaler. setUp write the config
+  of build_config and the secret in a temporary directory, self.rds is
+  the mocked rds client of create_autoscaler
+  """
+
+  secret = SECRET
+
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.config_name = os.path.join(self.tmp.name, "config.yml")
+    self.secret_name = os.path.join(self.tmp.name, "secret.yml")
+    self.config = self.build_config()
+    write_yaml(self.config_name, self.config)
+    write_yaml(self.secret_name, self.secret)
+    self.rds = mock.MagicMock()
+    self.set_db_instances([])
+
+  def build_config(self):
+    return {"server": [server("example")]}
+
+  def set_db_instances(self, instances):
+    self.rds.get_paginator.return_value.paginate.return_value = [
+      {"DBInstances": instances}
+    ]
+
+  def create_autoscaler(self):
+    autoscaler = AutoScaler(
+      config_name=self.config_name,
+      secret_name=self.secret_name,
+      rds_client_factory=lambda _: self.rds,
+    )
+    autoscaler._aws_session()
+    return autoscaler
@@ -1,6 +1,5 @@
 import json
 import os
-import time
 import unittest
 from unittest import mock
 
@@ -8,6 +7,7 @@ import command
 from dotenv import load_dotenv
 
 from autoscaler import AutoScaler
+from autoscaler.db_operations import DatabaseWaiter
 
 load_dotenv()
 
@@ -20,17 +20,13 @@ class TestAutoscaler(unittest.TestCase):
 
   def db_status_checker(self, db_instance):
     if db_instance != None:
+      ## Wait until the instance is no longer transitioning
+      waiter = DatabaseWaiter(self.autoscaler.rds_inventory)
+      waiter.track(db_instance, ("available", "stopped"))
+      waiter.wait(timeout=3600, interval=60)
       status = self.autoscaler._check_db_status(db_instance)
-      while status != "available" and status != "stopped":
-        print(
-          "This prints check every 1 min to see the db status as current"
-          f" status show {status}"
-        )
-        time.sleep(60)
-        status = self.autoscaler._check_db_status(db_instance)
-      else:
-        print(f"{db_instance}: {status}")
-        return status
+      print(f"{db_instance}: {status}")
+      return status
     else:
       print("No instance found")
 
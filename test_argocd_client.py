@@ -0,0 +1,179 @@
+## Unit testing for the pooled argocd client
+import base64
+import json
+import os
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.argocd_client import ArgoCDClient
+from autoscaler.token_cache import TokenCache, decode_expiry
+from fixtures import ENVIRON, MOCK_URL, AutoScalerTestCase
+
+
+def jwt(exp):
+  payload = json.dumps({"sub": "autoscaler", "exp": exp}).encode()
+  encoded = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+  return f"eyJhbGciOiJIUzI1NiJ9.{encoded}.signature"
+
+
+class TestArgoCDClient(unittest.TestCase):
+  def setUp(self):
+    self.client = ArgoCDClient(MOCK_URL, pool_size=4)
+
+  def tearDown(self):
+    self.client.close()
+
+  def test_token_and_headers_are_reused(self):
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      m.get(f"{MOCK_URL}/applications/example", json={})
+      result = self.client.create_session("autoscaler", "password")
+      self.client.set_token(result.json()["token"])
+      self.client.get_application("example")
+
+      login, app = m.request_history
+      self.assertEqual(
+        login.json(), {"username": "autoscaler", "password": "password"}
+      )
+      self.assertEqual(app.headers["Cookie"], "argocd.token=helloworld")
+      self.assertIn("gzip", app.headers["Accept-Encoding"])
+      self.assertEqual(
+        app.timeout, ArgoCDClient.default_timeouts["get_application"]
+      )
+
+  def test_timeout_override(self):
+    client = ArgoCDClient(MOCK_URL, timeouts={"patch_resource": (1, 2)})
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/applications/example/resource", json={})
+      client.patch_resource("example", {"name": "web"}, "{}")
+      self.assertEqual(m.request_history[0].timeout, (1, 2))
+      self.assertEqual(m.request_history[0].qs, {"name": ["web"]})
+    client.close()
+
+
+class TestTokenRenewal(unittest.TestCase):
+  def setUp(self):
+    self.logins = []
+    self.tokens = [jwt(time.time() + 3600), jwt(time.time() + 7200)]
+    self.client = ArgoCDClient(MOCK_URL, authenticate=self.login)
+
+  def login(self, rejected=False):
+    token = self.tokens[len(self.logins)]
+    self.logins.append(token)
+    self.client.set_token(token)
+
+  def test_reauthenticate_on_401(self):
+    self.login()
+    with requests_mock.Mocker() as m:
+      app = m.get(
+        f"{MOCK_URL}/applications/example",
+        [{"status_code": 401}, {"json": {}}],
+      )
+      result = self.client.get_application("example")
+
+    self.assertEqual(result.status_code, 200)
+    self.assertEqual(len(self.logins), 2)
+    self.assertIn(self.tokens[1], app.last_request.headers["Cookie"])
+
+  def test_cached_token_rejected_is_not_throttled(self):
+    def authenticate(rejected=False):
+      if not rejected and not self.logins:
+        ## Reuse a cached token, no login request is made
+        self.client.set_token(jwt(time.time() + 600))
+        return False
+      return self.login()
+
+    self.client.authenticate = authenticate
+    with requests_mock.Mocker() as m:
+      m.get(
+        f"{MOCK_URL}/applications/example",
+        [{"status_code": 401}, {"json": {}}],
+      )
+      result = self.client.get_application("example")
+
+    self.assertEqual(result.status_code, 200)
+    self.assertEqual(self.logins, self.tokens[:1])
+
+  def test_refresh_before_expiry(self):
+    self.client.set_token(jwt(time.time() + 60))
+    with requests_mock.Mocker() as m:
+      m.get(f"{MOCK_URL}/applications/example", json={})
+      self.client.get_application("example")
+
+    self.assertEqual(self.logins, self.tokens[:1])
+
+
+class TestCachedTokenRejected(AutoScalerTestCase):
+  def setUp(self):
+    super().setUp()
+    self.cache_path = os.path.join(self.tmp.name, "token.json")
+    self.revoked = jwt(time.time() + 3600)
+    self.fresh = jwt(time.time() + 7200)
+    TokenCache(self.cache_path, MOCK_URL, "autoscaler").store(self.revoked)
+
+  def test_login_and_retry(self):
+    environ = dict(ENVIRON, TOKEN_CACHE=self.cache_path)
+    with mock.patch.dict(os.environ, environ):
+      autoscaler = self.create_autoscaler()
+
+    def get_application(request, context):
+      ## argocd restarted and no longer accept the cached token
+      if self.revoked in request.headers["Cookie"]:
+        context.status_code = 401
+        return {}
+      return {"metadata": {"name": "example"}}
+
+    with requests_mock.Mocker() as m:
+      login = m.post(f"{MOCK_URL}/session", json={"token": self.fresh})
+      m.get(f"{MOCK_URL}/applications/example", json=get_application)
+      result = autoscaler.argocd.get_application("example")
+
+    self.assertEqual(result.status_code, 200)
+    self.assertEqual(login.call_count, 1)
+    cache = TokenCache(self.cache_path, MOCK_URL, "autoscaler")
+    self.assertEqual(cache.load(), self.fresh)
+    autoscaler.argocd.close()
+
+
+class TestTokenCache(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmp.name, "cache", "token.json")
+    self.cache = TokenCache(self.path, MOCK_URL, "autoscaler")
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_store_and_load(self):
+    expiry = int(time.time()) + 3600
+    token = jwt(expiry)
+    self.assertEqual(decode_expiry(token), expiry)
+    self.cache.store(token)
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+    self.assertEqual(self.cache.load(), token)
+    ## Different account never reuse the token
+    other = TokenCache(self.path, MOCK_URL, "admin")
+    self.assertIsNone(other.load())
+
+  def test_clear(self):
+    self.cache.store(jwt(time.time() + 3600))
+    TokenCache(self.path, MOCK_URL, "admin").clear()
+    self.assertIsNotNone(self.cache.load())
+    self.cache.clear()
+    self.assertIsNone(self.cache.load())
+    self.cache.clear()
+
+  def test_expiring_or_opaque_token_not_reused(self):
+    self.cache.store(jwt(time.time() + 60))
+    self.assertIsNone(self.cache.load())
+    self.cache.store("helloworld")
+    self.assertIsNone(self.cache.load())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,58 @@
+## Unit testing for the offline benchmark harness
+import unittest
+
+from benchmarks.fake_argocd import FakeArgoCD
+from benchmarks.fake_rds import FakeRDS
+from benchmarks.fleet import check_regression, run_fleet
+
+
+class TestBenchmarks(unittest.TestCase):
+  def test_night_fleet(self):
+    result = run_fleet(5, deployments=2, repeat=1)
+    ## autosync, deployments and database of every app
+    self.assertEqual(result["changes"], 5 + 5 * 2 + 5)
+    self.assertEqual(result["apps"], 5)
+    self.assertGreater(result["argocd_requests"], 5)
+
+  def test_morning_fleet_with_errors(self):
+    result = run_fleet(
+      5, status="morning", discovery="single", error_rate=0.2, repeat=1
+    )
+    self.assertGreater(result["run_seconds"], 0)
+    self.assertGreater(result["rds_calls"], 5)
+
+  def test_fake_backends_keep_state(self):
+    rds = FakeRDS(2)
+    rds.stop_db_instance(DBInstanceIdentifier="app-00001-v1")
+    pages = list(rds.get_paginator("describe_db_instances").paginate())
+    self.assertEqual(
+      [x["DBInstanceStatus"] for x in pages[0]["DBInstances"]],
+      ["available", "stopped"],
+    )
+    argocd = FakeArgoCD(1, 1)
+    status, _ = argocd.route(
+      "POST",
+      "/api/v1/applications/app-00000/resource",
+      {"name": ["app-00000-sidekiq"]},
+      '{"spec":{"replicas":0}}',
+    )
+    self.assertEqual(status, 200)
+    self.assertEqual(argocd.replicas[("app-00000", "app-00000-sidekiq")], 0)
+    argocd.server.server_close()
+
+  def test_check_regression(self):
+    baseline = [{"apps": 10, "run_seconds": 1.0}]
+    self.assertEqual(
+      check_regression([{"apps": 10, "run_seconds": 1.2}], baseline, 0.25), []
+    )
+    self.assertEqual(
+      len(check_regression([{"apps": 10, "run_seconds": 1.3}], baseline, 0.25)),
+      1,
+    )
+    self.assertEqual(
+      check_regression([{"apps": 100, "run_seconds": 9}], baseline, 0.25), []
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
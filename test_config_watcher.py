@@ -0,0 +1,151 @@
+## Unit testing for config hot reload in daemon mode
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+import yaml
+
+from autoscaler.config_watcher import ConfigWatcher, diff_entries
+from fixtures import ENVIRON, MOCK_URL, SECRET, AutoScalerTestCase, server
+
+
+def weekend(name, autoscaledown=True):
+  return server(name, autoscaledown, operate_day="weekend")
+
+
+class TestConfigWatcher(AutoScalerTestCase):
+  def build_config(self):
+    return {"server": [weekend(f"app-{i}") for i in range(5)]}
+
+  def write(self, path, data):
+    with open(path, "w", encoding="utf-8") as f:
+      yaml.safe_dump(data, f)
+    ## Make the edit visible even on coarse mtime resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+  def test_diff_entries(self):
+    old = [weekend("a"), weekend("b"), weekend("c")]
+    old[0]["application_status"] = {"spec": {}}
+    new = [weekend("a"), weekend("b", False), weekend("d")]
+    changed, removed = diff_entries(old, new)
+    self.assertEqual([entry["name"] for entry in changed], ["b", "d"])
+    self.assertEqual(removed, {"c"})
+
+  def test_watcher_reports_each_change_once(self):
+    watcher = ConfigWatcher([self.config_name, self.secret_name])
+    self.assertEqual(watcher.changed(), [])
+    self.write(self.config_name, {"server": []})
+    self.assertEqual(watcher.changed(self.secret_name), [])
+    self.assertEqual(watcher.changed(), [self.config_name])
+    self.assertEqual(watcher.changed(), [])
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_reload_only_fetch_changes(self):
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      for i in range(7):
+        name = f"app-{i}"
+        m.get(f"{MOCK_URL}/applications/{name}", json={"name": name})
+      autoscaler = self.create_autoscaler()
+      autoscaler._ensure_application_status()
+      self.assertFalse(autoscaler.reload_config())
+
+      servers = [weekend(f"app-{i}") for i in range(1, 5)]
+      servers[1]["operate_day"] = "weekdays"
+      servers.append(weekend("app-6"))
+      self.write(self.config_name, {"server": servers})
+      m.reset_mock()
+      self.assertTrue(autoscaler.reload_config())
+
+    ## Changed servers are fetched concurrently, in any order
+    fetched = sorted(r.path for r in m.request_history)
+    self.assertEqual(fetched, ["/applications/app-2", "/applications/app-6"])
+    self.assertEqual(
+      [s["name"] for s in autoscaler.config["server"]],
+      ["app-1", "app-2", "app-3", "app-4", "app-6"],
+    )
+    self.assertEqual(autoscaler.config["server"][1]["operate_day"], "weekdays")
+    for s in autoscaler.config["server"]:
+      self.assertEqual(s["application_status"], {"name": s["name"]})
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_reconcile_keep_statuses(self):
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      for i in range(5):
+        name = f"app-{i}"
+        m.get(f"{MOCK_URL}/applications/{name}", json={"name": name})
+      m.get(f"{MOCK_URL}/applications/app-4", status_code=404)
+      autoscaler = self.create_autoscaler()
+      autoscaler.run = mock.MagicMock()
+      autoscaler._ensure_application_status()
+      self.assertEqual(len(autoscaler.config["server"]), 4)
+
+      ## Only the app that could not be fetched is tried again
+      m.get(f"{MOCK_URL}/applications/app-4", json={"name": "app-4"})
+      m.reset_mock()
+      autoscaler.reconcile()
+      self.assertEqual(
+        [r.path for r in m.request_history], ["/applications/app-4"]
+      )
+      self.assertEqual(
+        [s["name"] for s in autoscaler.config["server"]],
+        [f"app-{i}" for i in range(5)],
+      )
+
+      m.reset_mock()
+      autoscaler.reconcile()
+      self.assertEqual(m.call_count, 0)
+
+      ## Every app is fetched again once a full reconcile is due
+      autoscaler.full_reconcile_interval = 0
+      autoscaler.reconcile()
+      autoscaler._ensure_application_status()
+      self.assertEqual(m.call_count, 5)
+
+      ## And on every change of the time of day
+      autoscaler.full_reconcile_interval = 86400
+      m.reset_mock()
+      autoscaler.reconcile()
+      self.assertEqual(m.call_count, 0)
+      autoscaler.reconcile("morning")
+      autoscaler._ensure_application_status()
+      self.assertEqual(m.call_count, 5)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_slack_reload_stop_the_old_bot(self):
+    self.write(self.secret_name, dict(SECRET, slack={"token": "xoxb-old"}))
+    autoscaler = self.create_autoscaler()
+    old = autoscaler.slack
+    self.write(self.secret_name, dict(SECRET, slack={"token": "xoxb-new"}))
+    self.assertTrue(autoscaler.reload_config())
+    self.assertFalse(old._sender.is_alive())
+    self.assertEqual(autoscaler.slack.token, "xoxb-new")
+    self.assertTrue(autoscaler.slack._sender.is_alive())
+    autoscaler.slack.close()
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_invalid_reload_keep_config(self):
+    autoscaler = self.create_autoscaler()
+    config = autoscaler.config
+    self.write(self.config_name, {"server": [{"name": "app-0"}]})
+    self.assertFalse(autoscaler.reload_config())
+    self.assertIs(autoscaler.config, config)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_secret_reload_login_again(self):
+    autoscaler = self.create_autoscaler()
+    autoscaler.argocd.set_token("helloworld")
+    autoscaler.cookies = {"argocd.token": "helloworld"}
+    secret = {"argocd": {"username": "autoscaler", "password": "rotated"}}
+    self.write(self.secret_name, secret)
+    self.assertTrue(autoscaler.reload_config())
+    self.assertEqual(autoscaler.secret, secret)
+    self.assertIsNone(autoscaler.argocd.token)
+    self.assertEqual(autoscaler.cookies, {})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,194 @@
+## Unit testing for the run deadline and phase budgets
+import math
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.deadline import Deadline, parse_budgets
+from autoscaler.plan import Plan
+from autoscaler.rds_inventory import instance_cost
+from autoscaler.slackbot_enum import SCALINGTYPE
+from fixtures import (
+  AWS_SECRET,
+  ENVIRON,
+  MOCK_URL,
+  AutoScalerTestCase,
+  db_instance,
+  deployment,
+  managed_resource,
+  server,
+)
+
+ENVIRON = dict(
+  ENVIRON, WORKERS="1", PHASE_BUDGETS="deployments=50, databases=300"
+)
+
+
+class TestDeadline(AutoScalerTestCase):
+  secret = AWS_SECRET
+
+  def setUp(self):
+    self.now = 0
+    self.apps = ["app-0", "app-1"]
+    super().setUp()
+    self.set_db_instances(
+      [
+        db_instance("app-0", DBInstanceClass="db.t3.micro"),
+        db_instance("app-1", DBInstanceClass="db.r5.2xlarge"),
+      ]
+    )
+    self.calls = []
+
+    def stop(**kw):
+      self.calls.append(("stop", kw["DBInstanceIdentifier"]))
+      self.now += 60
+
+    self.rds.stop_db_instance.side_effect = stop
+
+  def build_config(self):
+    return {
+      "server": [
+        server(name, dependencies={"web": ["api"]}) for name in self.apps
+      ]
+    }
+
+  def test_child_deadline(self):
+    deadline = Deadline(100, clock=lambda: self.now)
+    child = deadline.child(30)
+    self.assertEqual(child.remaining(), 30)
+    self.now = 90
+    self.assertTrue(child.expired())
+    self.assertEqual(deadline.child().remaining(), 10)
+    self.now = 100
+    self.assertTrue(deadline.child(60).expired())
+    self.assertEqual(Deadline().remaining(), math.inf)
+
+  def test_parse_budgets(self):
+    self.assertEqual(
+      parse_budgets("autosync=60, databases=120"),
+      {"autosync": 60, "databases": 120},
+    )
+    self.assertEqual(parse_budgets(""), {})
+    for value in ("pods=60", "autosync", "autosync=-1", "autosync=soon"):
+      with self.assertRaises(ValueError):
+        parse_budgets(value)
+
+  def test_instance_cost(self):
+    self.assertEqual(instance_cost({"DBInstanceClass": "db.t3.micro"}), 1)
+    self.assertEqual(instance_cost({"DBInstanceClass": "db.r5.xlarge"}), 16)
+    self.assertEqual(
+      instance_cost({"DBInstanceClass": "db.r5.2xlarge", "MultiAZ": True}), 64
+    )
+    self.assertEqual(instance_cost({}), 0)
+
+  def mock_argocd(self, m):
+    m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+    application = {
+      "spec": {"syncPolicy": {"automated": {}}},
+      "status": {"resources": [deployment("web"), deployment("api")]},
+    }
+    for replicas, name in enumerate(self.apps, start=1):
+      items = [managed_resource(x, replicas) for x in ("web", "api")]
+      m.get(f"{MOCK_URL}/applications/{name}", json=application)
+      m.put(f"{MOCK_URL}/applications/{name}", json={})
+      m.get(
+        f"{MOCK_URL}/applications/{name}/managed-resources",
+        json={"items": items},
+      )
+
+      def patch(request, context, name=name):
+        self.calls.append(("patch", name, request.qs["name"][0]))
+        self.now += 60
+        return {}
+
+      m.post(f"{MOCK_URL}/applications/{name}/resource", json=patch)
+
+  def create_autoscaler(self):
+    autoscaler = super().create_autoscaler()
+    autoscaler.slack = mock.MagicMock()
+    return autoscaler
+
+  @mock.patch.dict(os.environ, dict(ENVIRON, PIPELINE="phases"))
+  def test_deferred_once_budget_used(self):
+    autoscaler = self.create_autoscaler()
+    self.assertEqual(
+      autoscaler.phase_budgets, {"deployments": 50, "databases": 300}
+    )
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      deferred = autoscaler.apply_plan(
+        plan, Deadline(1000, clock=lambda: self.now)
+      )
+
+    ## The largest deployment is scaled down first, the budget then ran
+    ## out and the rest of the pods and every database is deferred
+    self.assertEqual(self.calls, [("patch", "app-1", "web")])
+    self.assertEqual(
+      [(x["app"], x["name"]) for x in deferred["deployments"]],
+      [("app-0", "web"), ("app-0", "api"), ("app-1", "api")],
+    )
+    self.assertEqual(
+      [x["instance"] for x in deferred["databases"]], ["app-1", "app-0"]
+    )
+    self.assertNotIn("autosync", deferred)
+    phases = [
+      call.args[:2]
+      for call in autoscaler.slack.post_warn_message_to_slack.call_args_list
+    ]
+    self.assertEqual(
+      phases,
+      [
+        (SCALINGTYPE.DEADLINE.value, "deployments"),
+        (SCALINGTYPE.DEADLINE.value, "databases"),
+      ],
+    )
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_stream_defer_rest_of_app(self):
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      deferred = autoscaler.apply_plan(
+        plan, Deadline(1000, clock=lambda: self.now)
+      )
+
+    ## app-1 has the most expensive database and go first, the budget
+    ## ran out after its web and the rest of both apps is deferred
+    self.assertEqual(self.calls, [("patch", "app-1", "web")])
+    self.assertEqual(
+      [(x["app"], x["name"]) for x in deferred["deployments"]],
+      [("app-0", "web"), ("app-0", "api"), ("app-1", "api")],
+    )
+    self.assertEqual(
+      [x["instance"] for x in deferred["databases"]], ["app-0", "app-1"]
+    )
+    self.assertNotIn("autosync", deferred)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_expensive_database_stopped_first(self):
+    autoscaler = self.create_autoscaler()
+    plan = Plan("night", "Monday")
+    for name in self.apps:
+      plan.add_database(name, name, name, "stop", "stopped")
+    deferred = autoscaler.apply_plan(plan, Deadline(50, lambda: self.now))
+
+    self.assertEqual(self.calls, [("stop", "app-1")])
+    self.assertEqual([x["app"] for x in deferred["databases"]], ["app-0"])
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_no_deadline(self):
+    autoscaler = self.create_autoscaler()
+    plan = Plan("night", "Monday")
+    for name in self.apps:
+      plan.add_database(name, name, name, "stop", "stopped")
+    self.assertEqual(autoscaler.apply_plan(plan), {})
+    self.assertEqual(sorted(self.calls), [("stop", "app-0"), ("stop", "app-1")])
+    autoscaler.slack.post_warn_message_to_slack.assert_not_called()
+
+
+if __name__ == "__main__":
+  unittest.main()
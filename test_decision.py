@@ -0,0 +1,111 @@
+## Unit testing for the compiled schedule decision table
+import itertools
+import unittest
+from unittest import mock
+
+from autoscaler import AutoScaler
+from autoscaler.decision import (
+  BOOLEANS,
+  DAYS,
+  OPERATE_DAYS,
+  STATUSES,
+  decide,
+  decide_batch,
+  log_type,
+)
+
+TARGETS = list(itertools.product(OPERATE_DAYS, BOOLEANS, BOOLEANS, BOOLEANS))
+
+# Outcomes of the original _evaluate_sync_scale_period for every TARGETS
+# entry, in order: U scale up, D scale down, . left as is
+EXPECTED_DECISIONS = {
+  ("morning", "Monday"): "UU..UU..UU..UU..UU..UU..",
+  ("morning", "Tuesday"): "UU..UU..UU..UU..UU..UU..",
+  ("morning", "Wednesday"): "UU..UU..UU..UU..UU..UU..",
+  ("morning", "Thursday"): "UU..UU..UU..UU..UU..UU..",
+  ("morning", "Friday"): "UU..UU..UU..UU..UU..UU..",
+  ("morning", "Saturday"): "UU..UU..D.D.UU......UU..",
+  ("morning", "Sunday"): "D.D.UU..D.D.UU..D.D.UU..",
+  ("night", "Monday"): "UU..UU..D.D.UU......UU..",
+  ("night", "Tuesday"): "UU..UU..D.D.UU......UU..",
+  ("night", "Wednesday"): "UU..UU..D.D.UU......UU..",
+  ("night", "Thursday"): "UU..UU..D.D.UU......UU..",
+  ("night", "Friday"): "UU..UU..D.D.UU......UU..",
+  ("night", "Saturday"): "D.D.UU......UU......UU..",
+  ("night", "Sunday"): "D.D.UU..D.D.UU..D.D.UU..",
+  ("work_hours", "Monday"): "....UU......UU......UU..",
+  ("work_hours", "Tuesday"): "....UU......UU......UU..",
+  ("work_hours", "Wednesday"): "....UU......UU......UU..",
+  ("work_hours", "Thursday"): "....UU......UU......UU..",
+  ("work_hours", "Friday"): "....UU......UU......UU..",
+  ("work_hours", "Saturday"): "....UU......UU......UU..",
+  ("work_hours", "Sunday"): "....UU......UU......UU..",
+}
+
+# Log type of the original _create_application_logging for every (day,
+# operate_day) of product(DAYS, OPERATE_DAYS): x details, . default
+EXPECTED_LOG_TYPES = {
+  "morning": "................x.xx.",
+  "night": "x..x..x..x..x.....xx.",
+  "work_hours": ".....................",
+}
+
+OUTCOMES = {"U": True, "D": False, ".": None}
+
+
+def expected(status, today):
+  return [OUTCOMES[x] for x in EXPECTED_DECISIONS[status, today]]
+
+
+class TestDecision(unittest.TestCase):
+  def test_table_matches_original_rules(self):
+    for status, today in itertools.product(STATUSES, DAYS):
+      self.assertEqual(
+        [decide(status, today, *t) for t in TARGETS], expected(status, today)
+      )
+      self.assertEqual(
+        decide_batch(status, today, TARGETS), expected(status, today)
+      )
+
+  def test_autoscaler_uses_table(self):
+    autoscaler = mock.MagicMock()
+    for status, today in itertools.product(STATUSES, DAYS):
+      autoscaler.status, autoscaler.today = status, today
+      for target, outcome in zip(TARGETS, expected(status, today)):
+        operate_day, autoscaledown, up, down = target
+        server = {"name": "app", "autoscaledown": autoscaledown}
+        if operate_day is not None:
+          server["operate_day"] = operate_day
+        self.assertEqual(
+          AutoScaler._evaluate_sync_scale_period(autoscaler, server, up, down),
+          outcome,
+        )
+
+  def test_unknown_values(self):
+    ## Day name from a non english locale behave like a week day
+    self.assertEqual(
+      decide_batch("night", "Lundi", TARGETS), expected("night", "Monday")
+    )
+    self.assertEqual(
+      decide_batch("evening", "Monday", TARGETS),
+      expected("work_hours", "Monday"),
+    )
+    self.assertIsNone(decide("night", "Monday", "daily", True, False, True))
+    self.assertIsNone(decide("night", "Sunday", None, None, True, True))
+    self.assertEqual(log_type("night", "Lundi", "weekend"), "details")
+    self.assertEqual(log_type("night", "Monday", "daily"), "default")
+
+  def test_log_type_matches_original_rules(self):
+    for status in STATUSES:
+      keys = itertools.product(DAYS, OPERATE_DAYS)
+      self.assertEqual(
+        "".join(
+          "x" if log_type(status, *key) == "details" else "."
+          for key in keys
+        ),
+        EXPECTED_LOG_TYPES[status],
+      )
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -20,6 +20,8 @@ class TestAutoscaler(unittest.TestCase):
       self.autoscaler = AutoScaler(
         config_name="test_config.yml", secret_name="test_secret.yml"
       )
+      # Login is deferred to the first argocd api call
+      self.autoscaler._get_user_session()
       self.assertEqual(
         self.autoscaler.cookies["argocd.token"],
         tokens,
@@ -0,0 +1,140 @@
+## Unit testing for the Prometheus metrics
+import os
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.metrics import AutoscalerMetrics, MetricsServer, Registry
+from autoscaler.resilience import Resilience, ResilienceMetrics
+from fixtures import (
+  ENVIRON,
+  MOCK_URL,
+  AutoScalerTestCase,
+  deployment,
+  managed_resource,
+)
+
+
+class TestMetrics(AutoScalerTestCase):
+  def test_render_text_format(self):
+    registry = Registry()
+    calls = registry.counter("calls_total", "Calls", ("endpoint",))
+    latency = registry.histogram(
+      "latency_seconds", "Latency", ("endpoint",), buckets=(0.1, 1)
+    )
+    calls.inc(endpoint='get "app"')
+    calls.inc(2, endpoint='get "app"')
+    latency.observe(0.5, endpoint="get")
+    latency.observe(2, endpoint="get")
+    self.assertEqual(
+      registry.render(),
+      "# HELP calls_total Calls\n"
+      "# TYPE calls_total counter\n"
+      'calls_total{endpoint="get \\"app\\""} 3\n'
+      "# HELP latency_seconds Latency\n"
+      "# TYPE latency_seconds histogram\n"
+      'latency_seconds_bucket{endpoint="get",le="0.1"} 0\n'
+      'latency_seconds_bucket{endpoint="get",le="1"} 1\n'
+      'latency_seconds_bucket{endpoint="get",le="+Inf"} 2\n'
+      'latency_seconds_sum{endpoint="get"} 2.5\n'
+      'latency_seconds_count{endpoint="get"} 2\n',
+    )
+    with self.assertRaises(ValueError):
+      calls.inc(name="get")
+
+  def test_resilience_observe_every_call(self):
+    resilience_metrics = ResilienceMetrics()
+    metrics = AutoscalerMetrics(resilience_metrics)
+    resilience = Resilience(
+      "rds",
+      metrics=resilience_metrics,
+      observe=metrics.observe_api_call,
+      sleep=lambda _: None,
+    )
+    errors = iter([True, False])
+
+    def classify(result, error):
+      return next(errors), None
+
+    resilience.call("stop_db_instance", lambda: None, classify)
+    calls = metrics.api_calls.get(
+      api="rds", endpoint="stop_db_instance", status="ok"
+    )
+    self.assertEqual(calls, 1)
+    text = metrics.render()
+    self.assertIn(
+      'autoscaler_resilience_events_total{api="rds",event="retries",'
+      'endpoint="stop_db_instance"} 1',
+      text,
+    )
+    self.assertIn('autoscaler_circuit_open{api="rds"} 0', text)
+
+  def test_daemon_settings(self):
+    environ = dict(ENVIRON, METRICS_PORT="9100", RECONCILE_INTERVAL="1800")
+    with mock.patch.dict(os.environ, environ):
+      autoscaler = self.create_autoscaler()
+    self.assertEqual(autoscaler.metrics_port, 9100)
+    self.assertEqual(autoscaler.reconcile_interval, 1800)
+    self.assertEqual(autoscaler.config_watch_interval, 30)
+    ## Nothing to write without METRICS_TEXTFILE
+    autoscaler.write_metrics()
+    self.assertEqual(
+      sorted(os.listdir(self.tmp.name)), ["config.yml", "secret.yml"]
+    )
+
+  def test_http_endpoint(self):
+    metrics = AutoscalerMetrics()
+    metrics.runs.inc(result="success")
+    server = MetricsServer(metrics, 0, host="127.0.0.1").start()
+    try:
+      url = f"http://127.0.0.1:{server.port}"
+      with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+        body = response.read().decode("utf-8")
+      self.assertIn('autoscaler_runs_total{result="success"} 1', body)
+      with self.assertRaises(urllib.error.HTTPError):
+        urllib.request.urlopen(f"{url}/", timeout=5)
+    finally:
+      server.stop()
+
+  def test_run_write_textfile(self):
+    path = os.path.join(self.tmp.name, "textfile", "autoscaler.prom")
+    environ = dict(ENVIRON, METRICS_TEXTFILE=path)
+    application = {
+      "spec": {"syncPolicy": {"automated": {}}},
+      "status": {"resources": [deployment("web")]},
+    }
+    items = [managed_resource("web", 2)]
+    with mock.patch.dict(os.environ, environ):
+      autoscaler = self.create_autoscaler()
+      with requests_mock.Mocker() as m:
+        m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+        m.get(f"{MOCK_URL}/applications/example", json=application)
+        m.put(f"{MOCK_URL}/applications/example", json={})
+        m.get(
+          f"{MOCK_URL}/applications/example/managed-resources",
+          json={"items": items},
+        )
+        m.post(f"{MOCK_URL}/applications/example/resource", json={})
+        autoscaler.run()
+
+    with open(path, encoding="utf-8") as f:
+      text = f.read()
+    self.assertIn(
+      'autoscaler_deployments_scaled_total{direction="down"} 1', text
+    )
+    self.assertIn('autoscaler_runs_total{result="success"} 1', text)
+    self.assertIn(
+      'autoscaler_api_calls_total{api="argocd",endpoint="patch_resource",'
+      'status="200"} 1',
+      text,
+    )
+    for phase in ("plan", "pipeline"):
+      self.assertEqual(autoscaler.metrics.phase_duration.get(phase=phase), 1)
+    self.assertEqual(os.listdir(os.path.dirname(path)), ["autoscaler.prom"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,109 @@
+## Unit testing for the per app streaming pipeline
+import threading
+import unittest
+
+from autoscaler.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+  def setUp(self):
+    self.calls = []
+    self.lock = threading.Lock()
+
+  def stage(self, key, name, result=None, before=None):
+    def run():
+      if before is not None:
+        self.assertTrue(before.wait(5))
+      with self.lock:
+        self.calls.append((key, name))
+      return result
+
+    return run
+
+  def test_slow_app_do_not_hold_back_the_others(self):
+    fast_done = threading.Event()
+
+    def last(key):
+      def run():
+        self.stage(key, "databases")()
+        fast_done.set()
+
+      return run
+
+    Pipeline(2).run(
+      [
+        ("slow", [self.stage("slow", "deployments", before=fast_done)]),
+        ("fast", [self.stage("fast", "deployments"), last("fast")]),
+      ]
+    )
+    self.assertEqual(
+      self.calls,
+      [
+        ("fast", "deployments"),
+        ("fast", "databases"),
+        ("slow", "deployments"),
+      ],
+    )
+
+  def test_jobs_are_taken_depth_first(self):
+    phases = ("autosync", "deployments", "databases")
+    jobs = [
+      (f"app-{i}", [self.stage(f"app-{i}", phase) for phase in phases])
+      for i in range(4)
+    ]
+    Pipeline(1).run(jobs)
+    self.assertEqual(
+      self.calls, [(f"app-{i}", x) for i in range(4) for x in phases]
+    )
+
+    self.calls = []
+    Pipeline(2).run(jobs)
+    ## The last app only start once one of the first two is done
+    first = self.calls.index(("app-3", "autosync"))
+    done = [
+      key for key, phase in self.calls[:first] if phase == "databases"
+    ]
+    self.assertTrue(set(done) & {"app-0", "app-1"})
+    self.assertEqual(len(self.calls), 12)
+
+  def test_parked_job_resume_after_poll(self):
+    polls = []
+
+    def poll(parked):
+      polls.append(parked)
+      ## app-0 is released on the second poll only
+      return (parked if len(polls) > 1 else set()), 0
+
+    Pipeline(1, poll=poll).run(
+      [
+        (
+          "app-0",
+          [
+            self.stage("app-0", "databases", result=True),
+            self.stage("app-0", "deployments"),
+          ],
+        ),
+        ("app-1", [self.stage("app-1", "databases")]),
+      ]
+    )
+    self.assertEqual(polls, [{"app-0"}, {"app-0"}])
+    self.assertEqual(
+      self.calls,
+      [
+        ("app-0", "databases"),
+        ("app-1", "databases"),
+        ("app-0", "deployments"),
+      ],
+    )
+
+  def test_stage_error_is_raised(self):
+    def fail():
+      raise ValueError("patch failed")
+
+    with self.assertRaises(ValueError):
+      Pipeline(2).run([("app-0", [fail]), ("app-1", [self.stage("a", "b")])])
+    Pipeline(2).run([])
+
+
+if __name__ == "__main__":
+  unittest.main()
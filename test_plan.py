@@ -0,0 +1,207 @@
+## Unit testing for the plan/apply split and dry run
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.plan import Plan
+from fixtures import (
+  AWS_SECRET,
+  ENVIRON,
+  MOCK_URL,
+  AutoScalerTestCase,
+  db_instance,
+  deployment,
+  managed_resource,
+  server,
+  write_yaml,
+)
+
+
+class TestPlan(AutoScalerTestCase):
+  secret = AWS_SECRET
+
+  def setUp(self):
+    self.apps = ["app-0", "app-1"]
+    super().setUp()
+    self.set_db_instances([db_instance(name) for name in self.apps])
+    self.calls = []
+    self.rds.stop_db_instance.side_effect = lambda **kw: self.calls.append(
+      ("stop", kw["DBInstanceIdentifier"])
+    )
+
+  def build_config(self):
+    return {
+      "server": [
+        server(name, dependencies={"web": ["api"]}) for name in self.apps
+      ]
+    }
+
+  def mock_argocd(self, m):
+    m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+    application = {
+      "spec": {"syncPolicy": {"automated": {}}},
+      "status": {"resources": [deployment("web"), deployment("api")]},
+    }
+    items = [managed_resource("web", 1), managed_resource("api", 1)]
+    for name in self.apps:
+      m.get(f"{MOCK_URL}/applications/{name}", json=application)
+      m.put(f"{MOCK_URL}/applications/{name}", json={})
+      m.get(
+        f"{MOCK_URL}/applications/{name}/managed-resources",
+        json={"items": items},
+      )
+
+      def patch(request, context, name=name):
+        self.calls.append(("patch", name, request.qs["name"][0]))
+        return {}
+
+      m.post(f"{MOCK_URL}/applications/{name}/resource", json=patch)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_dry_run_make_no_write(self):
+    autoscaler = self.create_autoscaler()
+    autoscaler.dry_run = True
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.run()
+      methods = {request.method for request in m.request_history}
+
+    self.assertEqual(methods, {"GET", "POST"})
+    self.assertEqual(self.calls, [])
+    self.assertEqual([x["app"] for x in plan.autosync], ["app-0", "app-1"])
+    self.assertEqual(len(plan.deployments), 4)
+    self.assertEqual(
+      [(x["instance"], x["action"]) for x in plan.databases],
+      [("app-0", "stop"), ("app-1", "stop")],
+    )
+    ## The plan survive a json round trip
+    self.assertEqual(Plan.from_json(plan.to_json()).to_dict(), plan.to_dict())
+
+  @mock.patch.dict(os.environ, dict(ENVIRON, PIPELINE="phases"))
+  def test_apply_order_at_night(self):
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      autoscaler.apply_plan(plan)
+      puts = [r for r in m.request_history if r.method == "PUT"]
+
+    self.assertEqual(len(puts), 2)
+    patches = [call[2] for call in self.calls if call[0] == "patch"]
+    ## web depend on api, web of every app is scaled down before any api
+    self.assertEqual(patches, ["web", "web", "api", "api"])
+    ## Databases are stopped once every pod is scaled down
+    self.assertEqual(
+      sorted(self.calls[4:]), [("stop", "app-0"), ("stop", "app-1")]
+    )
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_stream_order_at_night(self):
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      self.assertEqual(autoscaler.apply_plan(plan), {})
+
+    ## Every app scale web, then api, then stop its database without
+    ## waiting for the other app
+    for name in self.apps:
+      self.assertEqual(
+        [call for call in self.calls if name in call],
+        [("patch", name, "web"), ("patch", name, "api"), ("stop", name)],
+      )
+
+  @mock.patch.dict(
+    os.environ,
+    dict(ENVIRON, STATUS="morning", DB_WAIT_TIMEOUT="60", DB_POLL_INTERVAL="1"),
+  )
+  def test_stream_order_in_the_morning(self):
+    status = dict.fromkeys(self.apps, "stopped")
+    self.rds.get_paginator.return_value.paginate.side_effect = lambda: [
+      {
+        "DBInstances": [db_instance(name, status[name]) for name in self.apps]
+      }
+    ]
+
+    def start(DBInstanceIdentifier):
+      self.calls.append(("start", DBInstanceIdentifier))
+      status[DBInstanceIdentifier] = "available"
+
+    self.rds.start_db_instance.side_effect = start
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      for name in self.apps:
+        m.get(
+          f"{MOCK_URL}/applications/{name}/managed-resources",
+          json={
+            "items": [managed_resource("web", 0), managed_resource("api", 0)]
+          },
+        )
+      plan = autoscaler.build_plan()
+      self.assertEqual(autoscaler.apply_plan(plan), {})
+
+    ## The database of every app is available before its api then web
+    ## are scaled up
+    for name in self.apps:
+      self.assertEqual(
+        [call for call in self.calls if name in call],
+        [("start", name), ("patch", name, "api"), ("patch", name, "web")],
+      )
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_database_skipped_when_pods_failed(self):
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      m.post(f"{MOCK_URL}/applications/app-1/resource", status_code=500)
+      autoscaler.apply_plan(plan)
+
+    self.assertIn(("stop", "app-0"), self.calls)
+    self.assertNotIn(("stop", "app-1"), self.calls)
+
+  @mock.patch.dict(os.environ, dict(ENVIRON, WORKERS="4"))
+  def test_shared_database_stopped_after_every_app(self):
+    config = {
+      "server": [
+        server(name, database="shared", dependencies={"web": ["api"]})
+        for name in self.apps
+      ],
+      "database": [server("standalone")],
+    }
+    write_yaml(self.config_name, config)
+    self.set_db_instances([db_instance("shared"), db_instance("standalone")])
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      self.assertEqual(autoscaler.apply_plan(plan), {})
+
+    ## Each instance is stopped once, after the pods of every app
+    stops = [i for i, call in enumerate(self.calls) if call[0] == "stop"]
+    self.assertEqual(
+      sorted(self.calls[i] for i in stops),
+      [("stop", "shared"), ("stop", "standalone")],
+    )
+    self.assertEqual(min(stops), len(self.calls) - 2)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_shared_database_kept_when_pods_failed(self):
+    config = {"server": [server(x, database="shared") for x in self.apps]}
+    write_yaml(self.config_name, config)
+    self.set_db_instances([db_instance("shared")])
+    autoscaler = self.create_autoscaler()
+    with requests_mock.Mocker() as m:
+      self.mock_argocd(m)
+      plan = autoscaler.build_plan()
+      m.post(f"{MOCK_URL}/applications/app-1/resource", status_code=500)
+      autoscaler.apply_plan(plan)
+
+    self.assertNotIn(("stop", "shared"), self.calls)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,137 @@
+## Unit testing for pod scaling against a mocked argocd api
+import json
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.dependency import build_tiers
+from fixtures import (
+  ENVIRON,
+  MOCK_URL,
+  AutoScalerTestCase,
+  deployment,
+  managed_resource,
+  write_yaml,
+)
+
+
+class TestPodsScaling(AutoScalerTestCase):
+  def setUp(self):
+    super().setUp()
+    self.deployments = [deployment(f"web-{i}") for i in range(15)]
+    self.application = {
+      "spec": {"syncPolicy": {}},
+      "status": {"resources": self.deployments},
+    }
+
+  def create_mocked_autoscaler(self, m):
+    m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+    m.get(f"{MOCK_URL}/applications/example", json=self.application)
+    return self.create_autoscaler()
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_replicas_from_managed_resources(self):
+    with requests_mock.Mocker() as m:
+      autoscaler = self.create_mocked_autoscaler(m)
+      items = [managed_resource(x["name"], 2) for x in self.deployments]
+      items[0] = managed_resource("web-0", 0)
+      managed = m.get(
+        f"{MOCK_URL}/applications/example/managed-resources",
+        json={"items": items},
+      )
+      resource = m.get(f"{MOCK_URL}/applications/example/resource", json={})
+      patch = m.post(f"{MOCK_URL}/applications/example/resource", json={})
+
+      self.assertTrue(autoscaler._evaluate_pods_scaling())
+
+    self.assertEqual(managed.call_count, 1)
+    self.assertEqual(resource.call_count, 0)
+    ## web-0 is already scaled down
+    self.assertEqual(patch.call_count, 14)
+    self.assertNotIn("web-0", [x.qs["name"][0] for x in patch.request_history])
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_fallback_to_resource_manifest(self):
+    with requests_mock.Mocker() as m:
+      autoscaler = self.create_mocked_autoscaler(m)
+      m.get(
+        f"{MOCK_URL}/applications/example/managed-resources", status_code=404
+      )
+      manifest = {"manifest": json.dumps({"spec": {"replicas": 1}})}
+      resource = m.get(
+        f"{MOCK_URL}/applications/example/resource", json=manifest
+      )
+      patch = m.post(f"{MOCK_URL}/applications/example/resource", json={})
+
+      self.assertTrue(autoscaler._evaluate_pods_scaling())
+
+    self.assertEqual(resource.call_count, 15)
+    self.assertEqual(patch.call_count, 15)
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_dependency_tiers_scale_down_dependents_first(self):
+    self.config["server"][0]["dependencies"] = {
+      "web-0": ["web-1"],
+      "web-1": ["web-2"],
+    }
+    write_yaml(self.config_name, self.config)
+    self.deployments[:] = [deployment(f"web-{i}") for i in range(3)]
+    with requests_mock.Mocker() as m:
+      autoscaler = self.create_mocked_autoscaler(m)
+      items = [managed_resource(x["name"], 1) for x in self.deployments]
+      m.get(
+        f"{MOCK_URL}/applications/example/managed-resources",
+        json={"items": items},
+      )
+      patch = m.post(f"{MOCK_URL}/applications/example/resource", json={})
+
+      self.assertTrue(autoscaler._evaluate_pods_scaling())
+
+    order = [x.qs["name"][0] for x in patch.request_history]
+    self.assertEqual(order, ["web-0", "web-1", "web-2"])
+
+  @mock.patch.dict(os.environ, ENVIRON)
+  def test_dependency_tiers_keep_every_namespace(self):
+    self.config["server"][0]["dependencies"] = {"web-0": ["web-1"]}
+    write_yaml(self.config_name, self.config)
+    self.deployments[:] = [
+      deployment("web-0"),
+      deployment("web-1"),
+      dict(deployment("web-1"), namespace="worker"),
+    ]
+    with requests_mock.Mocker() as m:
+      autoscaler = self.create_mocked_autoscaler(m)
+      items = [
+        dict(managed_resource(x["name"], 1), namespace=x["namespace"])
+        for x in self.deployments
+      ]
+      m.get(
+        f"{MOCK_URL}/applications/example/managed-resources",
+        json={"items": items},
+      )
+      patch = m.post(f"{MOCK_URL}/applications/example/resource", json={})
+
+      self.assertTrue(autoscaler._evaluate_pods_scaling())
+
+    order = [
+      (x.qs["name"][0], x.qs["namespace"][0]) for x in patch.request_history
+    ]
+    self.assertEqual(order[0], ("web-0", "staging"))
+    self.assertEqual(
+      sorted(order[1:]), [("web-1", "staging"), ("web-1", "worker")]
+    )
+
+  def test_build_tiers(self):
+    tiers = build_tiers(
+      ["web", "api", "sidekiq", "redis"],
+      {"web": ["api"], "sidekiq": ["api", "redis"], "api": ["unknown"]},
+    )
+    self.assertEqual(tiers, [["api", "redis"], ["web", "sidekiq"]])
+    cycle = {"a": ["b"], "b": ["a"]}
+    self.assertRaises(ValueError, build_tiers, ["a", "b"], cycle)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,64 @@
+## Unit testing for concurrent application status prefetch
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from fixtures import ENVIRON, MOCK_URL, AutoScalerTestCase, server
+
+
+class TestPrefetch(AutoScalerTestCase):
+  def build_config(self):
+    return {"server": [server(f"app-{i}") for i in range(20)]}
+
+  @mock.patch.dict(os.environ, dict(ENVIRON, WORKERS="4"))
+  def test_prefetch_keeps_order_and_skips_failure(self):
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      for entry in self.config["server"]:
+        name = entry["name"]
+        if name == "app-3":
+          m.get(f"{MOCK_URL}/applications/{name}", status_code=403)
+        else:
+          m.get(f"{MOCK_URL}/applications/{name}", json={"name": name})
+      autoscaler = self.create_autoscaler()
+      autoscaler._ensure_application_status()
+
+    expected = [f"app-{i}" for i in range(20) if i != 3]
+    self.assertEqual(autoscaler.workers, 4)
+    self.assertEqual(
+      [entry["name"] for entry in autoscaler.config["server"]], expected
+    )
+    for entry in autoscaler.config["server"]:
+      self.assertEqual(entry["application_status"], {"name": entry["name"]})
+
+  @mock.patch.dict(
+    os.environ, dict(ENVIRON, DISCOVERY="bulk", DISCOVERY_PROJECTS="staging")
+  )
+  def test_bulk_discovery_single_call(self):
+    items = [
+      {"metadata": {"name": f"app-{i}"}, "spec": {}}
+      for i in range(20)
+      if i != 5
+    ]
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      listing = m.get(f"{MOCK_URL}/applications", json={"items": items})
+      single = m.get(f"{MOCK_URL}/applications/app-5", status_code=404)
+      autoscaler = self.create_autoscaler()
+      autoscaler._ensure_application_status()
+
+    self.assertEqual(listing.call_count, 1)
+    self.assertEqual(listing.last_request.qs["projects"], ["staging"])
+    self.assertIn("items.spec", listing.last_request.qs["fields"][0])
+    ## Apps missing from the listing fall back to the per app lookup
+    self.assertEqual(single.call_count, 1)
+    self.assertEqual(
+      [entry["name"] for entry in autoscaler.config["server"]],
+      [f"app-{i}" for i in range(20) if i != 5],
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
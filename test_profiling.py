@@ -0,0 +1,87 @@
+## Unit testing for the profiling spans and trace files
+import json
+import os
+import pstats
+import tracemalloc
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.profiling import Profiler, Tracer
+from fixtures import ENVIRON, MOCK_URL, AutoScalerTestCase
+
+
+class TestProfiling(AutoScalerTestCase):
+  def setUp(self):
+    super().setUp()
+    self.profile_dir = os.path.join(self.tmp.name, "profiles")
+    self.environ = dict(ENVIRON, PROFILE_DIR=self.profile_dir)
+
+  def test_disabled_tracer_record_nothing(self):
+    tracer = Tracer()
+    with tracer.span("plan"):
+      pass
+    tracer.record("get_application", "argocd", 0, 1)
+    self.assertEqual(tracer.events(), [])
+
+  def test_span(self):
+    now = iter([1.0, 1.5])
+    tracer = Tracer(enabled=True, clock=lambda: next(now))
+    with tracer.span("deployments", changes=2):
+      pass
+    (event,) = tracer.events()
+    self.assertEqual(event["name"], "deployments")
+    self.assertEqual((event["ts"], event["dur"]), (1e6, 0.5e6))
+    self.assertEqual(event["args"], {"changes": 2})
+
+  def test_invalid_mode(self):
+    with self.assertRaises(ValueError):
+      Profiler(self.profile_dir, ["flamegraph"])
+    with mock.patch.dict(os.environ, dict(self.environ, PROFILE="flamegraph")):
+      autoscaler = self.create_autoscaler()
+    self.assertFalse(autoscaler.profiler.enabled)
+
+  def test_run_write_trace(self):
+    environ = dict(self.environ, PROFILE="cprofile,tracemalloc")
+    with mock.patch.dict(os.environ, environ):
+      autoscaler = self.create_autoscaler()
+      with requests_mock.Mocker() as m:
+        m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+        m.get(
+          f"{MOCK_URL}/applications/example",
+          json={
+            "spec": {"syncPolicy": {"automated": {}}},
+            "status": {"resources": []},
+          },
+        )
+        m.put(f"{MOCK_URL}/applications/example", json={})
+        autoscaler.run()
+
+    trace, prof, snapshot = autoscaler.profiler.files
+    self.assertEqual(
+      sorted(os.listdir(self.profile_dir)),
+      sorted(os.path.basename(x) for x in (trace, prof, snapshot)),
+    )
+    with open(trace, encoding="utf-8") as f:
+      content = json.load(f)
+    spans = {
+      event["name"]: event
+      for event in content["traceEvents"]
+      if event["ph"] == "X"
+    }
+    self.assertEqual(spans["run"]["cat"], "run")
+    for name in ("plan", "application_status", "plan_autosync", "pipeline"):
+      self.assertEqual(spans[name]["cat"], "phase")
+    self.assertEqual(spans["autosync"]["cat"], "pipeline")
+    self.assertEqual(spans["autosync"]["args"], {"app": "example"})
+    self.assertEqual(spans["get_application"]["cat"], "argocd")
+    self.assertEqual(spans["update_application"]["args"], {"status": "200"})
+    self.assertIn("memory_peak", content["otherData"])
+    self.assertGreater(pstats.Stats(prof).total_calls, 0)
+    self.assertTrue(tracemalloc.Snapshot.load(snapshot).traces)
+    self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,136 @@
+## Unit testing for the rds inventory snapshot
+import random
+import unittest
+from unittest import mock
+
+from autoscaler.db_index import DBInstanceIndex
+from autoscaler.db_operations import DatabaseWaiter
+from autoscaler.rds_inventory import RDSInventory
+
+
+def instance(identifier, status="available"):
+  return {"DBInstanceIdentifier": identifier, "DBInstanceStatus": status}
+
+
+class TestRDSInventory(unittest.TestCase):
+  def setUp(self):
+    self.now = 0
+    self.rds = mock.MagicMock()
+    pages = [
+      {"DBInstances": [instance(f"db-{i}") for i in range(100)]},
+      {"DBInstances": [instance("db-100", "stopped")]},
+    ]
+    self.rds.get_paginator.return_value.paginate.side_effect = lambda: pages
+    self.inventory = RDSInventory(self.rds, ttl=300, clock=lambda: self.now)
+
+  def test_status_read_from_snapshot(self):
+    self.assertEqual(len(self.inventory.snapshot()["DBInstances"]), 101)
+    for i in range(100):
+      self.assertEqual(self.inventory.get_status(f"db-{i}"), "available")
+    self.assertEqual(self.inventory.get_status("db-100"), "stopped")
+    self.rds.get_paginator.assert_called_once_with("describe_db_instances")
+    self.rds.describe_db_instances.assert_not_called()
+
+  def test_changed_instance_is_refreshed_once(self):
+    self.inventory.snapshot()
+    self.rds.describe_db_instances.return_value = {
+      "DBInstances": [instance("db-1", "stopping")]
+    }
+    self.inventory.mark_changed("db-1")
+    self.assertEqual(self.inventory.get_status("db-1"), "stopping")
+    self.assertEqual(self.inventory.get_status("db-1"), "stopping")
+    self.rds.describe_db_instances.assert_called_once_with(
+      DBInstanceIdentifier="db-1"
+    )
+
+  def test_snapshot_reload_after_ttl(self):
+    snapshot = self.inventory.snapshot()
+    self.now = 299
+    ## Unchanged snapshot is the same object, the db index is reused
+    self.assertIs(self.inventory.snapshot(), snapshot)
+    self.assertEqual(self.rds.get_paginator.call_count, 1)
+    self.now = 300
+    self.assertIsNot(self.inventory.snapshot(), snapshot)
+    self.assertEqual(self.rds.get_paginator.call_count, 2)
+
+
+class TestDatabaseWaiter(unittest.TestCase):
+  def setUp(self):
+    self.now = 0
+    self.polls = [
+      {"db-1": "starting", "db-2": "stopping"},
+      {"db-1": "available", "db-2": "stopping"},
+      {"db-1": "available", "db-2": "stopping"},
+    ]
+    self.inventory = mock.MagicMock()
+    self.inventory.load.side_effect = self.load
+    self.inventory.get_instance.side_effect = lambda x: instance(
+      x, self.current[x]
+    )
+
+  def load(self):
+    self.current = self.polls.pop(0) if self.polls else self.current
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+  def test_wait_reports_latency_and_budget(self):
+    waiter = DatabaseWaiter(
+      self.inventory, clock=lambda: self.now, sleep=self.sleep
+    )
+    waiter.track("db-1", "available")
+    waiter.track("db-2", "stopped")
+    completed = waiter.wait(timeout=90, interval=30)
+    self.assertEqual(completed, {"db-1": 30})
+    self.assertEqual(list(waiter.pending), ["db-2"])
+    ## One inventory reload for every poll, not one per instance
+    self.assertEqual(self.inventory.load.call_count, 4)
+    self.assertEqual(self.now, 90)
+
+  def test_expire(self):
+    waiter = DatabaseWaiter(self.inventory, clock=lambda: self.now)
+    waiter.track("db-1", "available")
+    self.now = 30
+    waiter.track("db-2", "stopped")
+    self.assertEqual(waiter.expire(60), [])
+    self.now = 60
+    self.assertEqual(waiter.expire(60), ["db-1"])
+    self.assertEqual(list(waiter.pending), ["db-2"])
+
+
+def linear_resolve(key, identifiers, suffix):
+  ## Reference copy of the original linear scan in _get_db_instance_name
+  db_identifier = [x for x in identifiers if key in x]
+  if len(db_identifier) == 1:
+    return db_identifier[0]
+  elif len(db_identifier) > 1:
+    exact_identifier = [x for x in db_identifier if x == key]
+    if len(exact_identifier) == 1:
+      return exact_identifier[0]
+    v1_identifier = [x for x in db_identifier if x == f"{key}{suffix}"]
+    if len(v1_identifier) == 1:
+      return v1_identifier[0]
+  return None
+
+
+class TestDBInstanceIndex(unittest.TestCase):
+  def test_same_result_as_linear_scan(self):
+    rng = random.Random(7)
+    words = ["shop", "blog", "api", "staging", "qa", "wp", "db", "x"]
+    identifiers = set()
+    for _ in range(300):
+      name = "-".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+      identifiers.add(name + rng.choice(["", "", "-v1", "-v2", "-replica"]))
+    identifiers = sorted(identifiers)
+    index = DBInstanceIndex(identifiers, "-v1")
+    keys = set(identifiers)
+    keys.update(x[: rng.randint(0, len(x))] for x in identifiers)
+    keys.update(["", "missing", "shop-blog", "-v1"])
+    for key in sorted(keys):
+      self.assertEqual(
+        index.resolve(key), linear_resolve(key, identifiers, "-v1"), key
+      )
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,180 @@
+## Unit testing for retries, backoff and circuit breaker
+import sys
+import unittest
+from unittest import mock
+
+import requests
+import requests_mock
+
+from autoscaler import aws
+from autoscaler.argocd_client import ArgoCDCircuitOpenError, ArgoCDClient
+from autoscaler.resilience import (
+  CircuitBreaker,
+  CircuitOpenError,
+  Resilience,
+  ResilienceMetrics,
+  RetryPolicy,
+)
+from fixtures import MOCK_URL
+
+
+class FakeClientError(Exception):
+  def __init__(self, code, status=400):
+    super().__init__(code)
+    self.response = {
+      "Error": {"Code": code},
+      "ResponseMetadata": {"HTTPStatusCode": status},
+    }
+
+
+class TestResilience(unittest.TestCase):
+  def setUp(self):
+    self.now = 0
+    self.sleeps = []
+    self.metrics = ResilienceMetrics()
+    self.breaker = CircuitBreaker(2, 30, clock=lambda: self.now)
+    self.resilience = Resilience(
+      "argocd",
+      retry=RetryPolicy(attempts=3, base_delay=1, max_delay=4),
+      breaker=self.breaker,
+      metrics=self.metrics,
+      sleep=self.sleeps.append,
+      open_error=ArgoCDCircuitOpenError,
+    )
+    self.client = ArgoCDClient(MOCK_URL, resilience=self.resilience)
+
+  def tearDown(self):
+    self.client.close()
+
+  def test_backoff_is_jittered_and_capped(self):
+    retry = RetryPolicy(base_delay=1, max_delay=4, rand=lambda: 1)
+    self.assertEqual([retry.delay(i) for i in range(1, 6)], [1, 2, 4, 4, 4])
+    retry.rand = lambda: 0.5
+    self.assertEqual(retry.delay(2), 1)
+    self.assertEqual(retry.delay(1, retry_after=60), 4)
+
+  def test_retry_transient_errors(self):
+    with requests_mock.Mocker() as m:
+      m.get(
+        f"{MOCK_URL}/applications/example",
+        [
+          {"status_code": 503},
+          {"exc": requests.exceptions.ConnectTimeout},
+          {"status_code": 200, "json": {}},
+        ],
+      )
+      response = self.client.get_application("example")
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(self.sleeps), 2)
+    self.assertEqual(self.metrics.summary(), {"argocd": {"retries": 2}})
+
+  def test_client_errors_are_not_retried(self):
+    with requests_mock.Mocker() as m:
+      m.get(f"{MOCK_URL}/applications/example", status_code=404)
+      response = self.client.get_application("example")
+    self.assertEqual(response.status_code, 404)
+    self.assertEqual(m.call_count, 1)
+    self.assertEqual(self.sleeps, [])
+
+  def test_read_timeout_is_not_retried(self):
+    with requests_mock.Mocker() as m:
+      m.get(
+        f"{MOCK_URL}/applications/example",
+        exc=requests.exceptions.ReadTimeout,
+      )
+      with self.assertRaises(requests.exceptions.ReadTimeout):
+        self.client.get_application("example")
+    self.assertEqual(m.call_count, 1)
+    self.assertEqual(self.sleeps, [])
+    self.assertEqual(self.metrics.summary()["argocd"], {"failures": 1})
+
+  def test_circuit_open_then_half_open(self):
+    with requests_mock.Mocker() as m:
+      down = m.get(f"{MOCK_URL}/applications/example", status_code=502)
+      for _ in range(2):
+        response = self.client.get_application("example")
+        self.assertEqual(response.status_code, 502)
+      self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+      ## Fail fast, the error is handled like any other request error
+      with self.assertRaises(requests.exceptions.RequestException):
+        self.client.get_application("example")
+      self.assertEqual(down.call_count, 6)
+
+      self.now = 30
+      m.get(f"{MOCK_URL}/applications/example", json={})
+      self.assertEqual(self.client.get_application("example").status_code, 200)
+    self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+    summary = self.metrics.summary()["argocd"]
+    self.assertEqual(summary["circuit_opened"], 1)
+    self.assertEqual(summary["short_circuited"], 1)
+    self.assertEqual(summary["failures"], 2)
+
+  def test_half_open_failure_open_again(self):
+    self.breaker.record_failure()
+    self.breaker.record_failure()
+    self.now = 30
+    self.assertTrue(self.breaker.allow())
+    ## Only one trial call while half open
+    self.assertFalse(self.breaker.allow())
+    self.assertTrue(self.breaker.record_failure())
+    self.assertFalse(self.breaker.allow())
+
+  def test_rds_client_retry_throttling(self):
+    rds = mock.MagicMock()
+    rds.stop_db_instance.side_effect = [FakeClientError("Throttling"), {}]
+    rds.get_paginator.return_value.paginate.side_effect = [
+      FakeClientError("InternalError", 500),
+      iter([{"DBInstances": []}]),
+    ]
+    client = aws.ResilientClient(
+      rds, Resilience("rds", sleep=self.sleeps.append)
+    )
+    self.assertEqual(client.stop_db_instance(DBInstanceIdentifier="db"), {})
+    pages = client.get_paginator("describe_db_instances").paginate()
+    self.assertEqual(pages, [{"DBInstances": []}])
+    self.assertEqual(len(self.sleeps), 2)
+
+    error = FakeClientError("InvalidDBInstanceState")
+    rds.start_db_instance.side_effect = error
+    with self.assertRaises(FakeClientError):
+      client.start_db_instance(DBInstanceIdentifier="db")
+    self.assertEqual(rds.start_db_instance.call_count, 1)
+
+  def test_rds_write_not_retried_once_sent(self):
+    class ReadTimeoutError(Exception):
+      pass
+
+    rds = mock.MagicMock()
+    rds.start_db_instance.side_effect = ReadTimeoutError()
+    rds.stop_db_instance.side_effect = FakeClientError("InternalFailure", 500)
+    rds.describe_db_instances.side_effect = [ReadTimeoutError(), {}]
+    client = aws.ResilientClient(
+      rds, Resilience("rds", sleep=self.sleeps.append)
+    )
+    with self.assertRaises(ReadTimeoutError):
+      client.start_db_instance(DBInstanceIdentifier="db")
+    with self.assertRaises(FakeClientError):
+      client.stop_db_instance(DBInstanceIdentifier="db")
+    self.assertEqual(rds.start_db_instance.call_count, 1)
+    self.assertEqual(rds.stop_db_instance.call_count, 1)
+    self.assertEqual(self.sleeps, [])
+    ## A read is still retried
+    self.assertEqual(client.describe_db_instances(), {})
+    self.assertEqual(len(self.sleeps), 1)
+
+  def test_client_error(self):
+    with mock.patch.dict(sys.modules, {"botocore.exceptions": None}):
+      self.assertFalse(issubclass(FakeClientError, aws.client_error()))
+    exceptions = mock.Mock(ClientError=FakeClientError)
+    with mock.patch.dict(sys.modules, {"botocore.exceptions": exceptions}):
+      self.assertIs(aws.client_error(), FakeClientError)
+
+  def test_open_circuit_raise(self):
+    resilience = Resilience("rds", breaker=CircuitBreaker(1, 30))
+    resilience.breaker.record_failure()
+    with self.assertRaises(CircuitOpenError):
+      resilience.call("describe", lambda: None, aws.classify_error)
+
+
+if __name__ == "__main__":
+  unittest.main()
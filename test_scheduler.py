@@ -0,0 +1,58 @@
+## Unit testing for the daemon mode scheduler
+import datetime
+import unittest
+from unittest import mock
+
+import pytz
+
+from autoscaler.scheduler import Scheduler, next_transition
+
+UP = {"hours": 1, "minutes": 0}
+DOWN = {"hours": 13, "minutes": 30}
+
+
+def utc(day, hour, minute=0):
+  return datetime.datetime(2022, 10, day, hour, minute, tzinfo=pytz.utc)
+
+
+class TestScheduler(unittest.TestCase):
+  def test_next_transition(self):
+    self.assertEqual(
+      next_transition(utc(3, 0), UP, DOWN), (utc(3, 1), "morning")
+    )
+    self.assertEqual(
+      next_transition(utc(3, 1), UP, DOWN), (utc(3, 13, 30), "night")
+    )
+    self.assertEqual(
+      next_transition(utc(3, 14), UP, DOWN), (utc(4, 1), "morning")
+    )
+    ## 24:00 is accepted by time.json
+    self.assertEqual(
+      next_transition(utc(3, 14), {"hours": 24, "minutes": 0}, DOWN),
+      (utc(4, 0), "morning"),
+    )
+
+  def test_interval_wakeup(self):
+    autoscaler = mock.MagicMock(time_scale_up=UP, time_scale_down=DOWN)
+    scheduler = Scheduler(autoscaler, interval=600, now=lambda: utc(3, 2))
+    self.assertEqual(scheduler.next_wakeup(), (utc(3, 2, 10), None))
+    scheduler.now = lambda: utc(3, 13, 25)
+    self.assertEqual(scheduler.next_wakeup(), (utc(3, 13, 30), "night"))
+
+  def test_run_forever_keeps_running_after_failure(self):
+    autoscaler = mock.MagicMock(time_scale_up=UP, time_scale_down=DOWN)
+    autoscaler.run.side_effect = Exception("argocd is down")
+    clock = iter([utc(3, 0, 59), utc(3, 0, 59), utc(3, 1), utc(3, 1)])
+    scheduler = Scheduler(autoscaler, now=lambda: next(clock))
+    scheduler.stop.wait = mock.MagicMock(side_effect=[False, True])
+
+    scheduler.run_forever()
+
+    autoscaler.run.assert_called_once_with()
+    autoscaler.reconcile.assert_called_once_with("morning")
+    self.assertEqual(autoscaler.slack.flush.call_count, 2)
+    self.assertEqual(scheduler.stop.wait.call_args_list[0], mock.call(60.0))
+
+
+if __name__ == "__main__":
+  unittest.main()
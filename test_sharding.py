@@ -0,0 +1,91 @@
+## Unit testing for sharding the fleet between replicas
+import os
+import unittest
+from unittest import mock
+
+from autoscaler.sharding import HashRing, Shard
+from fixtures import ENVIRON, AutoScalerTestCase, server, write_yaml
+
+
+class TestSharding(unittest.TestCase):
+  def setUp(self):
+    self.names = [f"staging-{i}.example.com" for i in range(2000)]
+
+  def test_every_app_in_one_balanced_shard(self):
+    shards = [Shard(i, 4) for i in range(4)]
+    owners = [[s.index for s in shards if s.owns(x)] for x in self.names]
+    self.assertTrue(all(len(owner) == 1 for owner in owners))
+    for shard in shards:
+      share = sum(owner == [shard.index] for owner in owners) / 2000
+      self.assertTrue(0.15 < share < 0.35, share)
+
+  def test_adding_a_shard_only_move_apps_to_it(self):
+    before, after = HashRing(4), HashRing(5)
+    moved = [x for x in self.names if before.shard_of(x) != after.shard_of(x)]
+    self.assertTrue(all(after.shard_of(x) == 4 for x in moved))
+    self.assertLess(len(moved) / 2000, 0.3)
+
+  def test_invalid_shard(self):
+    for index, count in ((2, 2), (-1, 2), (0, 0)):
+      with self.assertRaises(ValueError):
+        Shard(index, count)
+    config = {"server": [{"name": "shop"}]}
+    self.assertIs(Shard().filter_config(config), config)
+
+
+class TestShardedConfig(AutoScalerTestCase):
+  def build_config(self):
+    return {
+      "server": [server(f"app-{i}") for i in range(50)],
+      "database": [server(f"db-{i}") for i in range(20)],
+    }
+
+  def create_autoscaler(self, **environ):
+    with mock.patch.dict(os.environ, dict(ENVIRON, **environ)):
+      return super().create_autoscaler()
+
+  def test_shards_split_the_config(self):
+    configs = [
+      self.create_autoscaler(SHARD_COUNT="3", SHARD_INDEX=str(i)).config
+      for i in range(3)
+    ]
+    for section in ("server", "database"):
+      names = [x["name"] for config in configs for x in config[section]]
+      self.assertEqual(
+        sorted(names), sorted(x["name"] for x in self.config[section])
+      )
+      self.assertTrue(all(config[section] for config in configs))
+
+  def test_job_completion_index(self):
+    autoscaler = self.create_autoscaler(
+      SHARD_COUNT="3", JOB_COMPLETION_INDEX="2"
+    )
+    self.assertEqual(autoscaler.shard.index, 2)
+    with self.assertRaises(ValueError):
+      self.create_autoscaler(SHARD_COUNT="3", SHARD_INDEX="3")
+
+  def test_invalid_shard_env(self):
+    for environ in (
+      {"SHARD_COUNT": "two"},
+      {"SHARD_COUNT": "0"},
+      {"SHARD_COUNT": "3", "SHARD_INDEX": "-1"},
+      {"SHARD_COUNT": "3", "SHARD_INDEX": "first"},
+      {"SHARD_COUNT": "3", "JOB_COMPLETION_INDEX": "3"},
+    ):
+      with self.subTest(**environ), self.assertRaises(ValueError):
+        self.create_autoscaler(**environ)
+
+  def test_reload_keep_the_shard(self):
+    autoscaler = self.create_autoscaler(SHARD_COUNT="2", SHARD_INDEX="1")
+    owned = {x["name"] for x in autoscaler.config["server"]}
+    self.config["server"].append(server("app-new", autoscaledown=False))
+    write_yaml(self.config_name, self.config)
+    config = autoscaler._load_config()
+    names = {x["name"] for x in config["server"]}
+    ## Apps already in the shard stay, a new app only join its own shard
+    self.assertEqual(names - {"app-new"}, owned)
+    self.assertEqual("app-new" in names, autoscaler.shard.owns("app-new"))
+
+
+if __name__ == "__main__":
+  unittest.main()
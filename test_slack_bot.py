@@ -0,0 +1,176 @@
+## Unit testing for the slack digest
+import json
+import os
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs
+
+import requests_mock
+
+from autoscaler.slack_bot import SlackBot
+from autoscaler.slackbot_enum import SCALINGTYPE
+
+SLACK_URL = "https://slack.com/api/chat.postMessage"
+
+
+class TestSlackBot(unittest.TestCase):
+  def setUp(self):
+    self.slack = SlackBot({"slack": {"token": "xoxb-test"}})
+    self.slack.rate = 1000
+
+  def test_single_digest_grouped_by_type(self):
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      self.slack.post_warn_message_to_slack(
+        SCALINGTYPE.DATABASE.value, "shop", "not found"
+      )
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.SERVER.value, "shop", "403"
+      )
+      self.slack.post_warn_message_to_slack(
+        SCALINGTYPE.DATABASE.value, "blog", "not found"
+      )
+      self.assertEqual(post.call_count, 0)
+      self.assertTrue(self.slack.flush())
+      ## Nothing left to post
+      self.assertTrue(self.slack.flush())
+
+    self.assertEqual(post.call_count, 1)
+    body = parse_qs(post.last_request.text)
+    attachments = json.loads(body["attachments"][0])
+    self.assertEqual(len(attachments), 2)
+    self.assertIn("ERROR", attachments[0]["title"])
+    self.assertEqual(
+      attachments[1]["title"], "WARN: Database scaling skipped for: shop, blog"
+    )
+    self.assertEqual(attachments[1]["text"].count("not found"), 2)
+
+  def test_retry_after_rate_limit(self):
+    sleeps = []
+    self.slack._sleep = sleeps.append
+    with requests_mock.Mocker() as m:
+      post = m.post(
+        SLACK_URL,
+        [
+          {"status_code": 429, "headers": {"Retry-After": "7"}},
+          {"json": {"ok": False, "error": "ratelimited"}},
+          {"json": {"ok": True}},
+        ],
+      )
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.SERVER.value, "shop", "403"
+      )
+      self.assertTrue(self.slack.flush())
+
+    self.assertEqual(post.call_count, 3)
+    self.assertEqual(sleeps[0], 7)
+
+  def test_give_up_on_slack_error(self):
+    self.slack._sleep = lambda x: None
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": False, "error": "invalid_auth"})
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.SERVER.value, "shop", "403"
+      )
+      self.assertTrue(self.slack.flush())
+
+    self.assertEqual(post.call_count, 1)
+
+  @mock.patch.dict(os.environ, {"SLACKQUEUESIZE": "5000"})
+  def test_large_digest_is_split(self):
+    ## Queue large enough that nothing is dropped
+    self.slack = SlackBot({"slack": {"token": "xoxb-test"}})
+    self.slack.rate = 1000
+    self.slack._sleep = lambda x: None
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      for i in range(2000):
+        self.slack.post_warn_message_to_slack(
+          SCALINGTYPE.DATABASE.value, f"app-{i}", "not found"
+        )
+      self.assertTrue(self.slack.flush())
+
+    ## 2000 lines, 50 lines per attachment, 20 attachments per message
+    self.assertEqual(post.call_count, 2)
+
+  @mock.patch.dict(os.environ, {"SLACKQUEUESIZE": "5"})
+  def test_buffer_is_bounded(self):
+    self.slack = SlackBot({"slack": {"token": "xoxb-test"}})
+    self.slack.rate = 1000
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      for i in range(12):
+        self.slack.post_warn_message_to_slack(
+          SCALINGTYPE.DATABASE.value, f"app-{i}", "not found"
+        )
+      self.assertTrue(self.slack.flush())
+
+    attachments = json.loads(parse_qs(post.last_request.text)["attachments"][0])
+    self.assertEqual(attachments[0]["text"].count("not found"), 5)
+    self.assertEqual(
+      attachments[1]["title"], "WARN: 7 notification(s) dropped, queue was full"
+    )
+
+  def test_unknown_type_keep_the_digest(self):
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      self.slack.post_warn_message_to_slack("autosync", "shop", "paused")
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.SERVER.value, "blog", "403"
+      )
+      self.assertTrue(self.slack.flush(timeout=5))
+
+    attachments = json.loads(parse_qs(post.last_request.text)["attachments"][0])
+    self.assertEqual(
+      [x["title"] for x in attachments],
+      [
+        "ERROR: Pod scaling failed for: blog",
+        "WARN: autosync skipped for: shop",
+      ],
+    )
+
+  def test_invalid_rate_and_queue_size(self):
+    for rate, size in (("0", "0"), ("-1", "-5"), ("fast", "big")):
+      environ = {"SLACKRATE": rate, "SLACKQUEUESIZE": size}
+      with self.subTest(**environ), mock.patch.dict(os.environ, environ):
+        slack = SlackBot({"slack": {"token": "xoxb-test"}})
+        self.assertEqual((slack.rate, slack.queue_size), (1.0, 1000))
+        slack.close()
+
+  def test_failed_digest_keep_the_sender(self):
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      with mock.patch.object(
+        self.slack, "get_digest_message", side_effect=ValueError("bad")
+      ):
+        self.slack.post_fail_message_to_slack(
+          SCALINGTYPE.SERVER.value, "shop", "403"
+        )
+        self.assertTrue(self.slack.flush(timeout=5))
+      self.slack.post_fail_message_to_slack(
+        SCALINGTYPE.SERVER.value, "blog", "403"
+      )
+      self.assertTrue(self.slack.flush(timeout=5))
+
+    self.assertEqual(post.call_count, 1)
+    self.assertIn("blog", post.last_request.text)
+
+  def test_digest_time(self):
+    with requests_mock.Mocker() as m:
+      post = m.post(SLACK_URL, json={"ok": True})
+      for now in (1000, 2000):
+        with mock.patch("autoscaler.slack_bot.time.time", return_value=now):
+          self.slack.post_fail_message_to_slack(
+            SCALINGTYPE.SERVER.value, "shop", "403"
+          )
+          self.assertTrue(self.slack.flush())
+
+    stamps = [
+      json.loads(parse_qs(r.text)["attachments"][0])[0]["ts"]
+      for r in post.request_history
+    ]
+    self.assertEqual(stamps, [1000, 2000])
+
+
+if __name__ == "__main__":
+  unittest.main()
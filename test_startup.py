@@ -0,0 +1,85 @@
+## Startup time budget for the autoscaler Job
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler import AutoScaler, schema
+from fixtures import AWS_SECRET, MOCK_URL, AutoScalerTestCase, server
+
+# Seconds allowed before the first api call
+IMPORT_BUDGET = 1.0
+STARTUP_BUDGET = 0.5
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import autoscaler
+print(time.perf_counter() - start)
+print("boto3" in sys.modules or "botocore" in sys.modules)
+"""
+
+
+class TestStartup(AutoScalerTestCase):
+  secret = AWS_SECRET
+
+  def build_config(self):
+    return {"server": [server(f"app-{i}") for i in range(500)]}
+
+  def test_import_budget(self):
+    result = subprocess.run(
+      [sys.executable, "-c", IMPORT_SCRIPT],
+      capture_output=True,
+      check=True,
+      text=True,
+    )
+    elapsed, boto3_imported = result.stdout.split()
+    self.assertLess(float(elapsed), IMPORT_BUDGET)
+    self.assertEqual(boto3_imported, "False")
+
+  @mock.patch.dict(
+    os.environ, {"URL": MOCK_URL, "LOGLEVEL": "ERROR", "STATUS": "night"}
+  )
+  def test_no_network_before_first_use(self):
+    ## Any http call would fail as no url is registered in the mocker
+    with requests_mock.Mocker() as m:
+      start = time.perf_counter()
+      autoscaler = AutoScaler(
+        config_name=self.config_name, secret_name=self.secret_name
+      )
+      elapsed = time.perf_counter() - start
+      self.assertEqual(m.call_count, 0)
+    self.assertLess(elapsed, STARTUP_BUDGET)
+    self.assertTrue(autoscaler.database_enabled)
+    self.assertFalse(autoscaler._aws_initialised)
+
+  @mock.patch.dict(os.environ, {"URL": MOCK_URL, "LOGLEVEL": "ERROR"})
+  def test_schema_validated_once(self):
+    with open(self.config_name, "a", encoding="utf-8") as f:
+      f.write("# validated once\n")
+    with mock.patch.object(
+      schema.AutoscalerValidator, "validate", autospec=True
+    ) as validate:
+      validate.return_value = True
+      AutoScaler(config_name=self.config_name, secret_name=self.secret_name)
+      calls = validate.call_count
+      self.assertGreater(calls, 0)
+      AutoScaler(config_name=self.config_name, secret_name=self.secret_name)
+      ## Unchanged config and secret are not validated again
+      self.assertEqual(validate.call_count, calls)
+    self.assertIs(
+      schema.get_validator("config"), schema.get_validator("config")
+    )
+
+  def test_schema_errors(self):
+    content = "server:\n  - name: app\n"
+    errors = schema.validate("config", schema.load_yaml(content), content)
+    self.assertIn("server", errors)
+
+
+if __name__ == "__main__":
+  unittest.main()
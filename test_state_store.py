@@ -0,0 +1,146 @@
+## Unit testing for the last applied state store
+import os
+import unittest
+from unittest import mock
+
+import requests_mock
+
+from autoscaler.autoscaler_enum import SYNC
+from autoscaler.plan import Plan
+from autoscaler.state_store import DEPLOYMENT, StateStore
+from fixtures import (
+  AWS_SECRET,
+  ENVIRON,
+  MOCK_URL,
+  AutoScalerTestCase,
+  db_instance,
+  deployment,
+  managed_resource,
+)
+
+
+class TestStateStore(AutoScalerTestCase):
+  secret = AWS_SECRET
+
+  def setUp(self):
+    super().setUp()
+    self.path = os.path.join(self.tmp.name, "state", "state.db")
+    self.now = 1000.0
+    self.environ = dict(
+      ENVIRON,
+      STATE_STORE=self.path,
+      STATE_TTL="3600",
+      FULL_RECONCILE_INTERVAL="86400",
+    )
+
+  def test_record_expire_after_ttl(self):
+    store = StateStore(self.path, 60, clock=lambda: self.now)
+    store.put(DEPLOYMENT, "example/staging/web", 0)
+    self.assertEqual(store.get(DEPLOYMENT, "example/staging/web"), 0)
+    self.now += 60
+    self.assertIsNone(store.get(DEPLOYMENT, "example/staging/web"))
+
+  def test_disabled_store(self):
+    store = StateStore(self.path, 0)
+    store.put(DEPLOYMENT, "example/staging/web", 0)
+    self.assertIsNone(store.get(DEPLOYMENT, "example/staging/web"))
+    self.assertFalse(os.path.exists(self.path))
+
+  def test_full_reconcile_interval(self):
+    store = StateStore(self.path, 60, 600, clock=lambda: self.now)
+    self.assertTrue(store.needs_full_reconcile())
+    store.mark_full_reconcile()
+    store.commit()
+    self.now += 599
+    self.assertFalse(store.needs_full_reconcile())
+    self.now += 1
+    self.assertTrue(store.needs_full_reconcile())
+
+  def create_autoscaler(self):
+    ## A fresh rds client per run
+    self.rds = mock.MagicMock()
+    self.set_db_instances([db_instance("example")])
+    autoscaler = super().create_autoscaler()
+    autoscaler.state_store.clock = lambda: self.now
+    return autoscaler, self.rds
+
+  def mock_argocd(self, m):
+    m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+    application = {
+      "spec": {"syncPolicy": {"automated": {}}},
+      "status": {"resources": [deployment("web"), deployment("api")]},
+    }
+    items = [managed_resource(name, 2) for name in ("web", "api")]
+    m.get(f"{MOCK_URL}/applications/example", json=application)
+    m.put(f"{MOCK_URL}/applications/example", json={})
+    m.get(
+      f"{MOCK_URL}/applications/example/managed-resources",
+      json={"items": items},
+    )
+    m.post(f"{MOCK_URL}/applications/example/resource", json={})
+
+  def test_settled_targets_are_not_read_again(self):
+    with mock.patch.dict(os.environ, self.environ):
+      autoscaler, rds = self.create_autoscaler()
+      with requests_mock.Mocker() as m:
+        self.mock_argocd(m)
+        autoscaler.run()
+        methods = sorted(r.method for r in m.request_history)
+      ## The app is read again right before its autosync is updated
+      self.assertEqual(
+        methods, ["GET", "GET", "GET", "POST", "POST", "POST", "PUT"]
+      )
+      rds.stop_db_instance.assert_called_once_with(
+        DBInstanceIdentifier="example"
+      )
+
+      ## Next run, e.g. the next cron job, within STATE_TTL
+      self.now += 60
+      autoscaler, rds = self.create_autoscaler()
+      with requests_mock.Mocker() as m:
+        self.mock_argocd(m)
+        plan = autoscaler.run()
+        self.assertEqual(m.call_count, 0)
+      self.assertEqual(len(plan), 0)
+      rds.get_paginator.assert_not_called()
+
+      ## Every target is read live once the full reconcile is due
+      self.now += 86400
+      autoscaler, rds = self.create_autoscaler()
+      with requests_mock.Mocker() as m:
+        self.mock_argocd(m)
+        autoscaler.run()
+        paths = {r.path for r in m.request_history if r.method == "GET"}
+      self.assertIn("/applications/example", paths)
+      self.assertIn("/applications/example/managed-resources", paths)
+      rds.get_paginator.assert_called_once_with("describe_db_instances")
+
+  def test_settled_status_is_never_written(self):
+    with mock.patch.dict(os.environ, dict(self.environ, STATUS="morning")):
+      autoscaler, _ = self.create_autoscaler()
+    live = {
+      "metadata": {"name": "example"},
+      "spec": {"source": {"path": "example"}, "syncPolicy": {}},
+      "status": {"resources": [deployment("web")]},
+    }
+    ## What _get_settled_application_status rebuild from the store
+    autoscaler.config["server"][0]["application_status"] = {
+      "spec": {"syncPolicy": {}},
+      "status": {"resources": [deployment("web")]},
+    }
+    autoscaler._application_status_loaded = True
+    plan = Plan("morning", "Monday")
+    plan.add_autosync("example", SYNC.ENABLED.value)
+    with requests_mock.Mocker() as m:
+      m.post(f"{MOCK_URL}/session", json={"token": "helloworld"})
+      m.get(f"{MOCK_URL}/applications/example", json=live)
+      put = m.put(f"{MOCK_URL}/applications/example", json={})
+      autoscaler.apply_plan(plan)
+    body = put.last_request.json()
+    self.assertEqual(body["metadata"], live["metadata"])
+    self.assertEqual(body["spec"]["source"], live["spec"]["source"])
+    self.assertIn("automated", body["spec"]["syncPolicy"])
+
+
+if __name__ == "__main__":
+  unittest.main()